@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class IdenfybookappConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "BooksApp"
+
+    def ready(self):
+        from BooksApp import signals  # noqa: F401
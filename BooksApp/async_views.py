@@ -0,0 +1,143 @@
+from asgiref.sync import sync_to_async
+from django.http import Http404, HttpRequest
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from BooksApp.cache import aget_cached_list, aset_cached_list
+from BooksApp.helpers import avalidate_book
+from BooksApp.models import Book
+from BooksApp.serializers import BookSerializer, serialize_book_rows
+from BooksApp.views import BookViewSet
+from BooksProject.metrics import timed
+
+
+class AsyncBookView(View):
+    """
+    Async counterparts of BookViewSet actions, for deployments served through BooksProject.asgi, where sync views
+    each hold a thread for the whole request. Requests are authenticated, authorized, throttled, filtered and
+    paginated with BookViewSet's own configuration, but database and cache access is awaited, so a worker keeps
+    serving other requests while one waits.
+
+    Authentication classes and permissions provide async variants (`aauthenticate`, `ahas_permission`,
+    `ahas_object_permission`); sync authentication classes run in a thread, and permissions without async variants
+    are called directly, so they must not touch the database (e.g. IsAuthenticated).
+    """
+    actions: dict[str, str] = {}
+    # Methods are routed to actions by dispatch() rather than through get()/post() handlers
+    view_is_async = True
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # Like APIView.as_view(): token requests carry no CSRF token, and SessionAuthentication enforces CSRF itself
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request: HttpRequest, *args, **kwargs):
+        method = request.method.lower()
+        if method not in self.actions:
+            return await self.http_method_not_allowed(request, *args, **kwargs)
+        viewset = BookViewSet(action_map={method: self.actions[method]}, renderer_classes=[JSONRenderer])
+        viewset.args, viewset.kwargs = args, kwargs
+        request = viewset.initialize_request(request, *args, **kwargs)
+        viewset.request = request
+        viewset.headers = viewset.default_response_headers
+        try:
+            await self.initial(viewset, request)
+            response = await getattr(self, viewset.action)(viewset, request, *args, **kwargs)
+        except Exception as exc:
+            response = viewset.handle_exception(exc)
+        return viewset.finalize_response(request, response, *args, **kwargs)
+
+    async def initial(self, viewset: BookViewSet, request: Request) -> None:
+        """Async `APIView.initial()`."""
+        viewset.format_kwarg = viewset.get_format_suffix(**viewset.kwargs)
+        request.accepted_renderer, request.accepted_media_type = viewset.perform_content_negotiation(request)
+        await self.authenticate(request)
+        with timed("permissions"):
+            for permission in viewset.get_permissions():
+                if hasattr(permission, "ahas_permission"):
+                    allowed = await permission.ahas_permission(request, viewset)
+                else:
+                    allowed = permission.has_permission(request, viewset)
+                if not allowed:
+                    viewset.permission_denied(
+                        request, message=getattr(permission, "message", None), code=getattr(permission, "code", None)
+                    )
+        durations = []
+        for throttle in viewset.get_throttles():
+            if not await sync_to_async(throttle.allow_request)(request, viewset):
+                # SharedScopedRateThrottle reads its counter from the database
+                durations.append(await sync_to_async(throttle.wait)())
+        if durations:
+            waits = [duration for duration in durations if duration is not None]
+            viewset.throttled(request, max(waits, default=None))
+
+    @staticmethod
+    async def authenticate(request: Request) -> None:
+        """Async `Request._authenticate()`."""
+        for authenticator in request.authenticators:
+            try:
+                if hasattr(authenticator, "aauthenticate"):
+                    user_auth_tuple = await authenticator.aauthenticate(request)
+                else:
+                    user_auth_tuple = await sync_to_async(authenticator.authenticate)(request)
+            except APIException:
+                request._not_authenticated()
+                raise
+            if user_auth_tuple is not None:
+                request._authenticator = authenticator
+                request.user, request.auth = user_auth_tuple
+                return
+        request._not_authenticated()
+
+    @staticmethod
+    async def check_object_permissions(viewset: BookViewSet, request: Request, obj: Book) -> None:
+        with timed("permissions"):
+            for permission in viewset.get_permissions():
+                if hasattr(permission, "ahas_object_permission"):
+                    allowed = await permission.ahas_object_permission(request, viewset, obj)
+                else:
+                    allowed = permission.has_object_permission(request, viewset, obj)
+                if not allowed:
+                    viewset.permission_denied(
+                        request, message=getattr(permission, "message", None), code=getattr(permission, "code", None)
+                    )
+
+
+class AsyncBookListView(AsyncBookView):
+    actions = {"get": "list", "post": "create"}
+
+    async def list(self, viewset: BookViewSet, request: Request) -> Response:
+        data = await aget_cached_list(request)
+        if data is not None:
+            return Response(data)
+        rows = viewset.get_list_rows()
+        page = await viewset.paginator.apaginate_queryset(rows, request, viewset)
+        with timed("serializer"):
+            data = serialize_book_rows([row async for row in rows] if page is None else page)
+        response = Response(data) if page is None else viewset.get_paginated_response(data)
+        await aset_cached_list(request, response.data)
+        return response
+
+    async def create(self, viewset: BookViewSet, request: Request) -> Response:
+        row = await avalidate_book(request.data)
+        await Book.objects.acreate(**row)
+        return Response(data=[], status=status.HTTP_201_CREATED)
+
+
+class AsyncBookDetailView(AsyncBookView):
+    actions = {"get": "retrieve"}
+
+    async def retrieve(self, viewset: BookViewSet, request: Request, pk: int) -> Response:
+        try:
+            book = await viewset.filter_queryset(viewset.get_queryset()).aget(pk=pk)
+        except Book.DoesNotExist:
+            raise Http404
+        await self.check_object_permissions(viewset, request, book)
+        with timed("serializer"):
+            data = BookSerializer(book).data
+        return Response(data)
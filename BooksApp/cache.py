@@ -0,0 +1,93 @@
+import hashlib
+import time
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.request import Request
+
+from BooksProject.db_router import replica_reads_may_lag
+
+# Every user allowed to list books sees the same books, so all of them share one scope
+ALL_BOOKS_SCOPE = "all"
+
+def _version_key(scope: str) -> str:
+    return f"books:list-version:{scope}"
+
+
+def _new_version() -> str:
+    # Records when the lists changed, see `_may_cache()`
+    return f"{uuid4().hex}-{time.time()}"
+
+
+def _may_cache(version: str) -> bool:
+    """
+    Whether lists read now may be cached under `version`: not from replicas that may still miss the change that
+    started it, as the entry would then be served to every client until the next change.
+    """
+    try:
+        changed_at = float(version.rpartition("-")[2])
+    except ValueError:
+        changed_at = 0.0
+    return not replica_reads_may_lag(changed_at)
+
+
+def get_list_version(scope: str) -> str:
+    key = _version_key(scope)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _new_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+async def aget_list_version(scope: str) -> str:
+    key = _version_key(scope)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, _new_version(), timeout=None)
+        version = await cache.aget(key)
+    return version
+
+
+def _list_cache_key(request: Request, scope: str, version: str) -> str:
+    """
+    Builds the cache key of a list response from the scope's current version, the host and path (which appear in the
+    pagination links) and the query parameters, sorted and without empty values so equivalent URLs share an entry.
+    """
+    params = sorted(
+        (name, value) for name, values in request.query_params.lists() for value in values if value != ""
+    )
+    digest = hashlib.blake2b(repr((request.get_host(), request.path, params)).encode(), digest_size=16).hexdigest()
+    return f"books:list:{scope}:{version}:{digest}"
+
+
+def get_cached_list(request: Request, scope: str = ALL_BOOKS_SCOPE):
+    """Returns the cached data of the list response for this request, or None."""
+    return cache.get(_list_cache_key(request, scope, get_list_version(scope)))
+
+
+def set_cached_list(request: Request, data, scope: str = ALL_BOOKS_SCOPE) -> None:
+    version = get_list_version(scope)
+    if _may_cache(version):
+        cache.set(_list_cache_key(request, scope, version), data, settings.BOOKS_LIST_CACHE_TIMEOUT)
+
+
+async def aget_cached_list(request: Request, scope: str = ALL_BOOKS_SCOPE):
+    return await cache.aget(_list_cache_key(request, scope, await aget_list_version(scope)))
+
+
+async def aset_cached_list(request: Request, data, scope: str = ALL_BOOKS_SCOPE) -> None:
+    version = await aget_list_version(scope)
+    if _may_cache(version):
+        await cache.aset(_list_cache_key(request, scope, version), data, settings.BOOKS_LIST_CACHE_TIMEOUT)
+
+
+def invalidate_book_lists(scope: str = ALL_BOOKS_SCOPE) -> None:
+    """
+    Moves the scope to a new version once the current transaction commits, so cached lists are never served after a
+    change. Bumping on commit, rather than right away, keeps a concurrent request from caching the old rows under
+    the new version.
+    """
+    transaction.on_commit(lambda: cache.set(_version_key(scope), _new_version(), timeout=None))
@@ -1,20 +1,291 @@
+import base64
+import binascii
+import json
+from collections import OrderedDict
+from functools import reduce
+from operator import or_
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.core.exceptions import FieldDoesNotExist
+from django.core.paginator import InvalidPage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import F, Q, QuerySet
+from django.db.models.functions import ExtractYear
 from django_filters import rest_framework as filters
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
-from BooksApp.models import Book
+from BooksApp.models import Book, SEARCH_CONFIG, book_search_vector
 
 
 class BookFilter(filters.FilterSet):
     title = filters.CharFilter(field_name="title", lookup_expr="icontains")
     date_from = filters.DateFilter(field_name="publication_date", lookup_expr="gte")
     date_to = filters.DateFilter(field_name="publication_date", lookup_expr="lte")
+    q = filters.CharFilter(method="search", label="Search in title and author")
 
     class Meta:
         model = Book
         fields = ["title", "publication_date"]
 
+    def search(self, queryset: QuerySet, name: str, value: str) -> QuerySet:
+        """
+        Full-text search over title and author, ranked by relevance. Word matches are served by the tsvector GIN
+        index and partial words ("tolk") by the trigram GIN indexes, so neither scans the table. Equal ranks are
+        ordered by id, so that pages neither repeat nor skip books.
+        """
+        value = value.strip()
+        if not value:
+            return queryset
+        substring = Q(title__icontains=value) | Q(author__icontains=value)
+        if connections[queryset.db].vendor != "postgresql":
+            return queryset.filter(substring)
+        vector = book_search_vector()
+        query = SearchQuery(value, config=SEARCH_CONFIG, search_type="websearch")
+        return queryset.annotate(search=vector, rank=SearchRank(vector, query)).filter(
+            Q(search=query) | substring
+        ).order_by("-rank", "-pk")
+
+
+def count_book_facets(queryset: QuerySet, authors_limit: int) -> dict:
+    """
+    Counts the books of `queryset` by author and by publication year, and in total, with a single query: GROUPING
+    SETS on PostgreSQL, UNION ALL over a common table expression elsewhere. Only the `authors_limit` most frequent
+    authors are returned; every year is, newest first, with books without a publication date under None.
+    """
+    books = queryset.order_by().annotate(facet_year=ExtractYear("publication_date")).values("author", "facet_year")
+    books_sql, params = books.query.get_compiler(using=queryset.db).as_sql()
+    connection = connections[queryset.db]
+    if connection.vendor == "postgresql":
+        counts = (
+            "SELECT GROUPING(author, facet_year) AS facet, author, facet_year, COUNT(*) AS count FROM books "
+            "GROUP BY GROUPING SETS ((author), (facet_year), ())"
+        )
+    else:
+        # The same facet numbers as GROUPING(): 1 for authors, 2 for years, 3 for the total
+        counts = (
+            "SELECT 1 AS facet, author, NULL AS facet_year, COUNT(*) AS count FROM books GROUP BY author "
+            "UNION ALL SELECT 2, NULL, facet_year, COUNT(*) FROM books GROUP BY facet_year "
+            "UNION ALL SELECT 3, NULL, NULL, COUNT(*) FROM books"
+        )
+    sql = (
+        f"WITH books AS ({books_sql}) "
+        f"SELECT facet, author, facet_year, count FROM ("
+        f"SELECT counts.*, ROW_NUMBER() OVER (PARTITION BY facet ORDER BY count DESC, author) AS position "
+        f"FROM ({counts}) counts) ranked "
+        f"WHERE facet <> 1 OR position <= %s"
+    )
+    facets = {"count": 0, "authors": [], "years": []}
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [*params, authors_limit])
+        rows = cursor.fetchall()
+    for facet, author, year, count in sorted(rows, key=lambda row: (row[0], -row[3], row[1] or "")):
+        if facet == 1:
+            facets["authors"].append({"author": author, "count": count})
+        elif facet == 2:
+            facets["years"].append({"year": year, "count": count})
+        else:
+            facets["count"] = count
+    facets["years"].sort(key=lambda row: (row["year"] is not None, row["year"] or 0), reverse=True)
+    return facets
+
 
 class CustomPageNumberPagination(PageNumberPagination):
     page_query_param = "page_number"
     page_size_query_param = "items_per_page"
+    max_page_size = 1000
+
+    async def apaginate_queryset(self, queryset: QuerySet, request: Request, view=None) -> list | None:
+        """Async `paginate_queryset()`: the count and the rows of the page are read with the async ORM."""
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        paginator = self.django_paginator_class(queryset, page_size)
+        # Paginator.count is a cached property; setting it keeps the paginator from counting synchronously
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message=str(exc)))
+        self.page.object_list = [row async for row in self.page.object_list]
+        self.request = request
+        return list(self.page)
+
+
+class BookCursorPagination(BasePagination):
+    """
+    Keyset (cursor) pagination. Instead of COUNT(*) and OFFSET, every page seeks past the last row of the previous
+    one, so a page costs the same at any depth. The ordering comes from OrderingFilter or the model Meta ordering,
+    with the primary key appended as a tiebreaker so that every position is unique.
+
+    NULLs are treated as the largest value (PostgreSQL's default), so "-publication_date" is served straight from a
+    descending index. Cursors are opaque and only valid for the ordering they were issued for.
+    """
+    cursor_query_param = "cursor"
+    mode_query_param = "pagination"
+    mode_query_value = "cursor"
+    page_size_query_param = "items_per_page"
+    page_size = 100
+    max_page_size = 1000
+    invalid_cursor_message = "Invalid cursor"
+
+    @classmethod
+    def is_requested(cls, request: Request) -> bool:
+        params = request.query_params
+        return cls.cursor_query_param in params or params.get(cls.mode_query_param) == cls.mode_query_value
+
+    def paginate_queryset(self, queryset: QuerySet, request: Request, view=None) -> list:
+        return self.get_page(list(self.get_page_queryset(queryset, request)))
+
+    async def apaginate_queryset(self, queryset: QuerySet, request: Request, view=None) -> list:
+        return self.get_page([row async for row in self.get_page_queryset(queryset, request)])
+
+    def get_page_queryset(self, queryset: QuerySet, request: Request) -> QuerySet:
+        """Returns the ordered, seeked and sliced queryset of the requested page (one extra row to detect more)."""
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset)
+        cursor = self.decode_cursor(request)
+        self.cursor_values = cursor["v"] if cursor else None
+        self.reverse = bool(cursor and cursor["r"])
+
+        # Walking backwards is the same seek over the reversed ordering; the page is flipped back in get_page().
+        terms = [(name, descending != self.reverse) for name, descending in self.ordering]
+        queryset = queryset.order_by(*[self._order_by(queryset, name, descending) for name, descending in terms])
+        if self.cursor_values is not None:
+            queryset = queryset.filter(self._seek(terms, self.cursor_values))
+        return queryset[:self.page_size + 1]
+
+    def get_page(self, rows: list) -> list:
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if self.reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = bool(rows), has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.cursor_values is not None and bool(rows)
+        self.page = rows
+        return rows
+
+    def get_paginated_response(self, data) -> Response:
+        return Response(OrderedDict([
+            ("next", self.get_next_link()),
+            ("previous", self.get_previous_link()),
+            ("results", data),
+        ]))
+
+    def get_paginated_response_schema(self, schema: dict) -> dict:
+        return {
+            "type": "object",
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    def get_next_link(self) -> str | None:
+        if not self.has_next:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self) -> str | None:
+        if not self.has_previous:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_page_size(self, request: Request) -> int:
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_ordering(self, queryset: QuerySet) -> list[tuple[str, bool]]:
+        """Returns the (field name, descending) terms of the queryset ordering, ending with the primary key."""
+        pk_name = queryset.model._meta.pk.name
+        ordering = []
+        for term in queryset.query.order_by or queryset.model._meta.ordering:
+            if not isinstance(term, str) or "__" in term or term.lstrip("-") == "?":
+                raise NotFound("Cursor pagination supports ordering by plain field names only")
+            name = term.lstrip("-")
+            ordering.append((pk_name if name == "pk" else name, term.startswith("-")))
+        if pk_name not in [name for name, _ in ordering]:
+            ordering.append((pk_name, ordering[0][1] if ordering else False))
+        return ordering
+
+    def encode_cursor(self, row, reverse: bool) -> str:
+        payload = {
+            "o": [f"-{name}" if descending else name for name, descending in self.ordering],
+            "v": [self._get_value(row, name) for name, _ in self.ordering],
+            "r": reverse,
+        }
+        encoded = base64.urlsafe_b64encode(json.dumps(payload, cls=DjangoJSONEncoder).encode()).decode()
+        url = remove_query_param(self.base_url, self.mode_query_param)
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def decode_cursor(self, request: Request) -> dict | None:
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            ordering = [f"-{name}" if descending else name for name, descending in self.ordering]
+            if payload["o"] != ordering or len(payload["v"]) != len(ordering):
+                raise ValueError
+            return {"v": payload["v"], "r": bool(payload["r"])}
+        except (TypeError, ValueError, KeyError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+
+    @staticmethod
+    def _get_value(row, name: str):
+        if isinstance(row, dict):
+            return row[name]
+        try:
+            return getattr(row, row._meta.get_field(name).attname)
+        except FieldDoesNotExist:
+            # Annotations, e.g. a search rank
+            return getattr(row, name)
+
+    @staticmethod
+    def _order_by(queryset: QuerySet, name: str, descending: bool):
+        try:
+            nullable = queryset.model._meta.get_field(name).null
+        except FieldDoesNotExist:
+            nullable = True
+        if not nullable:
+            return f"-{name}" if descending else name
+        return F(name).desc(nulls_first=True) if descending else F(name).asc(nulls_last=True)
+
+    @staticmethod
+    def _after(name: str, descending: bool, value, or_equal: bool = False) -> Q:
+        """Rows strictly after (or at) `value` in the given direction, NULL being the largest value."""
+        if value is None:
+            after = Q(**{f"{name}__isnull": False}) if descending else Q(pk__in=[])
+            return after | Q(**{f"{name}__isnull": True}) if or_equal else after
+        lookup = ("lte" if or_equal else "lt") if descending else ("gte" if or_equal else "gt")
+        after = Q(**{f"{name}__{lookup}": value})
+        return after if descending else after | Q(**{f"{name}__isnull": True})
+
+    @staticmethod
+    def _equal(name: str, value) -> Q:
+        return Q(**{f"{name}__isnull": True}) if value is None else Q(**{name: value})
 
+    def _seek(self, terms: list[tuple[str, bool]], values: list) -> Q:
+        # (a, b, c) > (x, y, z) expands to a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z). The leading
+        # "a >= x" bound is redundant logically, but lets the planner start an index range scan at the cursor.
+        (first_name, first_descending), first_value = terms[0], values[0]
+        conditions = []
+        equal = Q()
+        for (name, descending), value in zip(terms, values):
+            conditions.append(equal & self._after(name, descending, value))
+            equal &= self._equal(name, value)
+        return self._after(first_name, first_descending, first_value, or_equal=True) & reduce(or_, conditions)
@@ -0,0 +1,129 @@
+import csv
+import json
+import time
+from itertools import islice
+from pathlib import Path
+from typing import Iterator
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from BooksApp.helpers import bulk_insert_books, copy_books, validate_books
+from BooksApp.models import BookImportCheckpoint
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports books from a CSV file (with a header row) or a JSON Lines file, with the columns title, author, "
+        "publication_date and user (a user id). The file is streamed and written in batches; invalid records are "
+        "reported with their line number and skipped. Every batch saves the position reached in the file to a "
+        "checkpoint, in the same transaction as its books, so an interrupted import can be continued with --resume "
+        "without skipping or repeating records."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", type=Path)
+        parser.add_argument("--format", choices=["csv", "jsonl"], help="Defaults to the file extension.")
+        parser.add_argument("--batch-size", type=int, default=settings.BOOKS_BULK_CREATE_BATCH_SIZE)
+        parser.add_argument("--checkpoint", help="Name of the checkpoint; defaults to the absolute input path.")
+        parser.add_argument("--resume", action="store_true", help="Skip the records imported by a previous run.")
+        parser.add_argument("--no-copy", action="store_true", help="Use INSERT instead of COPY on PostgreSQL.")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        if not path.is_file():
+            raise CommandError(f'File "{path}" does not exist.')
+        file_format = options["format"] or path.suffix.lstrip(".").lower()
+        if file_format not in ("csv", "jsonl"):
+            raise CommandError("Cannot tell the format from the file extension, pass --format.")
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive.")
+        checkpoint = options["checkpoint"] or str(path.resolve())
+        offset, line = 0, 0
+        if options["resume"]:
+            offset, line = BookImportCheckpoint.objects.filter(name=checkpoint).values_list(
+                "offset", "line"
+            ).first() or (0, 0)
+        insert = bulk_insert_books
+        if connection.vendor == "postgresql" and not options["no_copy"]:
+            insert = copy_books
+
+        known_users = set()
+        read = imported = skipped = 0
+        started = time.monotonic()
+        with path.open("rb") as file:
+            records = self._read_records(file, file_format, offset, line)
+            while batch := list(islice(records, options["batch_size"])):
+                rows, errors = validate_books([record for _, _, record in batch], known_users)
+                for (first_line, _, _), error in zip(batch, errors):
+                    if error:
+                        self.stderr.write(f"Line {first_line}: {json.dumps(error)}")
+                with transaction.atomic():
+                    imported += insert(rows) if rows else 0
+                    # The file position is right after the last record of the batch
+                    BookImportCheckpoint.objects.update_or_create(
+                        name=checkpoint, defaults={"offset": file.tell(), "line": batch[-1][1]}
+                    )
+                skipped += len(batch) - len(rows)
+                read += len(batch)
+                rate = imported / max(time.monotonic() - started, 1e-6)
+                self.stdout.write(
+                    f"{read} records read up to line {batch[-1][1]}, {imported} books imported ({rate:.0f} books/s)"
+                )
+
+        BookImportCheckpoint.objects.filter(name=checkpoint).delete()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {imported} books in {elapsed:.1f}s ({imported / max(elapsed, 1e-6):.0f} books/s), "
+            f"skipped {skipped} invalid records."
+        ))
+
+    @staticmethod
+    def _read_records(file, file_format: str, offset: int, line: int) -> Iterator[tuple[int, int, dict | str]]:
+        """
+        Yields the records of the (binary) file after byte `offset`, which ends line `line`, each with the numbers of
+        its first and last lines. The CSV header is always read from the start of the file.
+        """
+        lines_read = 0
+
+        def read_lines() -> Iterator[str]:
+            nonlocal lines_read
+            # readline() rather than iteration, so that file.tell() stays exact
+            for raw_line in iter(file.readline, b""):
+                lines_read += 1
+                yield raw_line.decode("utf-8")
+
+        lines = read_lines()
+        if file_format == "csv":
+            reader = csv.reader(lines)
+            fields = next(reader, None)
+            if offset:
+                file.seek(offset)
+                lines_read = line
+            while fields is not None:
+                first_line = lines_read + 1
+                row = next(reader, None)
+                if row is None:
+                    return
+                if not row:
+                    continue
+                # Like csv.DictReader: extra values are kept under None
+                record = dict(zip(fields, row))
+                if len(row) > len(fields):
+                    record[None] = row[len(fields):]
+                # Empty cells are treated as missing, so optional fields such as publication_date can be left out
+                yield first_line, lines_read, {key: value for key, value in record.items() if value not in ("", None)}
+            return
+        if offset:
+            file.seek(offset)
+            lines_read = line
+        for text in lines:
+            if not text.strip():
+                continue
+            try:
+                record = json.loads(text)
+            except json.JSONDecodeError:
+                # Reported as invalid data by the validation, like any other non-object record
+                record = text
+            yield lines_read, lines_read, record
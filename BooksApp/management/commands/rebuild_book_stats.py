@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from BooksApp.stats import rebuild_book_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes the book statistics of every user (BookStats and YearlyBookStats) from the books. They are kept "
+        "up to date as books change, so this is only needed to repair them, e.g. after books were written directly "
+        "in the database. Book changes wait until the rebuild has finished."
+    )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        users, years = rebuild_book_stats()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt the statistics of {users} users ({years} user-years) in {time.monotonic() - started:.1f}s."
+        ))
@@ -0,0 +1,45 @@
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+import django.db.models.functions.text
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+from BooksApp.operations import AddPostgresIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    # Indexes are built concurrently so that the books table stays writable, which cannot happen in a transaction
+    atomic = False
+
+    dependencies = [
+        ("BooksApp", "0001_initial"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        AddPostgresIndexConcurrently(
+            model_name="book",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.search.SearchVector("title", "author", config="english"),
+                name="book_search_vector_idx",
+            ),
+        ),
+        AddPostgresIndexConcurrently(
+            model_name="book",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper("title"), name="gin_trgm_ops"
+                ),
+                name="book_title_trgm_idx",
+            ),
+        ),
+        AddPostgresIndexConcurrently(
+            model_name="book",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper("author"), name="gin_trgm_ops"
+                ),
+                name="book_author_trgm_idx",
+            ),
+        ),
+    ]
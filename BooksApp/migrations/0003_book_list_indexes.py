@@ -0,0 +1,65 @@
+import django.contrib.postgres.indexes
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+from BooksApp.operations import AddIndexConcurrentlyWhereSupported, AddPostgresIndexConcurrently
+
+
+USER_FK_INDEX = "BooksApp_book_user_id_902cc367"
+
+
+def drop_user_fk_index(apps, schema_editor):
+    concurrently = " CONCURRENTLY" if schema_editor.connection.vendor == "postgresql" else ""
+    schema_editor.execute(f"DROP INDEX{concurrently} IF EXISTS {schema_editor.quote_name(USER_FK_INDEX)}")
+
+
+def create_user_fk_index(apps, schema_editor):
+    concurrently = " CONCURRENTLY" if schema_editor.connection.vendor == "postgresql" else ""
+    book_table = apps.get_model("BooksApp", "Book")._meta.db_table
+    schema_editor.execute(
+        f"CREATE INDEX{concurrently} IF NOT EXISTS {schema_editor.quote_name(USER_FK_INDEX)} "
+        f"ON {schema_editor.quote_name(book_table)} ({schema_editor.quote_name('user_id')})"
+    )
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("BooksApp", "0002_book_search_indexes"),
+    ]
+
+    operations = [
+        AddIndexConcurrentlyWhereSupported(
+            model_name="book",
+            index=models.Index(fields=["-publication_date", "-id"], name="book_pub_date_idx"),
+        ),
+        AddIndexConcurrentlyWhereSupported(
+            model_name="book",
+            index=models.Index(fields=["user", "-publication_date", "-id"], name="book_user_pub_date_idx"),
+        ),
+        AddPostgresIndexConcurrently(
+            model_name="book",
+            index=django.contrib.postgres.indexes.BrinIndex(
+                fields=["publication_date"], name="book_pub_date_brin_idx"
+            ),
+        ),
+        # Dropped only once book_user_pub_date_idx exists, which covers the same lookups. Only the index goes: a plain
+        # AlterField would also drop and re-validate the foreign key constraint over the whole table.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name="book",
+                    name="user",
+                    field=models.ForeignKey(
+                        db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL
+                    ),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(drop_user_fk_index, create_user_fk_index),
+            ],
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 4.2.3 on 2026-10-18 18:05
+
+from itertools import islice
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max
+from django.db.models.functions import ExtractYear
+import django.db.models.deletion
+
+
+def populate_book_stats(apps, schema_editor):
+    """Computes the statistics of every user from the existing books, with one aggregate query per table."""
+    Book = apps.get_model("BooksApp", "Book")
+    BookStats = apps.get_model("BooksApp", "BookStats")
+    YearlyBookStats = apps.get_model("BooksApp", "YearlyBookStats")
+    database = schema_editor.connection.alias
+    batch_size = 1000
+    books = Book.objects.using(database).order_by()
+    per_user = books.values("user_id").annotate(book_count=Count("pk"), newest=Max("publication_date"))
+    per_year = books.filter(publication_date__isnull=False).annotate(year=ExtractYear("publication_date")).values(
+        "user_id", "year"
+    ).annotate(book_count=Count("pk"), newest=Max("publication_date"))
+    for model, rows in ((BookStats, per_user), (YearlyBookStats, per_year)):
+        rows = iter(rows.iterator(chunk_size=batch_size))
+        while batch := list(islice(rows, batch_size)):
+            model.objects.using(database).bulk_create([
+                model(**{name: value for name, value in row.items() if name != "newest"},
+                      newest_publication_date=row["newest"])
+                for row in batch
+            ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('UsersApp', '0002_throttlecounter'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('BooksApp', '0003_book_list_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='book_stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('book_count', models.PositiveIntegerField(default=0)),
+                ('newest_publication_date', models.DateField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='YearlyBookStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField()),
+                ('book_count', models.PositiveIntegerField(default=0)),
+                ('newest_publication_date', models.DateField(blank=True, null=True)),
+                ('user', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='yearly_book_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-year'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='yearlybookstats',
+            constraint=models.UniqueConstraint(fields=('user', 'year'), name='yearly_book_stats_user_year_uniq'),
+        ),
+        migrations.RunPython(populate_book_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.3 on 2026-10-18 18:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('BooksApp', '0004_book_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookImportCheckpoint',
+            fields=[
+                ('name', models.CharField(help_text='The input path, unless given', max_length=1024, primary_key=True, serialize=False)),
+                ('offset', models.BigIntegerField(help_text='Bytes of the input read')),
+                ('line', models.BigIntegerField(help_text='Lines of the input read')),
+            ],
+        ),
+    ]
@@ -1,16 +1,81 @@
-from django.db import models
+from django.contrib.postgres.indexes import BrinIndex, GinIndex, OpClass
+from django.contrib.postgres.search import SearchVector
+from django.db import models, router, transaction
+from django.db.models.functions import Upper
 
 from UsersApp.models import User
 
+# Text search configuration used by both the search index and the queries, which must match for the index to be used
+SEARCH_CONFIG = "english"
+
+
+def book_search_vector() -> SearchVector:
+    return SearchVector("title", "author", config=SEARCH_CONFIG)
+
 
 class Book(models.Model):
     title = models.CharField(max_length=100)
     author = models.CharField(max_length=100, help_text="First name and Last Name")
     publication_date = models.DateField(null=True, blank=True)
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    # Lookups by user are served by the leading column of book_user_pub_date_idx, so no separate FK index is kept
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
 
     class Meta:
         ordering = ["-publication_date"]
+        indexes = [
+            # Default list ordering, with the id tiebreaker used by cursor pagination
+            models.Index(fields=["-publication_date", "-id"], name="book_pub_date_idx"),
+            # The same ordering within one user's books
+            models.Index(fields=["user", "-publication_date", "-id"], name="book_user_pub_date_idx"),
+            # Tiny index for date range scans; effective while rows are appended in publication order
+            BrinIndex(fields=["publication_date"], name="book_pub_date_brin_idx"),
+            GinIndex(book_search_vector(), name="book_search_vector_idx"),
+            # icontains compiles to UPPER(column) LIKE UPPER('%value%'), which these trigram indexes serve
+            GinIndex(OpClass(Upper("title"), name="gin_trgm_ops"), name="book_title_trgm_idx"),
+            GinIndex(OpClass(Upper("author"), name="gin_trgm_ops"), name="book_author_trgm_idx"),
+        ]
 
     def __str__(self):
         return self.title
+
+    def save(self, *args, **kwargs):
+        # BookStats is updated by the post_save signal, in the same transaction as the book
+        using = kwargs.get("using") or router.db_for_write(Book, instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            super().save(*args, **kwargs)
+
+
+class BookStats(models.Model):
+    """
+    Number of books of a user and their newest publication date, maintained incrementally as books change (see
+    BooksApp.stats), so they are read with one primary key lookup instead of an aggregate over the user's books.
+    Users without books have no row.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name="book_stats")
+    book_count = models.PositiveIntegerField(default=0)
+    newest_publication_date = models.DateField(null=True, blank=True)
+
+
+class YearlyBookStats(models.Model):
+    """The same statistics per publication year. Books without a publication date are only counted in BookStats."""
+    # Lookups by user are served by the leading column of the unique constraint
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False, related_name="yearly_book_stats")
+    year = models.PositiveSmallIntegerField()
+    book_count = models.PositiveIntegerField(default=0)
+    newest_publication_date = models.DateField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-year"]
+        constraints = [
+            models.UniqueConstraint(fields=["user", "year"], name="yearly_book_stats_user_year_uniq"),
+        ]
+
+
+class BookImportCheckpoint(models.Model):
+    """
+    Progress of an import_books run, saved in the same transaction as each batch of books, so that a resumed import
+    neither skips nor repeats records.
+    """
+    name = models.CharField(max_length=1024, primary_key=True, help_text="The input path, unless given")
+    offset = models.BigIntegerField(help_text="Bytes of the input read")
+    line = models.BigIntegerField(help_text="Lines of the input read")
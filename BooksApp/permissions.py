@@ -1,21 +1,57 @@
+from django.db.models import QuerySet
 from rest_framework import permissions
 from rest_framework.request import Request
 
 from BooksApp.models import Book
+from UsersApp.permissions import ahas_cached_perm, has_cached_perm
 
 
 class CustomObjectPermissions(permissions.BasePermission):
+    """
+    Permission checks are answered from the per-user permission snapshot in the shared cache, so they do not query
+    the database on every request. The `a`-prefixed methods are the same checks for async views.
+    """
+    action_permissions = {
+        "create": "BooksApp.add_book",
+        "bulk_create": "BooksApp.add_book",
+        "list": "BooksApp.view_book",
+        "export": "BooksApp.view_book",
+        "stats": "BooksApp.view_book",
+        "facets": "BooksApp.view_book",
+        "bulk_update": "BooksApp.change_book",
+        "bulk_delete": "BooksApp.delete_book",
+    }
+    object_actions = ["retrieve", "update", "partial_update", "destroy"]
+
     def has_permission(self, request: Request, view) -> bool:
-        if view.action == "create":
-            return request.user.has_perm("BooksApp.add_book")
-        elif view.action == "list":
-            return request.user.has_perm("BooksApp.view_book")
-        return True
+        perm = self.action_permissions.get(view.action)
+        return perm is None or has_cached_perm(request.user, perm)
+
+    async def ahas_permission(self, request: Request, view) -> bool:
+        perm = self.action_permissions.get(view.action)
+        return perm is None or await ahas_cached_perm(request.user, perm)
 
     def has_object_permission(self, request: Request, view, obj: Book) -> bool:
-        if view.action in ["retrieve", "update", "partial_update", "destroy"]:
-            if request.user.has_perm("auth.permissionus.administrator"):
+        if view.action in self.object_actions:
+            if has_cached_perm(request.user, "auth.permissionus.administrator"):
                 return True
             # If the user is not an administrator, must own the book
-            return obj.user == request.user and request.user.has_perm("BooksApp.view_book")
+            return obj.user_id == request.user.pk and has_cached_perm(request.user, "BooksApp.view_book")
+        return True
+
+    async def ahas_object_permission(self, request: Request, view, obj: Book) -> bool:
+        if view.action in self.object_actions:
+            if await ahas_cached_perm(request.user, "auth.permissionus.administrator"):
+                return True
+            return obj.user_id == request.user.pk and await ahas_cached_perm(request.user, "BooksApp.view_book")
         return True
+
+
+def filter_permitted_books(request: Request, queryset: QuerySet) -> QuerySet:
+    """
+    Restricts `queryset` to the books the user may act on, with the same rule as `has_object_permission`:
+    administrators may act on every book, other users only on their own.
+    """
+    if has_cached_perm(request.user, "auth.permissionus.administrator"):
+        return queryset
+    return queryset.filter(user_id=request.user.pk)
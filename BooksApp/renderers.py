@@ -0,0 +1,56 @@
+import csv
+import io
+from collections.abc import Iterable, Iterator
+
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework.renderers import BaseRenderer
+
+
+class StreamingRenderer(BaseRenderer):
+    """
+    A renderer for exports. Large exports are streamed with `stream()`, which turns rows into text a chunk at a time;
+    `render()` is only used for small payloads such as error responses.
+    """
+    charset = "utf-8"
+
+    def stream(self, fields: list[str], rows: Iterable, chunk_size: int = 1000) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self, data, accepted_media_type=None, renderer_context=None) -> bytes:
+        items = data if isinstance(data, list) else [data]
+        fields = list(items[0]) if items and isinstance(items[0], dict) else []
+        rows = ([item.get(field) for field in fields] for item in items)
+        return "".join(self.stream(fields, rows)).encode(self.charset)
+
+
+class CSVRenderer(StreamingRenderer):
+    media_type = "text/csv"
+    format = "csv"
+
+    def stream(self, fields: list[str], rows: Iterable, chunk_size: int = 1000) -> Iterator[str]:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(fields)
+        for count, row in enumerate(rows, 1):
+            writer.writerow(row)
+            if count % chunk_size == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+
+class NDJSONRenderer(StreamingRenderer):
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+
+    def stream(self, fields: list[str], rows: Iterable, chunk_size: int = 1000) -> Iterator[str]:
+        encoder = DjangoJSONEncoder()
+        lines = []
+        for row in rows:
+            lines.append(encoder.encode(dict(zip(fields, row))))
+            if len(lines) == chunk_size:
+                yield "\n".join(lines) + "\n"
+                lines = []
+        if lines:
+            yield "\n".join(lines) + "\n"
@@ -1,7 +1,8 @@
+from django.conf import settings
 from drf_spectacular.utils import extend_schema_serializer, OpenApiExample
 from rest_framework import serializers
 
-from BooksApp.models import Book
+from BooksApp.models import Book, BookStats, YearlyBookStats
 from UsersApp.examples import BOOK_LIST_PAYLOAD, BOOK_DETAIL_PAYLOAD
 
 
@@ -15,11 +16,24 @@ from UsersApp.examples import BOOK_LIST_PAYLOAD, BOOK_DETAIL_PAYLOAD
     ]
 )
 class BookListSerializer(serializers.ModelSerializer):
+    """
+    Lists are not serialized through this class (see `serialize_book_rows`), which only describes them; its fields
+    must stay plain model fields whose database values are already their JSON representation.
+    """
     class Meta:
         model = Book
         fields = ["id", "title", "author"]
 
 
+def serialize_book_rows(rows) -> list[dict]:
+    """
+    Serializes `.values()` rows like BookListSerializer(many=True) would, byte for byte once rendered, without
+    building model instances or running fields. Extra keys of the rows (e.g. ordering columns) are left out.
+    """
+    fields = BookListSerializer.Meta.fields
+    return [{field: row[field] for field in fields} for row in rows]
+
+
 @extend_schema_serializer(
     examples=[
         OpenApiExample(
@@ -33,3 +47,91 @@ class BookSerializer(serializers.ModelSerializer):
     class Meta:
         model = Book
         fields = ["id", "title", "author", "publication_date", "user"]
+
+
+class BookBulkCreateSerializer(serializers.ModelSerializer):
+    """
+    Validates one item of a bulk creation. The user is taken as a plain id, so that the users of all items can be
+    checked with a single query (see `BooksApp.helpers.validate_books`) instead of one query per item.
+    """
+    user = serializers.IntegerField(source="user_id", min_value=1)
+
+    class Meta:
+        model = Book
+        fields = ["title", "author", "publication_date", "user"]
+
+
+class BookBulkCreateResultSerializer(serializers.Serializer):
+    created = serializers.IntegerField()
+
+
+class BookBulkSelectionSerializer(serializers.Serializer):
+    """Selects the books of a bulk operation, by id or by BookFilter parameters (e.g. {"date_to": "2000-01-01"})."""
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, allow_empty=False)
+    filter = serializers.DictField(required=False, allow_empty=False)
+    dry_run = serializers.BooleanField(default=False, help_text="Only count the books that would be affected.")
+
+    def validate(self, attrs: dict) -> dict:
+        if ("ids" in attrs) == ("filter" in attrs):
+            raise serializers.ValidationError("Provide either \"ids\" or \"filter\".")
+        # Read per request, like the limit of bulk creation
+        if len(attrs.get("ids", ())) > settings.BOOKS_BULK_MAX_ITEMS:
+            raise serializers.ValidationError(
+                {"ids": [f"Ensure there are no more than {settings.BOOKS_BULK_MAX_ITEMS} ids."]}
+            )
+        return attrs
+
+
+class BookBulkValuesSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Book
+        fields = ["title", "author", "publication_date"]
+        extra_kwargs = {"title": {"required": False}, "author": {"required": False}}
+
+    def validate(self, attrs: dict) -> dict:
+        if not attrs:
+            raise serializers.ValidationError("Provide at least one field to update.")
+        return attrs
+
+
+class BookBulkUpdateSerializer(BookBulkSelectionSerializer):
+    values = BookBulkValuesSerializer()
+
+
+class BookBulkResultSerializer(serializers.Serializer):
+    dry_run = serializers.BooleanField()
+    requested = serializers.IntegerField(required=False, help_text="Number of ids sent, when selecting by id.")
+    matched = serializers.IntegerField(help_text="Books selected that the user may change.")
+    updated = serializers.IntegerField(required=False)
+    deleted = serializers.IntegerField(required=False)
+
+
+class YearlyBookStatsSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = YearlyBookStats
+        fields = ["year", "book_count", "newest_publication_date"]
+
+
+class BookStatsSerializer(serializers.ModelSerializer):
+    user = serializers.IntegerField()
+    years = YearlyBookStatsSerializer(many=True, help_text="Books with a publication date, newest year first.")
+
+    class Meta:
+        model = BookStats
+        fields = ["user", "book_count", "newest_publication_date", "years"]
+
+
+class BookAuthorFacetSerializer(serializers.Serializer):
+    author = serializers.CharField()
+    count = serializers.IntegerField()
+
+
+class BookYearFacetSerializer(serializers.Serializer):
+    year = serializers.IntegerField(allow_null=True, help_text="None for books without a publication date.")
+    count = serializers.IntegerField()
+
+
+class BookFacetsSerializer(serializers.Serializer):
+    count = serializers.IntegerField(help_text="Books matching the filters.")
+    authors = BookAuthorFacetSerializer(many=True, help_text="The most frequent authors first.")
+    years = BookYearFacetSerializer(many=True, help_text="The newest year first.")
@@ -0,0 +1,51 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from BooksApp.cache import invalidate_book_lists
+from BooksApp.models import Book
+from BooksApp.stats import BookStatsChanges, record_book_changes
+from UsersApp.models import User
+
+_UNCHANGED = object()
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def book_changed(sender, **kwargs) -> None:
+    invalidate_book_lists()
+
+
+@receiver(pre_save, sender=Book)
+def book_saving(sender, instance: Book, raw: bool, update_fields=None, **kwargs) -> None:
+    """Reads what the book is counted under in the statistics before the save, locking it until the save commits."""
+    if update_fields is not None and not {"user", "user_id", "publication_date"} & set(update_fields):
+        instance._stats_previous = _UNCHANGED
+    elif instance._state.adding and not raw:
+        instance._stats_previous = None
+    else:
+        # Fixtures (raw) may replace an existing row
+        instance._stats_previous = Book.objects.select_for_update().filter(pk=instance.pk).values_list(
+            "user_id", "publication_date"
+        ).first()
+
+
+@receiver(post_save, sender=Book)
+def update_book_stats_on_save(sender, instance: Book, **kwargs) -> None:
+    previous, current = instance._stats_previous, (instance.user_id, instance.publication_date)
+    if previous is _UNCHANGED or previous == current:
+        return
+    changes = BookStatsChanges()
+    if previous is not None:
+        changes.remove(*previous)
+    changes.add(*current)
+    record_book_changes(changes)
+
+
+@receiver(post_delete, sender=Book)
+def update_book_stats_on_delete(sender, instance: Book, origin=None, **kwargs) -> None:
+    if isinstance(origin, User):
+        # The statistics of the user are deleted with them
+        return
+    changes = BookStatsChanges()
+    changes.remove(instance.user_id, instance.publication_date)
+    record_book_changes(changes)
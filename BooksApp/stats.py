@@ -0,0 +1,226 @@
+from collections import Counter
+from datetime import date
+from itertools import islice
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Max, Model, QuerySet
+from django.db.models.functions import ExtractYear
+
+from BooksApp.models import Book, BookStats, YearlyBookStats
+
+class BookStatsChanges:
+    """
+    Changes to the statistics of some users, collected from added and removed books. Statistics are kept per user
+    (year None, in BookStats) and per user and publication year (in YearlyBookStats).
+    """
+
+    def __init__(self):
+        self.counts = Counter()
+        # Newest publication date added and removed per key; removing the newest book of a key means looking for the
+        # next one
+        self.added: dict[tuple[int, int | None], date | None] = {}
+        self.removed: dict[tuple[int, int | None], date | None] = {}
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed)
+
+    @staticmethod
+    def _keys(user_id: int, publication_date: date | None) -> list[tuple[int, int | None]]:
+        return [(user_id, None)] if publication_date is None else [(user_id, None), (user_id, publication_date.year)]
+
+    @staticmethod
+    def _newest(current: date | None, other: date | None) -> date | None:
+        return other if current is None or (other is not None and other > current) else current
+
+    def add(self, user_id: int, publication_date: date | None, count: int = 1) -> None:
+        for key in self._keys(user_id, publication_date):
+            self.counts[key] += count
+            self.added[key] = self._newest(self.added.get(key), publication_date)
+
+    def remove(self, user_id: int, publication_date: date | None, count: int = 1) -> None:
+        for key in self._keys(user_id, publication_date):
+            self.counts[key] -= count
+            self.removed[key] = self._newest(self.removed.get(key), publication_date)
+
+
+def record_book_changes(changes: BookStatsChanges) -> None:
+    """
+    Applies the changes to BookStats and YearlyBookStats, in the current transaction; the books must already be
+    written, as the newest publication dates are looked up again when the newest books are removed.
+    """
+    if not changes:
+        return
+    with transaction.atomic(savepoint=False):
+        _apply(changes)
+
+
+def _columns(model: type[Model], keys: list[str]) -> tuple[str, list[str], str, str]:
+    quote = connection.ops.quote_name
+    return (
+        quote(model._meta.db_table),
+        [quote(model._meta.get_field(name).column) for name in keys],
+        quote(model._meta.get_field("book_count").column),
+        quote(model._meta.get_field("newest_publication_date").column),
+    )
+
+
+def _newest_sql(table: str, newest: str, value: str) -> str:
+    return f"CASE WHEN {table}.{newest} IS NULL OR {value} > {table}.{newest} THEN {value} ELSE {table}.{newest} END"
+
+
+def _upsert(model: type[Model], keys: list[str], rows: list[tuple]) -> tuple | None:
+    """
+    Adds (*key, count, newest date) rows to the statistics with multi-row upserts. Returns the new (count, newest
+    date) of the last row.
+    """
+    table, key_columns, book_count, newest = _columns(model, keys)
+    columns = ", ".join([*key_columns, book_count, newest])
+    rows = iter(rows)
+    result = None
+    while batch := list(islice(rows, 500)):
+        placeholders = ", ".join(["(" + ", ".join(["%s"] * (len(keys) + 2)) + ")"] * len(batch))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} ({columns}) VALUES {placeholders} "
+                f"ON CONFLICT ({', '.join(key_columns)}) DO UPDATE SET "
+                f"{book_count} = {table}.{book_count} + EXCLUDED.{book_count}, "
+                f"{newest} = {_newest_sql(table, newest, f'EXCLUDED.{newest}')} "
+                f"RETURNING {book_count}, {newest}",
+                [value for row in batch for value in row],
+            )
+            result = cursor.fetchall()[-1]
+    return result
+
+
+def _adjust(model: type[Model], keys: list[str], key: tuple, count: int, added) -> tuple | None:
+    """Adjusts existing statistics; returns their new (count, newest date), or None when there are none."""
+    table, key_columns, book_count, newest = _columns(model, keys)
+    where = " AND ".join(f"{column} = %s" for column in key_columns)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {table} SET {book_count} = {table}.{book_count} + %s, "
+            f"{newest} = {_newest_sql(table, newest, '%s')} WHERE {where} RETURNING {book_count}, {newest}",
+            [count, added, added, *key],
+        )
+        return cursor.fetchone()
+
+
+def _apply(changes: BookStatsChanges) -> None:
+    adapt = connection.ops.adapt_datefield_value
+    to_date = Book._meta.get_field("publication_date").to_python
+    increments = {BookStats: [], YearlyBookStats: []}
+    stale = []
+    # In key order, so that concurrent changes lock the statistics rows in the same order
+    for key in sorted(changes.counts, key=lambda key: (key[0], key[1] or 0)):
+        user_id, year = key
+        model, fields = (BookStats, ["user"]) if year is None else (YearlyBookStats, ["user", "year"])
+        key_values = (user_id,) if year is None else (user_id, year)
+        count, added, removed = changes.counts[key], changes.added.get(key), changes.removed.get(key)
+        if key not in changes.removed:
+            increments[model].append((*key_values, count, adapt(added)))
+            continue
+        if count > 0:
+            current = _upsert(model, fields, [(*key_values, count, adapt(added))])
+        else:
+            current = _adjust(model, fields, key_values, count, adapt(added))
+        if current is None:
+            # The user is being deleted, with their statistics
+            continue
+        current_count, current_newest = current[0], to_date(current[1])
+        if current_count <= 0:
+            model.objects.filter(**dict(zip(fields, key_values))).delete()
+        elif removed is not None and current_newest is not None and removed >= current_newest \
+                and added != current_newest:
+            stale.append((model, fields, key_values))
+    for model, rows in increments.items():
+        if rows:
+            _upsert(model, ["user"] if model is BookStats else ["user", "year"], rows)
+    for model, fields, key_values in stale:
+        # The newest book may be gone: read the next one from the (user, publication date) index
+        books = Book.objects.filter(user_id=key_values[0])
+        if model is YearlyBookStats:
+            books = books.filter(publication_date__year=key_values[1])
+        newest = books.aggregate(newest=Max("publication_date"))["newest"]
+        model.objects.filter(**dict(zip(fields, key_values))).update(newest_publication_date=newest)
+
+
+def changes_for_rows(rows: list[dict]) -> BookStatsChanges:
+    """Returns the statistics changes of inserting validated book rows."""
+    changes = BookStatsChanges()
+    for row in rows:
+        changes.add(row["user_id"], row.get("publication_date"))
+    return changes
+
+
+def changes_for_date_update(queryset: QuerySet, publication_date: date | None) -> BookStatsChanges:
+    """
+    Returns the statistics changes of setting the publication date of the books of `queryset`, to be recorded once
+    they are updated. The books are locked until the transaction ends, so that they cannot change in between.
+    """
+    counts = Counter(
+        queryset.select_for_update().order_by().values_list("user_id", "publication_date").iterator(
+            chunk_size=settings.BOOKS_EXPORT_CHUNK_SIZE
+        )
+    )
+    changes = BookStatsChanges()
+    for (user_id, previous_date), count in counts.items():
+        changes.remove(user_id, previous_date, count)
+        changes.add(user_id, publication_date, count)
+    return changes
+
+
+def changes_for_delete(queryset: QuerySet) -> BookStatsChanges:
+    """
+    Returns the statistics changes of deleting the books of `queryset`, counted with one aggregate query, to be
+    recorded once they are deleted. The books are locked until the transaction ends, so that they cannot change in
+    between.
+    """
+    locked = queryset.model.objects.filter(pk__in=queryset.select_for_update().order_by().values("pk"))
+    counts = locked.order_by().values("user_id", "publication_date").annotate(count=Count("pk")).values_list(
+        "user_id", "publication_date", "count"
+    )
+    changes = BookStatsChanges()
+    for user_id, publication_date, count in counts:
+        changes.remove(user_id, publication_date, count)
+    return changes
+
+
+def fill_book_stats(batch_size: int = None) -> tuple[int, int]:
+    """
+    Computes the statistics of every user from the books, with one aggregate query per table, into empty statistics
+    tables. Returns the number of BookStats and YearlyBookStats rows written.
+    """
+    batch_size = batch_size or settings.BOOKS_BULK_CREATE_BATCH_SIZE
+    books = Book.objects.order_by()
+    per_user = books.values("user_id").annotate(book_count=Count("pk"), newest=Max("publication_date"))
+    per_year = books.filter(publication_date__isnull=False).annotate(year=ExtractYear("publication_date")).values(
+        "user_id", "year"
+    ).annotate(book_count=Count("pk"), newest=Max("publication_date"))
+    written = []
+    for model, rows in ((BookStats, per_user), (YearlyBookStats, per_year)):
+        rows = iter(rows.iterator(chunk_size=batch_size))
+        total = 0
+        while batch := list(islice(rows, batch_size)):
+            model.objects.bulk_create([
+                model(**{name: value for name, value in row.items() if name != "newest"},
+                      newest_publication_date=row["newest"])
+                for row in batch
+            ])
+            total += len(batch)
+        written.append(total)
+    return written[0], written[1]
+
+
+def rebuild_book_stats() -> tuple[int, int]:
+    """
+    Recomputes every statistic from scratch, in one transaction. On PostgreSQL, book changes wait until the rebuild
+    has committed, so that none of them is lost. Returns the number of BookStats and YearlyBookStats rows.
+    """
+    with transaction.atomic():
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute(f"LOCK TABLE {connection.ops.quote_name(Book._meta.db_table)} IN SHARE MODE")
+        YearlyBookStats.objects.all().delete()
+        BookStats.objects.all().delete()
+        return fill_book_stats()
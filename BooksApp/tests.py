@@ -1,14 +1,44 @@
+import json
+import os
+import tempfile
+import time
+from datetime import date, timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import skipUnless
+from unittest.mock import patch
+
+from asgiref.sync import async_to_sync, sync_to_async
 from django.contrib.auth.models import Permission
+from django.contrib.postgres.indexes import GinIndex
+from django.core.cache import cache
 from django.core.exceptions import PermissionDenied
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.db.models import Count, Max
+from django.db.models.functions import ExtractYear
+from django.http import HttpResponse
+from django.test import AsyncClient, RequestFactory, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from model_bakery.baker import make
 from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
 from rest_framework.response import Response
+from rest_framework.test import APIClient
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from BooksApp.models import Book
-from BooksApp.serializers import BookSerializer
+from BooksApp.cache import get_cached_list, invalidate_book_lists, set_cached_list
+from BooksApp.filters import BookCursorPagination
+from BooksApp.models import Book, BookImportCheckpoint, BookStats, YearlyBookStats
+from BooksApp.serializers import BookListSerializer, BookSerializer
+from BooksProject.db_router import STICKY_COOKIE_NAME, ReplicaRouter, ReplicaRoutingMiddleware
+from BooksProject.metrics import Histogram, metrics_registry
 from UsersApp.models import User
+from UsersApp.permissions import get_permission_snapshot
+from UsersApp.serializers import MyTokenObtainPairSerializer
+from UsersApp.throttling import SharedScopedRateThrottle
 from utils import BaseTestCase, Errors
 
 
@@ -116,3 +146,897 @@ class BookPaginationTestCase(BaseTestCase):
         response = self.client.get(self.url, data={"items_per_page": 4, "page_number": 1})
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data["results"]), 4)
+
+
+class BookCursorPaginationTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        dates = [date(2023, 1, 1), date(2023, 1, 1), None, date(2022, 5, 1), None, date(2024, 2, 2)]
+        self.books = [make(Book, title=f"title{i:02}", publication_date=dates[i % len(dates)], user=self.user)
+                      for i in range(14)]
+        self.url = reverse("books-list")
+        # NULL publication dates sort first, as in PostgreSQL, then newest first with the id as a tiebreaker
+        self.expected_ids = [book.id for book in self.books if book.publication_date is None][::-1] + [
+            book.id for book in sorted((book for book in self.books if book.publication_date is not None),
+                                       key=lambda book: (book.publication_date, book.id), reverse=True)
+        ]
+
+    def _walk(self, url: str, link: str) -> tuple[list[int], dict]:
+        ids = []
+        response = None
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn("count", response.data)
+            page_ids = [book["id"] for book in response.data["results"]]
+            ids = ids + page_ids if link == "next" else page_ids + ids
+            url = response.data[link]
+        return ids, response.data
+
+    def test_cursor_pagination_walks_every_book_once_in_order(self):
+        ids, last_page = self._walk(f"{self.url}?pagination=cursor&items_per_page=4", "next")
+        self.assertEqual(ids, self.expected_ids)
+        self.assertIsNone(last_page["next"])
+        self.assertIsNotNone(last_page["previous"])
+
+    def test_cursor_pagination_walks_backwards(self):
+        _, last_page = self._walk(f"{self.url}?pagination=cursor&items_per_page=4", "next")
+        last_page_ids = [book["id"] for book in last_page["results"]]
+        ids, first_page = self._walk(last_page["previous"], "previous")
+        self.assertEqual(ids + last_page_ids, self.expected_ids)
+        self.assertIsNone(first_page["previous"])
+
+    def test_cursor_pagination_with_filter_and_ordering(self):
+        url = f"{self.url}?pagination=cursor&items_per_page=3&ordering=title&date_from=2023-01-01"
+        ids, _ = self._walk(url, "next")
+        expected = [book.id for book in sorted(self.books, key=lambda book: book.title)
+                    if book.publication_date and book.publication_date >= date(2023, 1, 1)]
+        self.assertEqual(ids, expected)
+
+    def test_cursor_pagination_caps_page_size(self):
+        with patch.object(BookCursorPagination, "max_page_size", 5):
+            response = self.client.get(self.url, data={"pagination": "cursor", "items_per_page": 1000})
+        self.assertEqual(len(response.data["results"]), 5)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url, data={"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        cursor_url = self.client.get(self.url, data={"pagination": "cursor", "items_per_page": 2}).data["next"]
+        response = self.client.get(f"{cursor_url}&ordering=title")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class BookSearchTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.hobbit = make(Book, title="The Hobbit", author="J. R. R. Tolkien", user=self.user)
+        self.rings = make(Book, title="The Fellowship of the Ring", author="J. R. R. Tolkien", user=self.user)
+        self.dune = make(Book, title="Dune", author="Frank Herbert", user=self.user)
+        self.url = reverse("books-list")
+
+    def _search(self, value: str) -> list[int]:
+        response = self.client.get(self.url, data={"q": value})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [book["id"] for book in response.data]
+
+    def test_search_by_title_and_author(self):
+        self.assertEqual(self._search("hobbit"), [self.hobbit.id])
+        self.assertCountEqual(self._search("Tolkien"), [self.hobbit.id, self.rings.id])
+
+    def test_search_by_partial_word(self):
+        self.assertEqual(self._search("herb"), [self.dune.id])
+
+    @skipUnless(connection.vendor == "postgresql", "Ranked full-text search needs PostgreSQL")
+    def test_search_ranks_best_match_first(self):
+        make(Book, title="Rings", author="Ring Ring", user=self.user)
+        self.assertEqual(self._search("fellowship ring")[0], self.rings.id)
+
+    @skipUnless(connection.vendor == "postgresql", "Ranked full-text search needs PostgreSQL")
+    def test_equal_ranks_are_ordered_by_id(self):
+        books = [make(Book, title="Tolkien", author="Tolkien", user=self.user) for _ in range(3)]
+        self.assertEqual(self._search("Tolkien")[:3], [book.id for book in reversed(books)])
+
+    def test_empty_search_returns_everything(self):
+        self.assertEqual(len(self._search(" ")), Book.objects.count())
+
+
+@skipUnless(connection.vendor == "postgresql", "Query plans are checked against PostgreSQL")
+class BookQueryPlanTestCase(BaseTestCase):
+    """
+    Seeds a table large enough for the planner to prefer indexes and checks, through EXPLAIN, that the queries the
+    books endpoints actually run are served by the indexes declared on Book.
+    """
+    rows = 30000
+
+    @classmethod
+    def setUpTestData(cls):
+        owners = [make(User) for _ in range(50)]
+        first_day = date(2000, 1, 1)
+        Book.objects.bulk_create(
+            [Book(title=f"Title {i}", author=f"Author {i % 500}", user=owners[i % len(owners)],
+                  publication_date=first_day + timedelta(days=i // 4)) for i in range(cls.rows)],
+            batch_size=5000,
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(f'ANALYZE "{Book._meta.db_table}"')
+            # Rows inserted in this transaction sit in the GIN pending lists, which the planner costs as a scan;
+            # outside of tests autovacuum merges them
+            for index in Book._meta.indexes:
+                if isinstance(index, GinIndex):
+                    cursor.execute("SELECT gin_clean_pending_list(%s::regclass)", [index.name])
+
+    def _plans(self, url: str, data: dict = None) -> list[str]:
+        """Returns the query plans of the statements on the books table run while serving the request."""
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, data=data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        plans = []
+        with connection.cursor() as cursor:
+            for query in context.captured_queries:
+                if query["sql"].startswith("SELECT") and Book._meta.db_table in query["sql"]:
+                    cursor.execute(f"EXPLAIN {query['sql']}")
+                    plans.append("\n".join(row[0] for row in cursor.fetchall()))
+        self.assertTrue(plans)
+        return plans
+
+    def assertUsesIndex(self, plans: list[str], *index_names: str):
+        for plan in plans:
+            self.assertNotIn(f'Seq Scan on "{Book._meta.db_table}"', plan)
+            self.assertTrue(any(name in plan for name in index_names), plan)
+
+    def test_cursor_pages_use_ordering_index(self):
+        url = reverse("books-list")
+        self.assertUsesIndex(self._plans(url, {"pagination": "cursor"}), "book_pub_date_idx")
+        next_url = self.client.get(url, data={"pagination": "cursor", "items_per_page": 50}).data["next"]
+        self.assertUsesIndex(self._plans(next_url), "book_pub_date_idx")
+
+    def test_date_range_filter_uses_date_index(self):
+        data = {"pagination": "cursor", "date_from": "2005-01-01", "date_to": "2005-01-31"}
+        self.assertUsesIndex(self._plans(reverse("books-list"), data), "book_pub_date_idx", "book_pub_date_brin_idx")
+
+    def test_title_filter_uses_trigram_index(self):
+        self.assertUsesIndex(self._plans(reverse("books-list"), {"title": "itle 1234"}), "book_title_trgm_idx")
+
+    def test_user_books_use_user_ordering_index(self):
+        owner = User.objects.exclude(pk=self.user.pk).first()
+        queryset = Book.objects.filter(user=owner).order_by("-publication_date", "-id")[:20]
+        self.assertIn("book_user_pub_date_idx", queryset.explain())
+
+
+class BookBulkCreateTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse("books-bulk-create")
+
+    def _books(self, count: int) -> list[dict]:
+        return [{"title": f"title{i}", "author": "author", "publication_date": "2023-08-07",
+                 "user": (self.user if i % 2 else self.user2).id} for i in range(count)]
+
+    def test_bulk_create_in_batches(self):
+        with self.settings(BOOKS_BULK_CREATE_BATCH_SIZE=40), CaptureQueriesContext(connection) as context:
+            response = self.client.post(self.url, data=self._books(100), format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data, {"created": 100})
+        self.assertEqual(Book.objects.filter(user__in=[self.user, self.user2]).count(), 100)
+        book_insert = f"INSERT INTO {connection.ops.quote_name(Book._meta.db_table)} "
+        inserts = [query for query in context.captured_queries if query["sql"].startswith(book_insert)]
+        self.assertEqual(len(inserts), 3)
+        # Including one upsert per statistics table
+        self.assertLessEqual(len(context.captured_queries), 12)
+
+    def test_bulk_create_reports_errors_per_item(self):
+        books = self._books(4)
+        books[1]["title"] = ""
+        books[3]["user"] = 987654
+        response = self.client.post(self.url, data=books, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertIn("title", response.data[1])
+        self.assertEqual(response.data[2], {})
+        self.assertEqual(response.data[3]["user"], ['Invalid pk "987654" - object does not exist.'])
+        self.assertFalse(Book.objects.exists())
+
+    def test_bulk_create_limits(self):
+        response = self.client.post(self.url, data={"title": "title"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        with self.settings(BOOKS_BULK_MAX_ITEMS=3):
+            response = self.client.post(self.url, data=self._books(4), format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_create_without_permission(self):
+        self.client.force_authenticate(self.user2)
+        response = self.client.post(self.url, data=self._books(2), format="json")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class BookBulkUpdateDeleteTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse("books-bulk-create")
+        self.own_books = [make(Book, user=self.user, publication_date=date(2000 + i, 1, 1)) for i in range(3)]
+        self.other_book = make(Book, user=self.user2, publication_date=date(2000, 1, 1))
+
+    def test_bulk_update_by_ids_in_one_query(self):
+        ids = [book.id for book in self.own_books[:2]] + [self.other_book.id]
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.patch(self.url, data={"ids": ids, "values": {"author": "new"}}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {"dry_run": False, "requested": 3, "matched": 2, "updated": 2})
+        self.assertEqual(Book.objects.filter(author="new").count(), 2)
+        self.assertNotEqual(Book.objects.get(pk=self.other_book.pk).author, "new")
+        self.assertEqual(len([query for query in context.captured_queries if query["sql"].startswith("UPDATE")]), 1)
+
+    def test_bulk_update_by_filter(self):
+        data = {"filter": {"date_to": "2001-06-01"}, "values": {"title": "old"}}
+        response = self.client.patch(self.url, data=data, format="json")
+        self.assertEqual(response.data, {"dry_run": False, "matched": 2, "updated": 2})
+        self.assertEqual(set(Book.objects.filter(title="old")), set(self.own_books[:2]))
+
+    def test_bulk_update_dry_run(self):
+        data = {"filter": {"date_from": "2000-01-01"}, "values": {"title": "old"}, "dry_run": True}
+        response = self.client.patch(self.url, data=data, format="json")
+        self.assertEqual(response.data, {"dry_run": True, "matched": 3, "updated": 3})
+        self.assertFalse(Book.objects.filter(title="old").exists())
+
+    def test_bulk_delete(self):
+        response = self.client.delete(self.url, data={"filter": {"title": self.own_books[0].title}}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {"dry_run": False, "matched": 1, "deleted": 1})
+        self.assertFalse(Book.objects.filter(pk=self.own_books[0].pk).exists())
+        response = self.client.delete(self.url, data={"ids": [self.other_book.id]}, format="json")
+        self.assertEqual(response.data["deleted"], 0)
+        self.assertTrue(Book.objects.filter(pk=self.other_book.pk).exists())
+
+    def test_bulk_delete_in_one_statement(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.delete(self.url, data={"filter": {"date_to": "2000-06-01"}}, format="json")
+        self.assertEqual(response.data["deleted"], 1)
+        book_queries = [query["sql"] for query in context.captured_queries if '"BooksApp_book"' in query["sql"]]
+        # The statistics changes, counted in the database, and the DELETE
+        self.assertEqual(len(book_queries), 2, book_queries)
+        self.assertIn("COUNT(", book_queries[0])
+        self.assertTrue(book_queries[1].startswith('DELETE FROM "BooksApp_book"'))
+        self.assertEqual(BookStats.objects.get(user=self.user).book_count, 2)
+        self.assertFalse(YearlyBookStats.objects.filter(user=self.user, year=2000).exists())
+
+    def test_bulk_delete_skips_no_relations(self):
+        # Bulk delete issues a raw DELETE: a relation to Book would need its cascade or PROTECT applied there
+        self.assertEqual(Book._meta.related_objects, (), "Bulk delete must handle the relations to Book")
+
+    def test_bulk_selection_is_validated(self):
+        for data in ({"values": {"title": "old"}}, {"ids": [1], "filter": {"title": "a"}, "values": {"title": "b"}},
+                     {"filter": {"user": self.user2.id}, "values": {"title": "old"}},
+                     {"filter": {"date_to": "not a date"}, "values": {"title": "old"}},
+                     {"ids": [self.own_books[0].id], "values": {}}):
+            response = self.client.patch(self.url, data=data, format="json")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, data)
+        self.assertFalse(Book.objects.filter(title__in=["old", "b"]).exists())
+
+    def test_bulk_selection_limits_the_ids(self):
+        ids = [book.id for book in self.own_books]
+        with self.settings(BOOKS_BULK_MAX_ITEMS=2):
+            response = self.client.delete(self.url, data={"ids": ids}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {"ids": ["Ensure there are no more than 2 ids."]})
+        with self.settings(BOOKS_BULK_MAX_ITEMS=3):
+            response = self.client.delete(self.url, data={"ids": ids}, format="json")
+        self.assertEqual(response.data["deleted"], 3)
+
+    def test_bulk_selection_needs_an_effective_filter(self):
+        for selection in ({"title": ""}, {"q": "  "}, {"title": "", "date_from": None}):
+            response = self.client.delete(self.url, data={"filter": selection}, format="json")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, selection)
+            self.assertEqual(response.data, {"filter": ["Provide at least one non-empty filter value."]})
+        self.assertEqual(Book.objects.count(), len(self.own_books) + 1)
+
+    def test_bulk_delete_without_permission(self):
+        self.client.force_authenticate(self.user2)
+        response = self.client.delete(self.url, data={"ids": [self.other_book.id]}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class BookExportTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse("books-export")
+        self.books = [make(Book, title=f"title{i}", author="author, jr", publication_date=date(2000 + i, 1, 1),
+                           user=self.user) for i in range(5)]
+
+    def _read(self, response) -> str:
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return b"".join(response.streaming_content).decode()
+
+    def test_export_csv(self):
+        with self.settings(BOOKS_EXPORT_CHUNK_SIZE=2):
+            response = self.client.get(self.url, {"ordering": "-publication_date", "date_from": "2002-01-01"})
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        lines = self._read(response).splitlines()
+        self.assertEqual(lines[0], "id,title,author,publication_date,user")
+        self.assertEqual(lines[1:], [f'{book.id},{book.title},"author, jr",{book.publication_date},{self.user.id}'
+                                     for book in reversed(self.books[2:])])
+
+    def test_export_streams_under_asgi(self):
+        token = str(RefreshToken.for_user(self.user).access_token)
+        with self.settings(BOOKS_EXPORT_CHUNK_SIZE=2):
+            response = async_to_sync(self.async_client.get)(
+                self.url, {"ordering": "id"}, headers={"authorization": f"Bearer {token}"}
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # An async iterator, which StreamingHttpResponse does not read whole before sending
+        self.assertTrue(response.is_async)
+
+        async def read():
+            return [chunk async for chunk in response.streaming_content]
+
+        chunks = async_to_sync(read)()
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(len(b"".join(chunks).decode().splitlines()), 6)
+
+    def test_export_ndjson(self):
+        response = self.client.get(self.url, {"format": "ndjson", "ordering": "id"})
+        self.assertEqual(response["Content-Type"], "application/x-ndjson; charset=utf-8")
+        rows = [json.loads(line) for line in self._read(response).splitlines()]
+        self.assertEqual(rows[0], {"id": self.books[0].id, "title": "title0", "author": "author, jr",
+                                   "publication_date": "2000-01-01", "user": self.user.id})
+        self.assertEqual(len(rows), 5)
+
+    def test_export_without_permission(self):
+        self.client.force_authenticate(self.user2)
+        response = self.client.get(self.url, {"format": "ndjson"})
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(json.loads(response.content), {"detail": Errors.PERMISSION_DENIED})
+
+
+class ImportBooksCommandTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def _import(self, name: str, content: str, *args) -> tuple[str, str]:
+        path = self.directory / name
+        path.write_text(content)
+        stdout, stderr = StringIO(), StringIO()
+        call_command("import_books", str(path), *args, stdout=stdout, stderr=stderr)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_import_csv(self):
+        content = (
+            "title,author,publication_date,user\n"
+            f'first,"Doe, John",2001-02-03,{self.user.id}\n'
+            f"second,Doe,,{self.user2.id}\n"
+            f",Doe,,{self.user.id}\n"
+            "third,Doe,,987654\n"
+        )
+        stdout, stderr = self._import("books.csv", content)
+        self.assertIn("Imported 2 books", stdout)
+        self.assertIn("skipped 2 invalid records", stdout)
+        # Line numbers of the file, after the header
+        self.assertIn("Line 4:", stderr)
+        self.assertIn("Line 5:", stderr)
+        self.assertEqual(Book.objects.get(title="first").author, "Doe, John")
+        self.assertEqual(Book.objects.get(title="second").publication_date, None)
+        self.assertFalse(BookImportCheckpoint.objects.exists())
+
+    def test_import_jsonl_in_batches_with_cached_users(self):
+        lines = [json.dumps({"title": f"title{i}", "author": "author", "user": self.user.id}) for i in range(5)]
+        with CaptureQueriesContext(connection) as context:
+            stdout, stderr = self._import("books.jsonl", "\n".join(lines + ["not json"]), "--batch-size", "2")
+        self.assertEqual(Book.objects.count(), 5)
+        self.assertIn("Line 6:", stderr)
+        user_queries = [query for query in context.captured_queries if User._meta.db_table in query["sql"]]
+        self.assertEqual(len(user_queries), 1)
+
+    def test_resume_from_checkpoint(self):
+        lines = [json.dumps({"title": f"title{i}", "author": "author", "user": self.user.id}) for i in range(6)]
+        # Blank lines are skipped, but still counted in the line numbers
+        content = "\n".join(lines[:3] + ["", "not json"] + lines[3:]) + "\n"
+        insert = BookImportCheckpoint.objects.update_or_create
+        calls = []
+
+        def interrupt_third_batch(*args, **kwargs):
+            calls.append(kwargs)
+            if len(calls) == 3:
+                raise KeyboardInterrupt
+            return insert(*args, **kwargs)
+
+        with patch.object(BookImportCheckpoint.objects, "update_or_create", interrupt_third_batch):
+            with self.assertRaises(KeyboardInterrupt):
+                self._import("books.jsonl", content, "--batch-size", "2")
+        # The third batch was rolled back with its checkpoint
+        self.assertEqual(sorted(Book.objects.values_list("title", flat=True)), ["title0", "title1", "title2"])
+        checkpoint = BookImportCheckpoint.objects.get()
+        self.assertEqual(checkpoint.line, 5)
+        self.assertEqual(checkpoint.offset, len("\n".join(lines[:3] + ["", "not json"])) + 1)
+
+        stdout, stderr = self._import("books.jsonl", content, "--batch-size", "2", "--resume")
+        self.assertEqual(sorted(Book.objects.values_list("title", flat=True)), [f"title{i}" for i in range(6)])
+        self.assertIn("Imported 3 books", stdout)
+        self.assertEqual(stderr, "")
+        self.assertFalse(BookImportCheckpoint.objects.exists())
+
+    def test_resume_csv_from_checkpoint(self):
+        content = "title,author,user\n" + "".join(f'title{i},"Doe,\nJohn",{self.user.id}\n' for i in range(3))
+        path = self.directory / "books.csv"
+        # After the first record, which spans lines 2 and 3
+        BookImportCheckpoint.objects.create(name=str(path.resolve()), offset=content.index("title1"), line=3)
+        content += "\n,Doe,1\n"
+        stdout, stderr = self._import("books.csv", content, "--resume")
+        self.assertEqual(sorted(Book.objects.values_list("title", flat=True)), ["title1", "title2"])
+        self.assertEqual(Book.objects.get(title="title1").author, "Doe,\nJohn")
+        self.assertIn("Line 9:", stderr)
+
+
+class BookListCacheTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.books = [make(Book, title=f"title{i}", user=self.user) for i in range(3)]
+
+    def _titles(self, params: dict = None) -> list[str]:
+        response = self.client.get(reverse("books-list"), params or {})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return sorted(book["title"] for book in response.data)
+
+    def test_list_is_served_from_cache(self):
+        self.assertEqual(self._titles({"ordering": "id", "title": "title", "q": ""}), ["title0", "title1", "title2"])
+        # Only the throttle's counter update
+        with self.assertNumQueries(1):
+            self.assertEqual(self._titles({"title": "title", "ordering": "id"}), ["title0", "title1", "title2"])
+
+    def test_saving_a_book_invalidates_lists(self):
+        self._titles()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.books[0].title = "renamed"
+            self.books[0].save()
+        self.assertEqual(self._titles(), ["renamed", "title1", "title2"])
+
+    def test_bulk_changes_invalidate_lists_once(self):
+        url = reverse("books-bulk-create")
+        self._titles()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(url, data={"ids": [self.books[0].id], "values": {"title": "renamed"}}, format="json")
+        self.assertEqual(self._titles(), ["renamed", "title1", "title2"])
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.client.delete(url, data={"ids": [book.id for book in self.books]}, format="json")
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(self._titles(), [])
+
+
+class BookListSerializationTestCase(BaseTestCase):
+    def test_list_matches_serializer_output(self):
+        make(Book, title='Ąžuolas "quoted" </script>', author="Ž. Šatas", user=self.user)
+        make(Book, _quantity=4, user=self.user)
+        response = self.client.get(reverse("books-list"), {"ordering": "id"}, HTTP_ACCEPT="application/json")
+        expected = BookListSerializer(Book.objects.order_by("id"), many=True).data
+        self.assertEqual(response.content, JSONRenderer().render(expected))
+
+        params = {"ordering": "-title", "items_per_page": 2, "page_number": 2}
+        response = self.client.get(reverse("books-list"), params, HTTP_ACCEPT="application/json")
+        books = Book.objects.order_by("-title")[2:4]
+        expected = {**response.data, "results": BookListSerializer(books, many=True).data}
+        self.assertEqual(response.content, JSONRenderer().render(expected))
+
+
+class AsyncBookViewsTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.books = [make(Book, title=f"title{i}", user=self.user) for i in range(3)]
+        self.other_book = make(Book, user=self.user2)
+        token = MyTokenObtainPairSerializer.get_token(self.user).access_token
+        self.headers = {"Authorization": f"Bearer {token}", "Accept": "application/json"}
+        token = MyTokenObtainPairSerializer.get_token(self.user2).access_token
+        self.user2_headers = {"Authorization": f"Bearer {token}"}
+
+    async def test_list_matches_sync_view(self):
+        for params in ({"ordering": "id"}, {"items_per_page": 2, "page_number": 2, "ordering": "title"},
+                       {"pagination": "cursor", "items_per_page": 2}):
+            response = await self.async_client.get(reverse("async-books-list"), params, headers=self.headers)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            expected = await sync_to_async(self.client.get)(reverse("books-list"), params, headers=self.headers)
+            self.assertEqual(response.content.replace(b"/async", b""), expected.content)
+
+    async def test_retrieve(self):
+        for book_id, status_code in ((self.books[0].id, status.HTTP_200_OK), (self.other_book.id,
+                                     status.HTTP_403_FORBIDDEN), (987654, status.HTTP_404_NOT_FOUND)):
+            response = await self.async_client.get(reverse("async-books-detail", args=[book_id]), headers=self.headers)
+            self.assertEqual(response.status_code, status_code)
+        response = await self.async_client.get(reverse("async-books-detail", args=[self.books[0].id]),
+                                               headers=self.headers)
+        self.assertEqual(response.json(), BookSerializer(self.books[0]).data)
+
+    async def test_create(self):
+        data = {"title": "async", "author": "author", "user": self.user2.id}
+        response = await self.async_client.post(reverse("async-books-list"), data, content_type="application/json",
+                                                headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(await Book.objects.filter(title="async", user=self.user2).aexists())
+        response = await self.async_client.post(reverse("async-books-list"), {**data, "user": 987654},
+                                                content_type="application/json", headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json(), {"user": ['Invalid pk "987654" - object does not exist.']})
+
+    async def test_throttled_requests(self):
+        with patch.object(SharedScopedRateThrottle, "THROTTLE_RATES", {"books": "1/minute"}):
+            response = await self.async_client.get(reverse("async-books-list"), headers=self.headers)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            response = await self.async_client.get(reverse("async-books-list"), headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn("Retry-After", response)
+
+    async def test_token_requests_need_no_csrf_token(self):
+        client = AsyncClient(enforce_csrf_checks=True)
+        data = {"title": "csrf", "author": "author", "user": self.user.id}
+        response = await client.post(reverse("async-books-list"), data, content_type="application/json",
+                                     headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        # Session authentication still enforces CSRF
+        await sync_to_async(client.force_login)(self.user)
+        response = await client.post(reverse("async-books-list"), data, content_type="application/json")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertIn("CSRF", response.json()["detail"])
+
+    async def test_authentication_and_permissions(self):
+        response = await self.async_client.get(reverse("async-books-list"))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        response = await self.async_client.get(reverse("async-books-list"), headers=self.user2_headers)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        response = await self.async_client.delete(reverse("async-books-list"), headers=self.headers)
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+
+class RequestMetricsTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        metrics_registry.clear()
+        make(Book, user=self.user, _quantity=3)
+
+    @override_settings(METRICS_SERVER_TIMING=True)
+    def test_server_timing_header(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse("books-list"))
+        timings = dict(entry.split(";", 1) for entry in response["Server-Timing"].split(", "))
+        self.assertEqual(list(timings), ["db", "serializer", "permissions", "total"])
+        self.assertIn(f'desc="{len(context.captured_queries)} queries"', timings["db"])
+        with self.settings(METRICS_SERVER_TIMING=False):
+            self.assertNotIn("Server-Timing", self.client.get(reverse("books-list")))
+
+    @override_settings(METRICS_SERVER_TIMING=True)
+    def test_async_views_are_measured(self):
+        self.client.force_authenticate(None)
+        token = str(RefreshToken.for_user(self.user).access_token)
+        response = async_to_sync(self.async_client.get)(
+            reverse("async-books-list"), headers={"authorization": f"Bearer {token}"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('desc="0 queries"', response["Server-Timing"])
+
+    def test_metrics_endpoint(self):
+        for _ in range(3):
+            self.client.get(reverse("books-list"))
+        self.client.get(reverse("users-list"))
+        with self.settings(DEBUG=True):
+            response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        body = response.content.decode()
+        worker = f'worker="{os.getpid()}"'
+        labels = f'{worker},method="GET",endpoint="books-list"'
+        self.assertIn("# TYPE http_request_duration_seconds summary", body)
+        self.assertIn(f"http_request_duration_seconds_count{{{labels}}} 3", body)
+        self.assertIn(f'http_request_db_queries{{{labels},quantile="0.99"}}', body)
+        self.assertIn(f"http_request_serializer_duration_seconds_count{{{labels}}} 3", body)
+        users_labels = f'{worker},method="GET",endpoint="users-list"'
+        self.assertIn(f"http_request_permission_duration_seconds_count{{{users_labels}}} 1", body)
+        self.assertIn(f"login_password_rejected_total{{{worker}}} 0", body)
+        # Every sample names the worker it comes from
+        samples = [line for line in body.splitlines() if not line.startswith("#")]
+        self.assertTrue(all(f"{{{worker}" in line for line in samples))
+
+    def test_metrics_token(self):
+        # Without a token, the metrics are only served with DEBUG
+        self.assertEqual(self.client.get("/metrics").status_code, status.HTTP_404_NOT_FOUND)
+        with self.settings(METRICS_TOKEN="secret"):
+            self.assertEqual(self.client.get("/metrics").status_code, status.HTTP_401_UNAUTHORIZED)
+            response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer secret")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_histogram_quantiles(self):
+        histogram = Histogram(0.001, 10)
+        for milliseconds in range(1, 101):
+            histogram.observe(milliseconds / 1000)
+        self.assertEqual(histogram.count, 100)
+        self.assertAlmostEqual(histogram.total, 5.05)
+        for q, expected in ((0.5, 0.05), (0.95, 0.095), (0.99, 0.099)):
+            # Within one bucket (19%) above the exact value
+            self.assertGreaterEqual(histogram.quantile(q), expected)
+            self.assertLessEqual(histogram.quantile(q), expected * 1.19)
+        self.assertEqual(Histogram(0.001, 10).quantile(0.5), 0.0)
+
+
+class BookStatsTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse("books-stats")
+
+    def assertStatsMatchBooks(self):
+        books = Book.objects.order_by()
+        expected = books.values("user_id").annotate(book_count=Count("pk"), newest=Max("publication_date"))
+        self.assertCountEqual(
+            BookStats.objects.values_list("user_id", "book_count", "newest_publication_date"),
+            [(row["user_id"], row["book_count"], row["newest"]) for row in expected],
+        )
+        expected = books.filter(publication_date__isnull=False).annotate(year=ExtractYear("publication_date")).values(
+            "user_id", "year"
+        ).annotate(book_count=Count("pk"), newest=Max("publication_date"))
+        self.assertCountEqual(
+            YearlyBookStats.objects.values_list("user_id", "year", "book_count", "newest_publication_date"),
+            [(row["user_id"], row["year"], row["book_count"], row["newest"]) for row in expected],
+        )
+
+    def test_stats_follow_book_changes(self):
+        for publication_date in (date(2001, 5, 1), date(2001, 7, 1), date(2003, 1, 1), None):
+            response = self.client.post(reverse("books-list"), data={
+                "title": "title", "author": "author", "publication_date": publication_date, "user": self.user.id,
+            }, format="json")
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), {
+            "user": self.user.id, "book_count": 4, "newest_publication_date": "2003-01-01",
+            "years": [{"year": 2003, "book_count": 1, "newest_publication_date": "2003-01-01"},
+                      {"year": 2001, "book_count": 2, "newest_publication_date": "2001-07-01"}],
+        })
+
+        newest = Book.objects.get(publication_date=date(2003, 1, 1))
+        response = self.client.patch(reverse("books-detail", args=[newest.pk]), data={"publication_date": "2001-06-01"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertStatsMatchBooks()
+        self.assertEqual(BookStats.objects.get(user=self.user).newest_publication_date, date(2001, 7, 1))
+        self.assertFalse(YearlyBookStats.objects.filter(year=2003).exists())
+
+        self.client.delete(reverse("books-detail", args=[Book.objects.get(publication_date=date(2001, 7, 1)).pk]))
+        self.assertStatsMatchBooks()
+        self.assertEqual(YearlyBookStats.objects.get(user=self.user).newest_publication_date, date(2001, 6, 1))
+
+        book = Book.objects.get(publication_date=None)
+        book.user = self.user2
+        book.save()
+        book.title = "renamed"
+        book.save(update_fields=["title"])
+        self.assertStatsMatchBooks()
+
+        Book.objects.filter(user=self.user).delete()
+        self.assertStatsMatchBooks()
+        self.assertEqual(self.client.get(self.url).json()["book_count"], 0)
+
+    def test_stats_follow_bulk_changes(self):
+        url = reverse("books-bulk-create")
+        items = [{"title": f"title{i}", "author": "author", "user": (self.user, self.user2)[i % 2].id,
+                  "publication_date": f"{2000 + i % 3}-01-0{1 + i % 5}"} for i in range(10)]
+        self.client.post(url, data=items, format="json")
+        self.assertStatsMatchBooks()
+        response = self.client.patch(url, data={"filter": {"date_from": "2002-01-01"},
+                                                "values": {"publication_date": "1999-12-31"}}, format="json")
+        # Only the books of the user
+        self.assertEqual(response.data["updated"], 2)
+        self.assertStatsMatchBooks()
+        self.client.delete(url, data={"filter": {"date_to": "2000-12-31"}}, format="json")
+        self.assertStatsMatchBooks()
+        self.assertEqual(BookStats.objects.get(user=self.user).book_count, 1)
+
+    def test_import_updates_stats(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = Path(directory.name) / "books.jsonl"
+        path.write_text("\n".join(
+            json.dumps({"title": f"title{i}", "author": "author", "user": self.user.id,
+                        "publication_date": f"20{i}0-01-01"})
+            for i in range(5)
+        ))
+        call_command("import_books", str(path), stdout=StringIO())
+        self.assertStatsMatchBooks()
+
+    def test_deleting_a_user_deletes_their_stats(self):
+        make(Book, user=self.user2, publication_date=date(2000, 1, 1), _quantity=3)
+        self.user2.delete()
+        self.assertFalse(BookStats.objects.filter(user_id=self.user2.id).exists())
+        self.assertStatsMatchBooks()
+
+    def test_reading_stats_does_not_depend_on_the_number_of_books(self):
+        make(Book, user=self.user2, publication_date=date(2000, 1, 1))
+        # Caches the permissions of the user
+        self.client.get(self.url, {"user": self.user2.id})
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(self.url, {"user": self.user2.id})
+        Book.objects.bulk_create([Book(title="title", author="author", user=self.user2,
+                                       publication_date=date(2000 + i % 20, 1, 1)) for i in range(200)])
+        with CaptureQueriesContext(connection) as larger:
+            response = self.client.get(self.url, {"user": self.user2.id})
+        self.assertEqual(len(larger.captured_queries), len(context.captured_queries))
+        # bulk_create sends no signals, so the stats are out of date until rebuilt
+        self.assertEqual(response.data["book_count"], 1)
+        stdout = StringIO()
+        call_command("rebuild_book_stats", stdout=stdout)
+        self.assertIn("Rebuilt the statistics of 1 users (20 user-years)", stdout.getvalue())
+        self.assertStatsMatchBooks()
+        self.assertEqual(self.client.get(self.url, {"user": self.user2.id}).data["book_count"], 201)
+
+    def test_stats_of_unknown_user(self):
+        self.assertEqual(self.client.get(self.url, {"user": 987654}).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.client.get(self.url, {"user": "me"}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.client.force_authenticate(self.user2)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_403_FORBIDDEN)
+
+
+class BookFacetsTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse("books-facets")
+        for author, publication_date in (("Tolkien", date(1954, 7, 29)), ("Tolkien", date(1937, 9, 21)),
+                                         ("Tolkien", None), ("Herbert", date(1965, 8, 1)),
+                                         ("Le Guin", date(1969, 3, 1)), ("Le Guin", date(1937, 1, 1))):
+            make(Book, title=f"{author} title", author=author, publication_date=publication_date, user=self.user)
+
+    def test_facets_in_one_query(self):
+        self.client.get(self.url)
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), {
+            "count": 6,
+            "authors": [{"author": "Tolkien", "count": 3}, {"author": "Le Guin", "count": 2},
+                        {"author": "Herbert", "count": 1}],
+            "years": [{"year": 1969, "count": 1}, {"year": 1965, "count": 1}, {"year": 1954, "count": 1},
+                      {"year": 1937, "count": 2}, {"year": None, "count": 1}],
+        })
+        facet_queries = [query for query in context.captured_queries if "facet_year" in query["sql"]]
+        self.assertEqual(len(facet_queries), 1)
+
+    def test_facets_follow_the_filters(self):
+        response = self.client.get(self.url, {"date_to": "1960-01-01", "title": "title"})
+        self.assertEqual(response.data["count"], 3)
+        self.assertEqual([row["author"] for row in response.data["authors"]], ["Tolkien", "Le Guin"])
+        self.assertEqual(response.data["years"], [{"year": 1954, "count": 1}, {"year": 1937, "count": 2}])
+        response = self.client.get(self.url, {"q": "herbert"})
+        self.assertEqual(response.data["authors"], [{"author": "Herbert", "count": 1}])
+        response = self.client.get(self.url, {"title": "nothing"})
+        self.assertEqual(response.data, {"count": 0, "authors": [], "years": []})
+
+    def test_most_frequent_authors_only(self):
+        with self.settings(BOOKS_FACETS_AUTHORS_LIMIT=2):
+            response = self.client.get(self.url)
+        self.assertEqual([row["author"] for row in response.data["authors"]], ["Tolkien", "Le Guin"])
+        self.assertEqual(len(response.data["years"]), 5)
+
+    def test_facets_are_cached_until_books_change(self):
+        self.client.get(self.url, {"title": "title"})
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url, {"title": "title"})
+        self.assertFalse([query for query in context.captured_queries if "facet_year" in query["sql"]])
+        self.assertEqual(response.data["count"], 6)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("books-list"), data={"title": "title", "author": "Herbert", "user": self.user.id})
+        self.assertEqual(self.client.get(self.url, {"title": "title"}).data["count"], 7)
+
+    def test_facets_without_permission(self):
+        self.client.force_authenticate(self.user2)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_403_FORBIDDEN)
+
+
+# Not within a TestCase transaction, which would keep every read on the primary
+@override_settings(DATABASE_REPLICAS=["replica_1"])
+class ReplicaRouterTestCase(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+
+    def _route(self, request) -> tuple[str, HttpResponse]:
+        """Returns the database the books of the request are read from, and the response."""
+        databases = []
+
+        def get_response(request):
+            databases.append(Book.objects.all().db)
+            with transaction.atomic():
+                databases.append(Book.objects.all().db)
+            return HttpResponse()
+
+        response = ReplicaRoutingMiddleware(get_response)(request)
+        # Reads within a transaction on the primary stay there
+        self.assertEqual(databases[1], "default")
+        return databases[0], response
+
+    def test_safe_requests_read_from_replicas(self):
+        database, response = self._route(self.factory.get("/books/"))
+        self.assertEqual(database, "replica_1")
+        self.assertNotIn(STICKY_COOKIE_NAME, response.cookies)
+        self.assertEqual(self._route(self.factory.head("/books/"))[0], "replica_1")
+
+    def test_reads_stick_to_the_primary_after_a_write(self):
+        database, response = self._route(self.factory.post("/books/"))
+        self.assertEqual(database, "default")
+        cookie = response.cookies[STICKY_COOKIE_NAME]
+        self.assertTrue(cookie["httponly"])
+        self.assertEqual(cookie["max-age"], 5)
+        request = self.factory.get("/books/")
+        request.COOKIES[STICKY_COOKIE_NAME] = cookie.value
+        self.assertEqual(self._route(request)[0], "default")
+        # Only signed cookies count
+        request.COOKIES[STICKY_COOKIE_NAME] = "1"
+        self.assertEqual(self._route(request)[0], "replica_1")
+
+    def test_async_requests(self):
+        async def get_response(request):
+            return HttpResponse(Book.objects.all().db)
+
+        middleware = ReplicaRoutingMiddleware(get_response)
+        self.assertEqual(async_to_sync(middleware)(self.factory.get("/books/")).content, b"replica_1")
+        response = async_to_sync(middleware)(self.factory.delete("/books/1/"))
+        self.assertEqual(response.content, b"default")
+        self.assertIn(STICKY_COOKIE_NAME, response.cookies)
+
+    def test_writes_and_migrations_go_to_the_primary(self):
+        router = ReplicaRouter()
+        self.assertEqual(Book.objects.all().db, "default")
+        self.assertEqual(router.db_for_write(Book), "default")
+        self.assertTrue(router.allow_migrate("default", "BooksApp"))
+        self.assertFalse(router.allow_migrate("replica_1", "BooksApp"))
+        user = User.objects.create_user(username="writer", password="writer")
+        user.user_permissions.add(Permission.objects.get(codename="add_book"))
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.post(reverse("books-list"), data={"title": "title", "author": "author", "user": user.id})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertIn(STICKY_COOKIE_NAME, response.cookies)
+
+    def test_shared_caches_are_not_filled_from_lagging_replicas(self):
+        # replica_1 is not a configured database, so any read sent to it fails: a replica with none of the rows
+        user = User.objects.create_user(username="reader", password="reader")
+        user.user_permissions.add(Permission.objects.get(codename="view_book"))
+        results = []
+
+        def get_response(request):
+            request = Request(request)
+            set_cached_list(request, ["stale"])
+            results.append(get_cached_list(request))
+            results.append(get_permission_snapshot(User.objects.using("default").get(pk=user.pk)))
+            return HttpResponse()
+
+        middleware = ReplicaRoutingMiddleware(get_response)
+        invalidate_book_lists()
+        middleware(self.factory.get("/books/"))
+        self.assertEqual(results, [None, {"BooksApp.view_book"}])
+        # Once the replicas have caught up with the change
+        with patch("BooksProject.db_router.time") as mock_time:
+            mock_time.time.return_value = time.time() + 5
+            middleware(self.factory.get("/books/"))
+        self.assertEqual(results[2], ["stale"])
+        # Reads from the primary are cached right away
+        invalidate_book_lists()
+        set_cached_list(Request(self.factory.get("/books/")), ["fresh"])
+        self.assertEqual(get_cached_list(Request(self.factory.get("/books/"))), ["fresh"])
+
+    def test_exports_stream_from_replicas(self):
+        user = User.objects.create_user(username="exporter", password="exporter")
+        user.user_permissions.add(Permission.objects.get(codename="view_book"))
+        client = APIClient()
+        client.force_authenticate(user)
+        # A second connection to the test database, as replica_1
+        connections.settings["replica_1"] = connections.settings["default"]
+        self.addCleanup(connections.settings.pop, "replica_1")
+        self.addCleanup(connections.__delitem__, "replica_1")
+        self.addCleanup(lambda: connections["replica_1"].close())
+        response = client.get(reverse("books-export"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # The rows are read while streaming, after the middleware is done
+        with CaptureQueriesContext(connections["replica_1"]) as context:
+            b"".join(response.streaming_content)
+        self.assertEqual(len(context.captured_queries), 1)
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas(self):
+        database, response = self._route(self.factory.get("/books/"))
+        self.assertEqual(database, "default")
+        self.assertNotIn(STICKY_COOKIE_NAME, self._route(self.factory.post("/books/"))[1].cookies)
@@ -1,5 +1,14 @@
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import router, transaction
+from django.db.models import QuerySet
+from django.http import StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema, OpenApiParameter
 from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.filters import SearchFilter, OrderingFilter
 from rest_framework.mixins import ListModelMixin, CreateModelMixin, RetrieveModelMixin, UpdateModelMixin, \
     DestroyModelMixin
@@ -7,18 +16,30 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet
 from rest_framework.request import Request
-from BooksApp.filters import BookFilter, CustomPageNumberPagination
-from BooksApp.models import Book
-from BooksApp.permissions import CustomObjectPermissions
-from BooksApp.serializers import BookSerializer, BookListSerializer
+from BooksApp.cache import get_cached_list, invalidate_book_lists, set_cached_list
+from BooksApp.filters import BookFilter, CustomPageNumberPagination, BookCursorPagination, count_book_facets
+from BooksApp.helpers import aiterate, bulk_insert_books, select_books, validate_books
+from BooksApp.models import Book, BookStats, YearlyBookStats
+from BooksApp.permissions import CustomObjectPermissions, filter_permitted_books
+from BooksApp.renderers import CSVRenderer, NDJSONRenderer
+from BooksApp.serializers import BookSerializer, BookListSerializer, serialize_book_rows, BookBulkCreateSerializer, \
+    BookBulkCreateResultSerializer, BookBulkSelectionSerializer, BookBulkUpdateSerializer, BookBulkResultSerializer, \
+    BookStatsSerializer, BookFacetsSerializer
+from BooksApp.stats import changes_for_date_update, changes_for_delete, record_book_changes
+from BooksProject.metrics import TimedPermissionsMixin, timed
+from UsersApp.models import User
 
 
-class BookViewSet(ListModelMixin, CreateModelMixin, RetrieveModelMixin, UpdateModelMixin, DestroyModelMixin,
-                  GenericViewSet):
+class BookViewSet(TimedPermissionsMixin, ListModelMixin, CreateModelMixin, RetrieveModelMixin, UpdateModelMixin,
+                  DestroyModelMixin, GenericViewSet):
     """
     This viewset is responsible for handling operations related to books.
     Authentication is handled through JWT tokens and is covered by
-    "rest_framework_simplejwt.authentication.JWTAuthentication".
+    "UsersApp.authentication.StatelessJWTAuthentication", which authorizes from the token claims.
+
+    The list is paginated by page number by default. Passing "pagination=cursor" (or a "cursor" returned by a
+    previous page) switches to keyset pagination, which skips COUNT(*) and OFFSET and so stays fast at any depth.
+    List responses are cached under a version that moves whenever a book changes (see BooksApp.cache).
     """
     permission_classes = [IsAuthenticated, CustomObjectPermissions]
     queryset = Book.objects.all()
@@ -26,15 +47,197 @@ class BookViewSet(ListModelMixin, CreateModelMixin, RetrieveModelMixin, UpdateMo
     filterset_class = BookFilter
     pagination_class = CustomPageNumberPagination
     filter_backends = (DjangoFilterBackend, SearchFilter, OrderingFilter)
+    search_fields = ["title", "author"]
     throttle_scope = "books"
+    export_fields = {"id": "id", "title": "title", "author": "author", "publication_date": "publication_date",
+                     "user": "user_id"}
+
+    @property
+    def paginator(self) -> CustomPageNumberPagination | BookCursorPagination:
+        if not hasattr(self, "_paginator"):
+            if self.request is not None and BookCursorPagination.is_requested(self.request):
+                self._paginator = BookCursorPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
 
     def get_serializer_class(self) -> BookSerializer:
         if self.action == "list":
             return BookListSerializer
+        if self.action == "bulk_create":
+            return BookBulkCreateSerializer
+        if self.action == "bulk_update":
+            return BookBulkUpdateSerializer
+        if self.action == "bulk_delete":
+            return BookBulkSelectionSerializer
         return BookSerializer
 
+    def get_list_rows(self) -> QuerySet:
+        """
+        Returns the filtered list as `.values()` rows, which are serialized directly by `serialize_book_rows`. The
+        ordering columns are fetched too, as the cursor pagination reads them.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        return queryset.values(*dict.fromkeys(BookListSerializer.Meta.fields + self._get_ordering_fields(queryset)))
+
+    @staticmethod
+    def _get_ordering_fields(queryset: QuerySet) -> list[str]:
+        fields = []
+        for term in queryset.query.order_by or queryset.model._meta.ordering:
+            if isinstance(term, str) and "__" not in term and term.lstrip("-") not in ("?", "pk"):
+                fields.append(term.lstrip("-"))
+        return fields
+
+    def list(self, request: Request, *args, **kwargs) -> Response:
+        data = get_cached_list(request)
+        if data is not None:
+            return Response(data)
+        rows = self.get_list_rows()
+        page = self.paginate_queryset(rows)
+        with timed("serializer"):
+            data = serialize_book_rows(rows if page is None else page)
+        response = Response(data) if page is None else self.get_paginated_response(data)
+        set_cached_list(request, response.data)
+        return response
+
     def create(self, request: Request, *args, **kwargs) -> Response:
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         serializer.save(user=serializer.validated_data["user"])
         return Response(data=[], status=status.HTTP_201_CREATED)
+
+    @extend_schema(
+        request=BookBulkCreateSerializer(many=True),
+        responses={status.HTTP_201_CREATED: BookBulkCreateResultSerializer},
+        description="Creates many books at once. Nothing is created unless every item is valid; errors are reported "
+                    "per item, in the order of the request.",
+    )
+    @action(detail=False, methods=["post"], url_path="bulk")
+    def bulk_create(self, request: Request) -> Response:
+        items = request.data
+        if not isinstance(items, list):
+            raise ValidationError({"non_field_errors": ["Expected a list of books."]})
+        if len(items) > settings.BOOKS_BULK_MAX_ITEMS:
+            raise ValidationError(
+                {"non_field_errors": [f"Ensure there are no more than {settings.BOOKS_BULK_MAX_ITEMS} books."]}
+            )
+        rows, errors = validate_books(items)
+        if any(errors):
+            raise ValidationError(errors)
+        return Response({"created": bulk_insert_books(rows)}, status=status.HTTP_201_CREATED)
+
+    def _get_bulk_selection(self, request: Request) -> tuple[dict, QuerySet, dict]:
+        """Validates a bulk update/delete request; returns its data, the permitted books it selects and a summary."""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        books = select_books(filter_permitted_books(request, Book.objects.all()), data.get("ids"), data.get("filter"))
+        summary = {"dry_run": data["dry_run"]}
+        if "ids" in data:
+            summary["requested"] = len(set(data["ids"]))
+        return data, books, summary
+
+    @extend_schema(
+        request=BookBulkUpdateSerializer,
+        responses={status.HTTP_200_OK: BookBulkResultSerializer},
+        description="Sets the same values on every selected book with a single UPDATE. Books the user may not change "
+                    "are left out of the selection; with \"dry_run\" only the matching books are counted.",
+    )
+    @bulk_create.mapping.patch
+    def bulk_update(self, request: Request) -> Response:
+        data, books, summary = self._get_bulk_selection(request)
+        if data["dry_run"]:
+            summary["matched"] = summary["updated"] = books.count()
+        else:
+            with transaction.atomic():
+                changes = None
+                if "publication_date" in data["values"]:
+                    changes = changes_for_date_update(books, data["values"]["publication_date"])
+                summary["matched"] = summary["updated"] = books.update(**data["values"])
+                # QuerySet.update() sends no signals
+                invalidate_book_lists()
+                if changes is not None:
+                    record_book_changes(changes)
+        return Response(summary)
+
+    @extend_schema(
+        request=BookBulkSelectionSerializer,
+        responses={status.HTTP_200_OK: BookBulkResultSerializer},
+        description="Deletes every selected book with a single DELETE. Books the user may not delete are left out of "
+                    "the selection; with \"dry_run\" only the matching books are counted.",
+    )
+    @bulk_create.mapping.delete
+    def bulk_delete(self, request: Request) -> Response:
+        data, books, summary = self._get_bulk_selection(request)
+        if data["dry_run"]:
+            summary["matched"] = summary["deleted"] = books.count()
+        else:
+            with transaction.atomic():
+                changes = changes_for_delete(books)
+                # A single DELETE, without loading the books for the signals. It bypasses the deletion Collector,
+                # which is only right while no model refers to books (see test_bulk_delete_skips_no_relations)
+                summary["matched"] = summary["deleted"] = books._raw_delete(books.db)
+                invalidate_book_lists()
+                record_book_changes(changes)
+        return Response(summary)
+
+    @extend_schema(
+        filters=True,
+        responses={status.HTTP_200_OK: BookFacetsSerializer},
+        description="Counts the books matching the filters (the same as the list's) by author and by publication "
+                    "year, for filter sidebars. All counts come from one grouped query, and are cached like lists.",
+    )
+    @action(detail=False, methods=["get"])
+    def facets(self, request: Request) -> Response:
+        data = get_cached_list(request)
+        if data is None:
+            facets = count_book_facets(self.filter_queryset(self.get_queryset()), settings.BOOKS_FACETS_AUTHORS_LIMIT)
+            with timed("serializer"):
+                data = BookFacetsSerializer(facets).data
+            set_cached_list(request, data)
+        return Response(data)
+
+    @extend_schema(
+        parameters=[OpenApiParameter("user", int, description="Defaults to the current user.")],
+        responses={status.HTTP_200_OK: BookStatsSerializer},
+        description="Number of books of a user and newest publication date, in total and per publication year. They "
+                    "are maintained as books change, so reading them costs the same whatever the number of books.",
+    )
+    @action(detail=False, methods=["get"])
+    def stats(self, request: Request) -> Response:
+        user_id = request.query_params.get("user", request.user.pk)
+        try:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            raise ValidationError({"user": ["A valid integer is required."]})
+        stats = BookStats.objects.filter(user_id=user_id).values("book_count", "newest_publication_date").first()
+        if stats is None:
+            if not User.objects.filter(pk=user_id).exists():
+                raise NotFound()
+            stats, years = {"book_count": 0, "newest_publication_date": None}, []
+        else:
+            years = YearlyBookStats.objects.filter(user_id=user_id).values(
+                "year", "book_count", "newest_publication_date"
+            )
+        return Response(BookStatsSerializer({"user": user_id, **stats, "years": years}).data)
+
+    @extend_schema(
+        parameters=[OpenApiParameter("format", str, enum=["csv", "ndjson"], description="Defaults to CSV.")],
+        responses={(status.HTTP_200_OK, "text/csv"): OpenApiTypes.STR,
+                   (status.HTTP_200_OK, "application/x-ndjson"): OpenApiTypes.STR},
+        description="Streams every book matching the filters, in the requested ordering, as CSV or NDJSON. Rows are "
+                    "read through a server-side cursor, so the export is not paginated and memory use stays flat "
+                    "(under WSGI and ASGI alike).",
+    )
+    @action(detail=False, methods=["get"], renderer_classes=[CSVRenderer, NDJSONRenderer])
+    def export(self, request: Request) -> StreamingHttpResponse:
+        renderer = request.accepted_renderer
+        # The rows are read while the response is streamed, after the request's database routing has ended
+        queryset = self.filter_queryset(self.get_queryset()).using(router.db_for_read(Book))
+        rows = queryset.values_list(*self.export_fields.values()).iterator(chunk_size=settings.BOOKS_EXPORT_CHUNK_SIZE)
+        content = renderer.stream(list(self.export_fields), rows, chunk_size=settings.BOOKS_EXPORT_CHUNK_SIZE)
+        if isinstance(request._request, ASGIRequest):
+            content = aiterate(content)
+        response = StreamingHttpResponse(content, content_type=f"{renderer.media_type}; charset={renderer.charset}")
+        response["Content-Disposition"] = f'attachment; filename="books.{renderer.format}"'
+        return response
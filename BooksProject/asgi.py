@@ -14,3 +14,10 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'BooksProject.settings')
 
 application = get_asgi_application()
+
+from django.conf import settings  # noqa: E402
+
+if settings.PRECOMPUTE_SCHEMA_ON_STARTUP:
+    from BooksProject.schema import PrecomputedSpectacularAPIView  # noqa: E402
+
+    PrecomputedSpectacularAPIView.warm()
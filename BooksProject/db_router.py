@@ -0,0 +1,122 @@
+"""
+Read replicas. Requests with a safe method (GET, HEAD, OPTIONS) read from one of DATABASE_REPLICAS, and everything
+else uses the primary ("default"): writes, reads of unsafe requests, reads within a transaction on the primary, and
+code running outside a request (management commands, the shell).
+
+Replicas lag behind the primary, so a client that has just written could read stale rows from them. After an unsafe
+request, the client is given a signed cookie that keeps its reads on the primary for DATABASE_REPLICA_STICKY_SECONDS,
+longer than the replication lag is expected to be. Clients that do not keep cookies read from the replicas again
+right away.
+
+Shared caches outlive the request and are read by every client, so they must not keep the rows of a replica that has
+not caught up yet: caches filled in the background of a request (permissions) read from the primary with
+`primary_reads()`, and versioned caches (book lists) are not filled from replica reads until
+DATABASE_REPLICA_STICKY_SECONDS after their version changed (see `replica_reads_may_lag()`).
+"""
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.http import HttpRequest, HttpResponse
+
+STICKY_COOKIE_NAME = "primary_reads"
+STICKY_COOKIE_SALT = "BooksProject.db_router"
+
+# Whether the reads of the current request may go to a replica; outside requests they never do
+_replica_reads: ContextVar[bool] = ContextVar("replica_reads", default=False)
+
+
+@contextmanager
+def primary_reads():
+    """Sends the reads of the block to the primary, e.g. to fill a cache shared with clients that just wrote."""
+    token = _replica_reads.set(False)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def replica_reads_may_lag(changed_at: float) -> bool:
+    """
+    Whether reads of the current request may come from a replica that has not yet received a change made at
+    `changed_at` (a `time.time()`).
+    """
+    return (
+        bool(settings.DATABASE_REPLICAS) and _replica_reads.get()
+        and time.time() - changed_at < settings.DATABASE_REPLICA_STICKY_SECONDS
+    )
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints) -> str:
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas or not _replica_reads.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            # Reads within a transaction must see its writes (and take its locks)
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints) -> str:
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints) -> bool | None:
+        # Replicas hold the same rows as the primary
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db: str, app_label: str, model_name: str = None, **hints) -> bool:
+        # Replicas receive the schema from the primary
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ReplicaRoutingMiddleware:
+    """Lets the reads of safe requests go to the replicas, unless the client wrote recently (see the module docs)."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        if self.async_mode:
+            return self.__acall__(request)
+        token = _replica_reads.set(self.reads_from_replicas(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            _replica_reads.reset(token)
+        return self.finish(request, response)
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        token = _replica_reads.set(self.reads_from_replicas(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            _replica_reads.reset(token)
+        return self.finish(request, response)
+
+    @staticmethod
+    def reads_from_replicas(request: HttpRequest) -> bool:
+        if not settings.DATABASE_REPLICAS or request.method not in ("GET", "HEAD", "OPTIONS"):
+            return False
+        sticky = request.get_signed_cookie(
+            STICKY_COOKIE_NAME, default=None, salt=STICKY_COOKIE_SALT, max_age=settings.DATABASE_REPLICA_STICKY_SECONDS
+        )
+        return sticky is None
+
+    @staticmethod
+    def finish(request: HttpRequest, response: HttpResponse) -> HttpResponse:
+        if settings.DATABASE_REPLICAS and request.method not in ("GET", "HEAD", "OPTIONS"):
+            response.set_signed_cookie(
+                STICKY_COOKIE_NAME, "1", salt=STICKY_COOKIE_SALT, max_age=settings.DATABASE_REPLICA_STICKY_SECONDS,
+                secure=request.is_secure(), httponly=True, samesite="Lax",
+            )
+        return response
@@ -0,0 +1,290 @@
+"""
+Per-request instrumentation: the number and duration of database queries, the time spent serializing and checking
+permissions, and the total time of every request. They are aggregated per endpoint into histograms served in the
+Prometheus text format by `metrics_view`, and with METRICS_SERVER_TIMING (on with DEBUG) each response reports them in
+a Server-Timing header.
+
+Metrics are kept in the memory of each process, and a scrape only reports the worker that served it: every series
+carries a `worker` label (the process id) so that workers are never mistaken for each other, but /metrics is only
+complete with a single worker, or when each worker is scraped on its own (for instance on its own port).
+Recording costs a context variable lookup per query and a few additions per request, so it can stay on in production.
+The queries of streamed response bodies run after the response has been returned, so they are not counted.
+"""
+import bisect
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import Http404, HttpRequest, HttpResponse
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_GET
+from rest_framework.request import Request
+
+SECTIONS = ("serializer", "permissions")
+
+
+class RequestMetrics:
+    __slots__ = ("started", "db_queries", "db_time", "sections")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.sections = dict.fromkeys(SECTIONS, 0.0)
+
+
+_current_metrics: ContextVar[RequestMetrics | None] = ContextVar("request_metrics", default=None)
+
+
+@contextmanager
+def timed(section: str):
+    """Adds the time spent in the block to a section ("serializer" or "permissions") of the current request."""
+    metrics = _current_metrics.get()
+    if metrics is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.sections[section] += time.perf_counter() - started
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper counting the queries of the current request and their time."""
+    metrics = _current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_queries += 1
+        metrics.db_time += time.perf_counter() - started
+
+
+def install_query_recorder(connection, **kwargs) -> None:
+    # Wrappers are kept by connection objects across reconnections, and connections are per thread: install once each
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+connection_created.connect(install_query_recorder)
+
+
+class Histogram:
+    """
+    Observations counted in logarithmic buckets (four per doubling, so about 19% wide): recording takes constant
+    memory however many values are observed, and quantiles are estimated to within one bucket.
+    """
+    quantiles = (0.5, 0.95, 0.99)
+
+    def __init__(self, smallest: float, largest: float, buckets_per_doubling: int = 4):
+        size = math.ceil(math.log2(largest / smallest) * buckets_per_doubling) + 1
+        self.bounds = [smallest * 2 ** (index / buckets_per_doubling) for index in range(size)]
+        # The last bucket counts values above the largest bound
+        self.counts = [0] * (size + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        """Returns the upper bound of the bucket holding the q-quantile, capped by the largest value observed."""
+        rank = q * self.count
+        cumulative = 0
+        for index, count in enumerate(self.counts):
+            cumulative += count
+            if count and cumulative >= rank:
+                return min(self.bounds[index], self.max) if index < len(self.bounds) else self.max
+        return 0.0
+
+
+class EndpointMetrics:
+    def __init__(self):
+        self.duration = Histogram(0.0001, 100)
+        self.db_queries = Histogram(1, 10000)
+        self.db_duration = Histogram(0.0001, 100)
+        self.sections = {section: Histogram(0.0001, 100) for section in SECTIONS}
+
+    def observe(self, metrics: RequestMetrics, duration: float) -> None:
+        self.duration.observe(duration)
+        self.db_queries.observe(metrics.db_queries)
+        self.db_duration.observe(metrics.db_time)
+        for section, seconds in metrics.sections.items():
+            self.sections[section].observe(seconds)
+
+
+class MetricsRegistry:
+    """Histograms per (method, endpoint), where the endpoint is the URL name, so the number of series is bounded."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.endpoints: dict[tuple[str, str], EndpointMetrics] = {}
+
+    def observe(self, method: str, endpoint: str, metrics: RequestMetrics, duration: float) -> None:
+        with self._lock:
+            endpoint_metrics = self.endpoints.get((method, endpoint))
+            if endpoint_metrics is None:
+                endpoint_metrics = self.endpoints[(method, endpoint)] = EndpointMetrics()
+            endpoint_metrics.observe(metrics, duration)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.endpoints = {}
+
+    def render(self) -> str:
+        """Renders the histograms as Prometheus summaries (quantiles, sum and count), labelled with the worker."""
+        families = [
+            ("http_request_duration_seconds", "Total time of requests.", lambda m: m.duration),
+            ("http_request_db_queries", "Database queries per request.", lambda m: m.db_queries),
+            ("http_request_db_duration_seconds", "Time of the database queries of requests.", lambda m: m.db_duration),
+            ("http_request_serializer_duration_seconds", "Time spent serializing responses.",
+             lambda m: m.sections["serializer"]),
+            ("http_request_permission_duration_seconds", "Time spent checking permissions.",
+             lambda m: m.sections["permissions"]),
+        ]
+        lines = []
+        worker = _worker_label()
+        with self._lock:
+            endpoints = sorted(self.endpoints.items())
+            for name, description, get_histogram in families:
+                lines += [f"# HELP {name} {description}", f"# TYPE {name} summary"]
+                for (method, endpoint), endpoint_metrics in endpoints:
+                    histogram = get_histogram(endpoint_metrics)
+                    labels = f'{worker},method="{_escape(method)}",endpoint="{_escape(endpoint)}"'
+                    for q in histogram.quantiles:
+                        lines.append(f'{name}{{{labels},quantile="{q}"}} {_format(histogram.quantile(q))}')
+                    lines.append(f"{name}_sum{{{labels}}} {_format(histogram.total)}")
+                    lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+metrics_registry = MetricsRegistry()
+
+
+def _worker_label() -> str:
+    # Read on every render, as forking servers load the application before starting their workers
+    return f'worker="{os.getpid()}"'
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format(value: float) -> str:
+    return f"{value:.6g}"
+
+
+class RequestMetricsMiddleware:
+    """
+    Measures every request (it should come first in MIDDLEWARE, so that the total covers the other middleware), adds
+    the Server-Timing header when METRICS_SERVER_TIMING is set and records the request in `metrics_registry`.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        for connection in connections.all(initialized_only=True):
+            install_query_recorder(connection)
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        if self.async_mode:
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current_metrics.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_metrics.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request: HttpRequest) -> HttpResponse:
+        metrics = RequestMetrics()
+        token = _current_metrics.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_metrics.reset(token)
+        return self.finish(request, response, metrics)
+
+    @staticmethod
+    def finish(request: HttpRequest, response: HttpResponse, metrics: RequestMetrics) -> HttpResponse:
+        duration = time.perf_counter() - metrics.started
+        if settings.METRICS_SERVER_TIMING:
+            entries = [f'db;dur={metrics.db_time * 1000:.2f};desc="{metrics.db_queries} queries"']
+            entries += [f"{section};dur={seconds * 1000:.2f}" for section, seconds in metrics.sections.items()]
+            entries.append(f"total;dur={duration * 1000:.2f}")
+            response["Server-Timing"] = ", ".join(entries)
+        match = request.resolver_match
+        endpoint = (match.view_name or match.route) if match else "unmatched"
+        metrics_registry.observe(request.method, endpoint, metrics, duration)
+        return response
+
+
+class TimedPermissionsMixin:
+    """Adds the permission checks of an APIView to the "permissions" time of the request."""
+
+    def check_permissions(self, request: Request) -> None:
+        with timed("permissions"):
+            super().check_permissions(request)
+
+    def check_object_permissions(self, request: Request, obj) -> None:
+        with timed("permissions"):
+            super().check_object_permissions(request, obj)
+
+
+def _render_login_metrics() -> str:
+    from UsersApp.login import password_verifier
+
+    login = password_verifier.metrics()
+    labels = f"{{{_worker_label()}}}"
+    lines = []
+    for name, description, key in (
+        ("login_password_queue_wait_seconds", "Time logins waited for a hashing thread.", "queue_wait_seconds"),
+        ("login_password_hash_seconds", "Time spent hashing login passwords.", "hash_seconds"),
+    ):
+        lines += [f"# HELP {name} {description}", f"# TYPE {name} summary",
+                  f"{name}_sum{labels} {_format(login[key]['sum'])}", f"{name}_count{labels} {login[key]['count']}"]
+    lines += [
+        "# HELP login_password_in_flight Logins hashing or waiting for a thread.",
+        "# TYPE login_password_in_flight gauge",
+        f"login_password_in_flight{labels} {login['in_flight']}",
+        "# HELP login_password_rejected_total Logins refused with 503 because the hashing queue was full.",
+        "# TYPE login_password_rejected_total counter",
+        f"login_password_rejected_total{labels} {login['rejected']}",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+@require_GET
+def metrics_view(request: HttpRequest) -> HttpResponse:
+    """
+    Serves the metrics of the worker process handling the request in the Prometheus text format; requires
+    METRICS_TOKEN as a bearer token, and is not found without one unless DEBUG is on.
+    """
+    if settings.METRICS_TOKEN:
+        expected = f"Bearer {settings.METRICS_TOKEN}"
+        if not constant_time_compare(request.META.get("HTTP_AUTHORIZATION", ""), expected):
+            return HttpResponse(status=401, headers={"WWW-Authenticate": "Bearer"})
+    elif not settings.DEBUG:
+        raise Http404
+    body = metrics_registry.render() + _render_login_metrics()
+    return HttpResponse(body, content_type="text/plain; version=0.0.4; charset=utf-8")
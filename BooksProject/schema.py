@@ -0,0 +1,115 @@
+import gzip
+import hashlib
+import threading
+from pathlib import Path
+
+import yaml
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from drf_spectacular.views import SpectacularAPIView
+from rest_framework.request import Request
+
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    """Whether an Accept-Encoding header allows gzip: named, or matched by "*", with a non-zero q-value."""
+    qualities = {}
+    for item in accept_encoding.split(","):
+        coding, *params = (part.strip() for part in item.split(";"))
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.lower()] = quality
+    return qualities.get("gzip", qualities.get("*", 0.0)) > 0
+
+
+class SchemaDocument:
+    """A rendered schema with its gzip compression and the ETags of both."""
+
+    def __init__(self, body: bytes, content_type: str):
+        self.body = body
+        self.gzipped_body = gzip.compress(body, compresslevel=9, mtime=0)
+        self.content_type = content_type
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        self.etag = f'"{digest}"'
+        self.gzipped_etag = f'"{digest}-gzip"'
+
+
+class PrecomputedSpectacularAPIView(SpectacularAPIView):
+    """
+    Serves the OpenAPI schema without introspecting the API on every request. The schema is generated once per
+    process (at startup, see `warm()`, or on the first request), or loaded from PRECOMPUTED_SCHEMA_FILE when set:
+
+        python manage.py spectacular --format openapi-json --file schema.json
+
+    Each format is rendered and gzipped once, and served with a content hash ETag so that clients revalidating with
+    If-None-Match get a 304. Requests for another language or API version fall back to generating the schema.
+    """
+    _schema = None
+    _documents: dict[type, SchemaDocument] = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_schema(cls) -> dict:
+        if cls._schema is None:
+            with cls._lock:
+                if cls._schema is None:
+                    cls._schema = cls._load_schema()
+        return cls._schema
+
+    @classmethod
+    def _load_schema(cls) -> dict:
+        if settings.PRECOMPUTED_SCHEMA_FILE:
+            # YAML is a superset of JSON, so this reads both formats written by `manage.py spectacular`
+            return yaml.safe_load(Path(settings.PRECOMPUTED_SCHEMA_FILE).read_text(encoding="utf-8"))
+        generator = cls.generator_class(urlconf=cls.urlconf, patterns=cls.patterns)
+        return generator.get_schema(request=None, public=cls.serve_public)
+
+    @classmethod
+    def warm(cls) -> None:
+        """Generates (or loads) the schema and renders every format, so no request pays for it."""
+        for renderer_class in cls.renderer_classes:
+            cls._get_document(renderer_class())
+
+    @classmethod
+    def clear(cls) -> None:
+        with cls._lock:
+            cls._schema = None
+            cls._documents = {}
+
+    @classmethod
+    def _get_document(cls, renderer) -> SchemaDocument:
+        document = cls._documents.get(type(renderer))
+        if document is None:
+            body = renderer.render(cls.get_schema(), renderer.media_type, {})
+            content_type = renderer.media_type
+            if renderer.charset:
+                content_type = f"{content_type}; charset={renderer.charset}"
+            document = cls._documents[type(renderer)] = SchemaDocument(body, content_type)
+        return document
+
+    def _get_schema_response(self, request: Request) -> HttpResponse:
+        if request.GET.get("lang") or self.api_version or request.version or self._get_version_parameter(request):
+            return super()._get_schema_response(request)
+        document = self._get_document(request.accepted_renderer)
+        gzipped = accepts_gzip(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        etag = document.gzipped_etag if gzipped else document.etag
+        if_none_match = [tag.removeprefix("W/") for tag in parse_etags(request.META.get("HTTP_IF_NONE_MATCH", ""))]
+        if etag in if_none_match or "*" in if_none_match:
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(document.gzipped_body if gzipped else document.body,
+                                    content_type=document.content_type)
+            if gzipped:
+                response["Content-Encoding"] = "gzip"
+            response["Content-Disposition"] = f'inline; filename="{self._get_filename(request, None)}"'
+        response["ETag"] = etag
+        response["Cache-Control"] = "no-cache"
+        patch_vary_headers(response, ["Accept-Encoding"])
+        return response
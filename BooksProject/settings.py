@@ -42,6 +42,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'drf_spectacular',
     'rest_framework_simplejwt.token_blacklist',
     'BooksApp.apps.IdenfybookappConfig',
@@ -52,6 +53,9 @@ INSTALLED_APPS = [
 AUTH_USER_MODEL = 'UsersApp.User'
 
 MIDDLEWARE = [
+    # First, so that the request time it records covers the other middleware
+    "BooksProject.metrics.RequestMetricsMiddleware",
+    "BooksProject.db_router.ReplicaRoutingMiddleware",
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -85,19 +89,59 @@ WSGI_APPLICATION = 'BooksProject.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.postgresql_psycopg2',
-        'NAME': 'books',
-        'USER': 'django',
-        'PASSWORD': '2051Enr',
-        'HOST': 'db',
-        'PORT': '5432',
-        "TEST": {
-            "NAME": "mytestdatabase",
-        },
+# PostgreSQL by default, with the host of docker-compose; DATABASE_HOST=localhost DATABASE_PORT=5433 reaches the
+# container from the host. DATABASE_ENGINE=sqlite runs on a SQLite file instead (DATABASE_NAME, default db.sqlite3),
+# e.g. for the benchmarks; full-text search then falls back to substring matching.
+if os.getenv("DATABASE_ENGINE") == "sqlite":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.getenv("DATABASE_NAME", BASE_DIR / "db.sqlite3"),
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql_psycopg2',
+            'NAME': os.getenv("DATABASE_NAME", 'books'),
+            'USER': os.getenv("DATABASE_USER", 'django'),
+            'PASSWORD': os.getenv("DATABASE_PASSWORD", '2051Enr'),
+            'HOST': os.getenv("DATABASE_HOST", 'db'),
+            'PORT': os.getenv("DATABASE_PORT", '5432'),
+            "TEST": {
+                "NAME": "mytestdatabase",
+            },
+        }
+    }
+
+# Read replicas (see BooksProject.db_router): DATABASE_REPLICAS lists their hosts, or their files with SQLite, separated
+# by commas. They get the settings of the primary otherwise, and the aliases replica_1, replica_2 and so on. Tests
+# run them against the test database of the primary.
+_replica_setting = "NAME" if DATABASES["default"]["ENGINE"].endswith("sqlite3") else "HOST"
+for _number, _replica in enumerate(filter(None, os.getenv("DATABASE_REPLICAS", "").split(",")), start=1):
+    DATABASES[f"replica_{_number}"] = {
+        **DATABASES["default"], _replica_setting: _replica.strip(), "TEST": {"MIRROR": "default"},
+    }
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != "default"]
+DATABASE_ROUTERS = ["BooksProject.db_router.ReplicaRouter"]
+# How long the reads of a client stay on the primary after it wrote, to cover the replication lag
+DATABASE_REPLICA_STICKY_SECONDS = 5
+
+# Cache shared by all workers: permission snapshots, book lists and other shared state live here. Without REDIS_URL
+# each process keeps its own in-memory cache, which is only correct for a single process (runserver, tests).
+if os.getenv("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.getenv("REDIS_URL"),
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
     }
-}
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -153,13 +197,22 @@ SPECTACULAR_SETTINGS = {
     ],
 }
 
+# OpenAPI schema served by /schema/: read from this file (written by `manage.py spectacular`) instead of generated
+# from the code, and prepared when the WSGI/ASGI application starts rather than on the first request
+PRECOMPUTED_SCHEMA_FILE = os.environ.get("PRECOMPUTED_SCHEMA_FILE")
+PRECOMPUTE_SCHEMA_ON_STARTUP = True
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        # Both build the user from token claims; they fall back to a database load only when the user has changed.
+        # Encrypted tokens first: StatelessJWTAuthentication would reject them as invalid signed tokens
+        "UsersApp.authentication.JWEAuthentication",
+        "UsersApp.authentication.StatelessJWTAuthentication",
         "rest_framework.authentication.SessionAuthentication",
     ),
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
-    "DEFAULT_THROTTLE_CLASSES": ["rest_framework.throttling.ScopedRateThrottle"],
+    # Counts requests in the database, so that the rates hold across all workers
+    "DEFAULT_THROTTLE_CLASSES": ["UsersApp.throttling.SharedScopedRateThrottle"],
     "DEFAULT_THROTTLE_RATES": {"users_list": "20/minute",
                                "permissions_list": "20/minute",
                                "login_list": "20/minute",
@@ -169,6 +222,35 @@ REST_FRAMEWORK = {
 
 API_THROTTLE_ENABLED = True
 
+# Request metrics (see BooksProject.metrics): whether responses carry a Server-Timing header, which reveals timings
+# to every client, and the bearer token required by /metrics (without one, /metrics is only served with DEBUG).
+# Metrics are kept per worker process and labelled with its pid: /metrics only covers every request with a single
+# worker, or when each worker is scraped on its own
+METRICS_SERVER_TIMING = DEBUG
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+# Bulk book endpoints: maximum number of books (or ids) per request, and number of rows per INSERT
+BOOKS_BULK_MAX_ITEMS = 10000
+BOOKS_BULK_CREATE_BATCH_SIZE = 1000
+
+# Book lists: lifetime of cached list responses, which are also dropped whenever a book changes
+BOOKS_LIST_CACHE_TIMEOUT = 60 * 10
+
+# Book exports: rows fetched per round trip of the server-side cursor
+BOOKS_EXPORT_CHUNK_SIZE = 2000
+
+# Book facets: number of authors counted, the most frequent first
+BOOKS_FACETS_AUTHORS_LIMIT = 50
+
+# Bulk user provisioning: maximum number of users per request, rows per INSERT, and threads hashing passwords
+USERS_BULK_MAX_ITEMS = 10000
+USERS_BULK_CREATE_BATCH_SIZE = 1000
+USERS_BULK_HASH_WORKERS = int(os.getenv("USERS_BULK_HASH_WORKERS", os.cpu_count() or 1))
+
+# Logins: threads hashing passwords in each process, and logins that may wait for one before getting a 503
+LOGIN_HASH_WORKERS = int(os.getenv("LOGIN_HASH_WORKERS", 2))
+LOGIN_HASH_QUEUE_SIZE = int(os.getenv("LOGIN_HASH_QUEUE_SIZE", 16))
+
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=60),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
@@ -192,7 +274,7 @@ SIMPLE_JWT = {
 
     "AUTH_TOKEN_CLASSES": ("rest_framework_simplejwt.tokens.AccessToken",),
     "TOKEN_TYPE_CLAIM": "token_type",
-    "TOKEN_USER_CLASS": "rest_framework_simplejwt.models.TokenUser",
+    "TOKEN_USER_CLASS": "UsersApp.authentication.ClaimsUser",
 
     "JTI_CLAIM": "jti",
 
@@ -201,9 +283,17 @@ SIMPLE_JWT = {
     "SLIDING_TOKEN_REFRESH_LIFETIME": timedelta(days=1),
 
     "TOKEN_OBTAIN_SERIALIZER": "rest_framework_simplejwt.serializers.TokenObtainPairSerializer",
-    "TOKEN_REFRESH_SERIALIZER": "rest_framework_simplejwt.serializers.TokenRefreshSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "UsersApp.serializers.ClaimsTokenRefreshSerializer",
     "TOKEN_VERIFY_SERIALIZER": "rest_framework_simplejwt.serializers.TokenVerifySerializer",
     "TOKEN_BLACKLIST_SERIALIZER": "rest_framework_simplejwt.serializers.TokenBlacklistSerializer",
     "SLIDING_TOKEN_OBTAIN_SERIALIZER": "rest_framework_simplejwt.serializers.TokenObtainSlidingSerializer",
     "SLIDING_TOKEN_REFRESH_SERIALIZER": "rest_framework_simplejwt.serializers.TokenRefreshSlidingSerializer",
+
+    # Encrypted (JWE) access tokens, see UsersApp.authentication.JWEAuthentication. JWE_KEYS is a JWK Set of
+    # symmetric keys, each with a "kid"; JWE_KEY_ID names the key that encrypts new tokens, while the other keys
+    # still decrypt tokens issued before a rotation. Without JWE_KEYS a key is derived from SECRET_KEY.
+    "JWE_KEYS": os.getenv("JWE_KEYS"),
+    "JWE_KEY_ID": os.getenv("JWE_KEY_ID"),
+    "JWE_ALGORITHM": "dir",
+    "JWE_ENCRYPTION": "A256GCM",
 }
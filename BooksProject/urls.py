@@ -1,12 +1,17 @@
 from django.contrib import admin
 from django.urls import include, path
-from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
+from drf_spectacular.views import SpectacularSwaggerView
 from rest_framework import routers
 from rest_framework_simplejwt.views import (
     TokenRefreshView,
 )
 
+from BooksApp.async_views import AsyncBookDetailView, AsyncBookListView
 from BooksApp.views import BookViewSet
+from BooksProject.metrics import metrics_view
+from BooksProject.schema import PrecomputedSpectacularAPIView
+from UsersApp.async_views import AsyncUserLoginView
+from UsersApp.views import EncryptedTokenObtainPairView, EncryptedTokenRefreshView
 from UsersApp.views import UserViewSet, MyTokenObtainPairView, UserPermissionsView, UserLoginView
 
 router = routers.DefaultRouter()
@@ -16,10 +21,14 @@ router.register("books", BookViewSet, basename="books")
 urlpatterns = [
     path('', include(router.urls)),
     path('admin/', admin.site.urls),
+    path("async/books/", AsyncBookListView.as_view(), name="async-books-list"),
+    path("async/books/<int:pk>/", AsyncBookDetailView.as_view(), name="async-books-detail"),
     path('api/token/', MyTokenObtainPairView.as_view(), name="token_obtain_pair"),
     path('api/token/refresh/', TokenRefreshView.as_view(), name="token_refresh"),
+    path("api/token/encrypted/", EncryptedTokenObtainPairView.as_view(), name="encrypted_token_obtain_pair"),
+    path("api/token/encrypted/refresh/", EncryptedTokenRefreshView.as_view(), name="encrypted_token_refresh"),
     path('api/user/permissions/', UserPermissionsView.as_view({"get": "list"}), name="user-permissions"),
-    path("schema/", SpectacularAPIView.as_view(), name="schema"),
+    path("schema/", PrecomputedSpectacularAPIView.as_view(), name="schema"),
     path(
         "swagger/",
         SpectacularSwaggerView.as_view(
@@ -28,4 +37,7 @@ urlpatterns = [
         name="swagger-ui",
     ),
     path("login/", UserLoginView.as_view(), name="login"),
+    path("async/login/", AsyncUserLoginView.as_view(), name="async-login"),
+    # Without a trailing slash, where Prometheus scrapes by default
+    path("metrics", metrics_view, name="metrics"),
 ]
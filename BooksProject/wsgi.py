@@ -14,3 +14,10 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'BooksProject.settings')
 
 application = get_wsgi_application()
+
+from django.conf import settings  # noqa: E402
+
+if settings.PRECOMPUTE_SCHEMA_ON_STARTUP:
+    from BooksProject.schema import PrecomputedSpectacularAPIView  # noqa: E402
+
+    PrecomputedSpectacularAPIView.warm()
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class UsersappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'UsersApp'
+
+    def ready(self):
+        from UsersApp import signals  # noqa: F401
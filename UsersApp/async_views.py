@@ -0,0 +1,68 @@
+from asgiref.sync import sync_to_async
+from django.http import HttpRequest
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from UsersApp.login import averify_credentials
+from UsersApp.serializers import UserLoginSerializer
+from UsersApp.views import UserLoginView
+
+
+class AsyncUserLoginView(View):
+    """
+    Async counterpart of UserLoginView, for deployments served through BooksProject.asgi. The password is hashed on
+    the password verifier's pool while the event loop keeps serving other requests, where UserLoginView holds its
+    thread until the hash is done. Requests are throttled, and answered, with UserLoginView's own configuration.
+    """
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # Like APIView.as_view(): token requests carry no CSRF token, and SessionAuthentication enforces CSRF itself
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def post(self, request: HttpRequest, *args, **kwargs):
+        view = UserLoginView(renderer_classes=[JSONRenderer])
+        view.args, view.kwargs = args, kwargs
+        request = view.initialize_request(request, *args, **kwargs)
+        view.request = request
+        view.headers = view.default_response_headers
+        try:
+            await self.initial(view, request)
+            response = await self.login(request)
+        except Exception as exc:
+            response = view.handle_exception(exc)
+        return view.finalize_response(request, response, *args, **kwargs)
+
+    @staticmethod
+    async def initial(view: UserLoginView, request: Request) -> None:
+        """Async `APIView.initial()`; logins need no authentication or permission."""
+        view.format_kwarg = view.get_format_suffix(**view.kwargs)
+        request.accepted_renderer, request.accepted_media_type = view.perform_content_negotiation(request)
+        durations = []
+        for throttle in view.get_throttles():
+            if not await sync_to_async(throttle.allow_request)(request, view):
+                durations.append(await sync_to_async(throttle.wait)())
+        if durations:
+            waits = [duration for duration in durations if duration is not None]
+            view.throttled(request, max(waits, default=None))
+
+    @staticmethod
+    async def login(request: Request) -> Response:
+        serializer = UserLoginSerializer(context={"request": request})
+        try:
+            # Only the fields, as UserLoginSerializer.validate() checks the password synchronously
+            attrs = serializer.to_internal_value(request.data)
+        except ValidationError as exc:
+            return Response(exc.detail, status=status.HTTP_401_UNAUTHORIZED)
+        user = await averify_credentials(attrs["username"], attrs["password"], request)
+        if user is None:
+            errors = {api_settings.NON_FIELD_ERRORS_KEY: [serializer.error_messages["invalid"]]}
+            return Response(errors, status=status.HTTP_401_UNAUTHORIZED)
+        access_token = await sync_to_async(UserLoginSerializer.get_access_token)(user)
+        return Response({"access_token": access_token}, status=status.HTTP_200_OK)
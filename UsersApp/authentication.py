@@ -0,0 +1,163 @@
+from datetime import timedelta
+
+from django.utils.translation import gettext_lazy as _
+from drf_spectacular.contrib.rest_framework_simplejwt import SimpleJWTScheme
+from jwcrypto.common import JWException
+from rest_framework.request import Request
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken, TokenBackendError, TokenError
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.state import token_backend
+from rest_framework_simplejwt.tokens import AccessToken, Token
+
+from UsersApp.blacklist import FilteredRefreshToken
+from UsersApp.helpers import decrypt_jwt, encrypt_jwt
+from UsersApp.models import User
+from UsersApp.permissions import aget_claims_version, get_claims_version, get_permission_snapshot
+
+PERMISSIONS_CLAIM = "perms"
+CLAIMS_VERSION_CLAIM = "ver"
+
+
+def add_user_claims(token: Token, user: User) -> Token:
+    """Writes everything needed to authorize requests without loading the user into the token."""
+    # Read the version first: if the user changes in between, the token is stamped stale rather than wrongly current
+    token[CLAIMS_VERSION_CLAIM] = get_claims_version(user.pk, create=True)
+    token["username"] = user.username
+    token["is_staff"] = user.is_staff
+    token["is_superuser"] = user.is_superuser
+    token[PERMISSIONS_CLAIM] = sorted(get_permission_snapshot(user))
+    return token
+
+
+class ClaimsUser(TokenUser):
+    """A user built from token claims, including permission codenames, instead of a database row."""
+
+    def __init__(self, token: Token):
+        super().__init__(token)
+        self._permission_snapshot = frozenset(token.get(PERMISSIONS_CLAIM, ()))
+
+    def get_all_permissions(self, obj=None) -> set[str]:
+        return set(self._permission_snapshot)
+
+    def has_perm(self, perm: str, obj=None) -> bool:
+        return self.is_active and (self.is_superuser or perm in self._permission_snapshot)
+
+    def has_perms(self, perm_list, obj=None) -> bool:
+        return all(self.has_perm(perm, obj) for perm in perm_list)
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """
+    Authenticates with the claims of the access token instead of loading the user on every request. The token's
+    claims version is compared with the current one in the shared cache; when the user or their permissions changed
+    since the token was issued (or the version is unknown), the user is loaded from the database as usual.
+    """
+
+    def get_user(self, validated_token: Token) -> ClaimsUser | User:
+        version = validated_token.get(CLAIMS_VERSION_CLAIM)
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if version is not None and user_id is not None and version == get_claims_version(user_id):
+            return ClaimsUser(validated_token)
+        return super().get_user(validated_token)
+
+    async def aauthenticate(self, request: Request) -> tuple[ClaimsUser | User, Token] | None:
+        """Async `authenticate()` for async views: only the cache and the fallback user load are awaited."""
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token: Token) -> ClaimsUser | User:
+        version = validated_token.get(CLAIMS_VERSION_CLAIM)
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if user_id is None:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+        if version is not None and version == await aget_claims_version(user_id):
+            return ClaimsUser(validated_token)
+        try:
+            user = await self.user_model.objects.aget(**{api_settings.USER_ID_FIELD: user_id})
+        except self.user_model.DoesNotExist:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        return user
+
+
+class JWETokenBackend:
+    """Token backend whose tokens are encrypted (see `encrypt_jwt`) rather than signed."""
+
+    def get_leeway(self) -> timedelta:
+        return token_backend.get_leeway()
+
+    def encode(self, payload: dict) -> str:
+        return encrypt_jwt(payload)
+
+    def decode(self, token: str | bytes, verify: bool = True) -> dict:
+        # Authenticated encryption: a token that decrypts has not been tampered with, so there is nothing to skip
+        if isinstance(token, bytes):
+            token = token.decode()
+        try:
+            return decrypt_jwt(token)
+        except (JWException, ValueError) as exc:
+            raise TokenBackendError(_("Token is invalid or expired")) from exc
+
+
+jwe_token_backend = JWETokenBackend()
+
+
+class EncryptedAccessToken(AccessToken):
+    """An access token whose claims are encrypted, so that clients cannot read them."""
+
+    def get_token_backend(self) -> JWETokenBackend:
+        return jwe_token_backend
+
+
+class EncryptedRefreshToken(FilteredRefreshToken):
+    """A (signed) refresh token that issues encrypted access tokens."""
+    access_token_class = EncryptedAccessToken
+
+
+class JWEAuthentication(StatelessJWTAuthentication):
+    """
+    StatelessJWTAuthentication for encrypted access tokens. Signed tokens are left to the next authentication class:
+    compact JWE tokens have five dot-separated parts, signed ones three.
+    """
+
+    def get_raw_token(self, header: bytes) -> bytes | None:
+        raw_token = super().get_raw_token(header)
+        if raw_token is None or raw_token.count(b".") != 4:
+            return None
+        return raw_token
+
+    def get_validated_token(self, raw_token: bytes) -> EncryptedAccessToken:
+        try:
+            return EncryptedAccessToken(raw_token)
+        except TokenError as exc:
+            raise InvalidToken({
+                "detail": _("Given token not valid for any token type"),
+                "messages": [{
+                    "token_class": EncryptedAccessToken.__name__,
+                    "token_type": EncryptedAccessToken.token_type,
+                    "message": exc.args[0],
+                }],
+            })
+
+
+class StatelessJWTScheme(SimpleJWTScheme):
+    """Documents StatelessJWTAuthentication in the OpenAPI schema as the same bearer scheme as JWTAuthentication."""
+    target_class = "UsersApp.authentication.StatelessJWTAuthentication"
+
+
+class JWEScheme(SimpleJWTScheme):
+    """Documents JWEAuthentication in the OpenAPI schema as a bearer scheme of encrypted tokens."""
+    target_class = "UsersApp.authentication.JWEAuthentication"
+    name = "jweAuth"
+
+    def get_security_definition(self, auto_schema) -> dict:
+        return {"type": "http", "scheme": "bearer", "bearerFormat": "JWE"}
@@ -0,0 +1,102 @@
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime
+
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+
+class BloomFilter:
+    """A fixed-size set of strings that answers "definitely not present" or "possibly present"."""
+
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hash_count):
+            yield (first + i * second) % self.size
+
+    def add(self, item: str) -> None:
+        if item in self:
+            return
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class BlacklistFilter:
+    """
+    Answers "might this refresh token be blacklisted?" without the database; only possible hits are confirmed there.
+
+    Each process builds a Bloom filter over the blacklisted tokens that have not expired yet (expired ones are
+    rejected by the token itself), and rebuilds it periodically and whenever it outgrows its capacity. Tokens
+    blacklisted after the build are published by `add()` as keys in the shared cache that live until the token
+    expires, so every process sees them with a single cache lookup. The cache must therefore be shared across
+    workers and must not evict these keys early.
+    """
+    error_rate = 0.01
+    min_capacity = 1024
+    rebuild_interval = 60 * 60
+    key_prefix = "token-blacklist:"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._filter = None
+        self._built_at = 0.0
+
+    def __contains__(self, jti: str) -> bool:
+        bloom_filter = self._get_filter()
+        return jti in bloom_filter or cache.get(f"{self.key_prefix}{jti}") is not None
+
+    def add(self, jti: str, expires_at: datetime) -> None:
+        timeout = max(1, int((expires_at - timezone.now()).total_seconds()) + 1)
+        cache.set(f"{self.key_prefix}{jti}", True, timeout)
+        with self._lock:
+            if self._filter is not None:
+                self._filter.add(jti)
+
+    def _get_filter(self) -> BloomFilter:
+        bloom_filter = self._filter
+        if bloom_filter is None or bloom_filter.count > bloom_filter.capacity or (
+                time.monotonic() - self._built_at > self.rebuild_interval):
+            with self._lock:
+                if self._filter is bloom_filter:
+                    self._filter = self._build()
+                    self._built_at = time.monotonic()
+                bloom_filter = self._filter
+        return bloom_filter
+
+    def _build(self) -> BloomFilter:
+        blacklisted = BlacklistedToken.objects.filter(token__expires_at__gt=timezone.now())
+        bloom_filter = BloomFilter(max(self.min_capacity, 2 * blacklisted.count()), self.error_rate)
+        for jti in blacklisted.values_list("token__jti", flat=True).iterator(chunk_size=10000):
+            bloom_filter.add(jti)
+        return bloom_filter
+
+
+blacklist_filter = BlacklistFilter()
+
+
+class FilteredRefreshToken(RefreshToken):
+    """A refresh token whose blacklist check only reaches the database when the blacklist filter reports a hit."""
+
+    def check_blacklist(self):
+        jti = self.payload[api_settings.JTI_CLAIM]
+        if jti in blacklist_filter and BlacklistedToken.objects.filter(token__jti=jti).exists():
+            raise TokenError(_("Token is blacklisted"))
@@ -0,0 +1,18 @@
+from django_filters import rest_framework as filters
+
+from BooksApp.filters import CustomPageNumberPagination
+from UsersApp.models import User
+
+
+class UserFilter(filters.FilterSet):
+    username = filters.CharFilter(field_name="username", lookup_expr="istartswith")
+    email = filters.CharFilter(field_name="email", lookup_expr="istartswith")
+
+    class Meta:
+        model = User
+        fields = ["username", "email"]
+
+
+class UserPagination(CustomPageNumberPagination):
+    # Unlike book lists, the user directory is always paginated
+    page_size = 100
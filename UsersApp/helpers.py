@@ -1,25 +1,58 @@
+import base64
+import hashlib
 import json
-from base64 import encode
+from functools import lru_cache
 
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 from jwcrypto import jwe, jwk
+from jwcrypto.common import json_encode
 
-from BooksProject.settings import SIMPLE_JWT
+
+@lru_cache(maxsize=8)
+def _parse_keys(keys_json: str | None, key_id: str | None, secret_key: str) -> tuple[jwk.JWKSet, jwk.JWK]:
+    if keys_json:
+        key_set = jwk.JWKSet.from_json(keys_json)
+    else:
+        # Like SIMPLE_JWT's SIGNING_KEY, default to a key derived from SECRET_KEY
+        secret = hashlib.sha256(f"jwe:{secret_key}".encode()).digest()
+        key_set = jwk.JWKSet()
+        key_set.add(jwk.JWK(kty="oct", kid="default", k=base64.urlsafe_b64encode(secret).rstrip(b"=").decode()))
+    keys = list(key_set["keys"])
+    if key_id:
+        current_key = key_set.get_key(key_id)
+    elif len(keys) == 1:
+        current_key = keys[0]
+    else:
+        raise ImproperlyConfigured("SIMPLE_JWT['JWE_KEY_ID'] must name the encryption key when JWE_KEYS has several")
+    if current_key is None:
+        raise ImproperlyConfigured(f"SIMPLE_JWT['JWE_KEYS'] has no key with the id {key_id!r}")
+    return key_set, current_key
+
+
+def get_jwe_keys() -> tuple[jwk.JWKSet, jwk.JWK]:
+    """
+    Returns the JWE key set and the key that encrypts new tokens. Keys are parsed once per process and key
+    configuration, rather than on every encryption and decryption.
+    """
+    return _parse_keys(settings.SIMPLE_JWT["JWE_KEYS"], settings.SIMPLE_JWT["JWE_KEY_ID"], settings.SECRET_KEY)
 
 
 def encrypt_jwt(payload: dict) -> str:
     """Function to encrypt the JWT token using JWE"""
-    payload_json = json.dumps(payload)
-    jwk_key = jwk.JWK.from_json(SIMPLE_JWT["JWE_SECRET_KEY"])
-    jwetoken = jwe.JWE(payload_json, encode({"alg": SIMPLE_JWT["JWE_ALGORITHM"]}))
-    jwetoken.add_recipient(jwk_key)
-    encrypted_token = jwetoken.serialize(compact=True)
-    return encrypted_token
+    _, key = get_jwe_keys()
+    header = {"alg": settings.SIMPLE_JWT["JWE_ALGORITHM"], "enc": settings.SIMPLE_JWT["JWE_ENCRYPTION"]}
+    if key.key_id:
+        # Lets decrypt_jwt pick the key directly, and keeps tokens of rotated-out keys decryptable
+        header["kid"] = key.key_id
+    jwetoken = jwe.JWE(json.dumps(payload), protected=json_encode(header))
+    jwetoken.add_recipient(key)
+    return jwetoken.serialize(compact=True)
 
 
 def decrypt_jwt(encrypted_token: str) -> dict:
-    """Function to decrypt the JWT token using JWE"""
-    jwetoken = jwe.JWE()
-    jwetoken.deserialize(encrypted_token, key=jwk.JWK.from_json(SIMPLE_JWT["JWE_SECRET_KEY"]))
-    payload_json = jwetoken.payload.decode("utf-8")
-    payload = json.loads(payload_json)
-    return payload
+    """Function to decrypt the JWT token using JWE, with any key of the key set"""
+    key_set, _ = get_jwe_keys()
+    jwetoken = jwe.JWE(algs=[settings.SIMPLE_JWT["JWE_ALGORITHM"], settings.SIMPLE_JWT["JWE_ENCRYPTION"]])
+    jwetoken.deserialize(encrypted_token, key=key_set)
+    return json.loads(jwetoken.payload)
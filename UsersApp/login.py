@@ -0,0 +1,171 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+from django.contrib.auth.signals import user_login_failed
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from UsersApp.models import User
+
+
+class LoginUnavailable(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Too many logins in progress, try again shortly."
+    default_code = "login_unavailable"
+    # Sent as Retry-After by DRF's exception handler
+    wait = 1
+
+
+class DurationStats:
+    """Count, sum and maximum of a duration, in seconds."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def snapshot(self) -> dict:
+        return {"count": self.count, "sum": self.total, "max": self.max}
+
+
+class PasswordVerifier:
+    """
+    Runs password hashing (PBKDF2 by default, tens of milliseconds of CPU each) on a bounded pool of threads. At most
+    LOGIN_HASH_WORKERS hashes run at once and LOGIN_HASH_QUEUE_SIZE more wait for a thread; beyond that, logins fail
+    right away with 503 instead of queueing up behind each other. Sync views still hold their request thread while
+    the hash runs (`verify_credentials()`); async ones (`averify_credentials()`, /async/login/) leave the event loop
+    free to serve other requests.
+
+    The pool is created on first use, so that each forked worker process gets its own threads.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._slots = None
+        self.in_flight = 0
+        self.rejected = 0
+        self.queue_wait = DurationStats()
+        self.hash_time = DurationStats()
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._executor is None:
+                self._slots = threading.BoundedSemaphore(settings.LOGIN_HASH_WORKERS + settings.LOGIN_HASH_QUEUE_SIZE)
+                self._executor = ThreadPoolExecutor(
+                    max_workers=settings.LOGIN_HASH_WORKERS, thread_name_prefix="password-verifier"
+                )
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def submit(self, password: str, encoded: str | None) -> Future:
+        """
+        Checks `password` against the `encoded` hash in the pool. The future resolves to (valid, must_update), or
+        to (False, False) without a hash, after hashing the password anyway so that unknown usernames take as long
+        as wrong passwords. Raises LoginUnavailable when the pool and its queue are full.
+        """
+        if self._executor is None:
+            self._start()
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise LoginUnavailable()
+        with self._lock:
+            self.in_flight += 1
+        try:
+            future = self._executor.submit(self._verify, password, encoded, time.perf_counter())
+        except BaseException:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    def _verify(self, password: str, encoded: str | None, submitted_at: float) -> tuple[bool, bool]:
+        started = time.perf_counter()
+        must_update = []
+        if encoded is None:
+            make_password(password)
+            valid = False
+        else:
+            valid = check_password(password, encoded, setter=lambda raw_password: must_update.append(True))
+        finished = time.perf_counter()
+        with self._lock:
+            self.queue_wait.add(started - submitted_at)
+            self.hash_time.add(finished - started)
+        return valid, bool(must_update)
+
+    def _release(self, future: Future | None) -> None:
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "workers": settings.LOGIN_HASH_WORKERS,
+                "queue_size": settings.LOGIN_HASH_QUEUE_SIZE,
+                "in_flight": self.in_flight,
+                "rejected": self.rejected,
+                "queue_wait_seconds": self.queue_wait.snapshot(),
+                "hash_seconds": self.hash_time.snapshot(),
+            }
+
+
+password_verifier = PasswordVerifier()
+
+
+def _accept(user: User | None, password: str, valid: bool, must_update: bool) -> User | None:
+    if not valid or not user.is_active:
+        return None
+    if must_update:
+        # The hasher or its iteration count changed since the password was set
+        user.set_password(password)
+        user._password = None
+    return user
+
+
+def _send_login_failed(username: str, request) -> None:
+    # Like authenticate(), for receivers such as lockout or auditing; the password is left out
+    user_login_failed.send(sender=__name__, credentials={User.USERNAME_FIELD: username}, request=request)
+
+
+def verify_credentials(username: str, password: str, request=None) -> User | None:
+    """
+    The `authenticate()` of ModelBackend, with the password checked on the password verifier's pool. Returns the
+    active user with these credentials, or None after sending `user_login_failed`. The calling thread waits for the
+    hash.
+    """
+    user = User._default_manager.filter(**{User.USERNAME_FIELD: username}).first()
+    valid, must_update = password_verifier.submit(password, user.password if user else None).result()
+    user = _accept(user, password, valid, must_update)
+    if user is None:
+        _send_login_failed(username, request)
+    elif must_update:
+        user.save(update_fields=["password"])
+    return user
+
+
+async def averify_credentials(username: str, password: str, request=None) -> User | None:
+    """Async `verify_credentials()`: the event loop keeps serving other requests while the password is hashed."""
+    user = await User._default_manager.filter(**{User.USERNAME_FIELD: username}).afirst()
+    valid, must_update = await asyncio.wrap_future(password_verifier.submit(password, user.password if user else None))
+    user = _accept(user, password, valid, must_update)
+    if user is None:
+        await sync_to_async(_send_login_failed)(username, request)
+    elif must_update:
+        await user.asave(update_fields=["password"])
+    return user
@@ -0,0 +1,76 @@
+import csv
+import json
+import time
+from itertools import islice
+from pathlib import Path
+from typing import Iterator
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from UsersApp.provisioning import bulk_insert_users, validate_users
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates users from a CSV file (with a header row) or a JSON Lines file, with the columns username, email, "
+        "password and user_permissions (permission ids; separated by spaces in CSV). The file is streamed and written "
+        "in batches, with the passwords of each batch hashed in parallel; invalid records, including usernames that "
+        "are already taken, are reported and skipped. Running the command again therefore only creates the users "
+        "that are still missing. Administrators cannot be created this way."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", type=Path)
+        parser.add_argument("--format", choices=["csv", "jsonl"], help="Defaults to the file extension.")
+        parser.add_argument("--batch-size", type=int, default=settings.USERS_BULK_CREATE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        if not path.is_file():
+            raise CommandError(f'File "{path}" does not exist.')
+        file_format = options["format"] or path.suffix.lstrip(".").lower()
+        if file_format not in ("csv", "jsonl"):
+            raise CommandError("Cannot tell the format from the file extension, pass --format.")
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive.")
+
+        known_permissions = set()
+        created = skipped = position = 0
+        started = time.monotonic()
+        with path.open(newline="", encoding="utf-8") as file:
+            records = self._read_records(file, file_format)
+            while batch := list(islice(records, options["batch_size"])):
+                rows, errors = validate_users(batch, known_permissions)
+                for index, error in enumerate(errors):
+                    if error:
+                        self.stderr.write(f"Record {position + index + 1}: {json.dumps(error)}")
+                created += bulk_insert_users(rows) if rows else 0
+                skipped += len(batch) - len(rows)
+                position += len(batch)
+                rate = created / max(time.monotonic() - started, 1e-6)
+                self.stdout.write(f"{position} records read, {created} users created ({rate:.0f} users/s)")
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {created} users in {elapsed:.1f}s ({created / max(elapsed, 1e-6):.0f} users/s), "
+            f"skipped {skipped} invalid records."
+        ))
+
+    @staticmethod
+    def _read_records(file, file_format: str) -> Iterator[dict | str]:
+        if file_format == "csv":
+            for record in csv.DictReader(file):
+                record = {key: value for key, value in record.items() if value not in ("", None)}
+                if "user_permissions" in record:
+                    record["user_permissions"] = record["user_permissions"].split()
+                yield record
+            return
+        for line in file:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                # Reported as invalid data by the validation, like any other non-object record
+                yield line
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.3 on 2026-10-18 17:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('UsersApp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThrottleCounter',
+            fields=[
+                ('key', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('window_start', models.BigIntegerField(help_text='Start of the current window, in seconds since the epoch')),
+                ('hits', models.PositiveIntegerField(default=0)),
+                ('previous_hits', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -7,3 +7,13 @@ class User(AbstractUser):
     last_name = None
     password_last_change = models.DateTimeField(null=True, blank=True)
 
+
+class ThrottleCounter(models.Model):
+    """
+    Request counts of one client in one throttle scope, for the current and the previous rate window. The row is
+    rewritten in place as windows pass, so each client takes a fixed amount of space.
+    """
+    key = models.CharField(max_length=255, primary_key=True)
+    window_start = models.BigIntegerField(help_text="Start of the current window, in seconds since the epoch")
+    hits = models.PositiveIntegerField(default=0)
+    previous_hits = models.PositiveIntegerField(default=0)
@@ -0,0 +1,177 @@
+from uuid import uuid4
+
+from django.contrib.auth.models import Permission
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+
+from BooksProject.db_router import primary_reads
+from UsersApp.models import User
+
+PERMISSION_SNAPSHOT_TIMEOUT = 60 * 60
+PERMISSION_GENERATION_KEY = "permissions:generation"
+PERMISSION_CATALOG_VERSION_KEY = "permissions:catalog-version"
+ADMINISTRATOR_PERMISSION_CODENAME = "administrator"
+
+# Catalog version -> id of the administrator permission, for the current version only
+_administrator_permission_ids: dict[str, int | None] = {}
+
+
+def _get_generation() -> str:
+    generation = cache.get(PERMISSION_GENERATION_KEY)
+    if generation is None:
+        cache.add(PERMISSION_GENERATION_KEY, uuid4().hex, timeout=None)
+        generation = cache.get(PERMISSION_GENERATION_KEY)
+    return generation
+
+
+async def _aget_generation() -> str:
+    generation = await cache.aget(PERMISSION_GENERATION_KEY)
+    if generation is None:
+        await cache.aadd(PERMISSION_GENERATION_KEY, uuid4().hex, timeout=None)
+        generation = await cache.aget(PERMISSION_GENERATION_KEY)
+    return generation
+
+
+def _snapshot_key(user_id: int, generation: str) -> str:
+    return f"permissions:snapshot:{generation}:{user_id}"
+
+
+def _claims_version_key(user_id: int) -> str:
+    return f"permissions:claims-version:{user_id}"
+
+
+def get_permission_snapshot(user: User) -> frozenset[str]:
+    """
+    Returns the user's permissions as "app_label.codename" strings, like `get_all_permissions()`, but from the shared
+    cache. The snapshot is remembered on the user object, so repeated checks within a request cost nothing at all.
+    """
+    snapshot = getattr(user, "_permission_snapshot", None)
+    if snapshot is None:
+        key = _snapshot_key(user.pk, _get_generation())
+        snapshot = cache.get(key)
+        if snapshot is None:
+            # From the primary, as the snapshot is shared: a lagging replica could miss a permission just granted
+            with primary_reads():
+                snapshot = frozenset(User(pk=user.pk, is_active=True).get_all_permissions())
+            cache.set(key, snapshot, PERMISSION_SNAPSHOT_TIMEOUT)
+        user._permission_snapshot = snapshot
+    return snapshot
+
+
+async def aget_permission_snapshot(user: User) -> frozenset[str]:
+    """
+    Async `get_permission_snapshot()`. On a cache miss the permissions are read with the async ORM, with the rules of
+    the ModelBackend for an active user: their own permissions and those of their groups.
+    """
+    snapshot = getattr(user, "_permission_snapshot", None)
+    if snapshot is None:
+        key = _snapshot_key(user.pk, await _aget_generation())
+        snapshot = await cache.aget(key)
+        if snapshot is None:
+            permissions = Permission.objects.filter(Q(user=user.pk) | Q(group__user=user.pk)).values_list(
+                "content_type__app_label", "codename"
+            )
+            with primary_reads():
+                snapshot = frozenset([f"{app_label}.{codename}" async for app_label, codename in permissions])
+            await cache.aset(key, snapshot, PERMISSION_SNAPSHOT_TIMEOUT)
+        user._permission_snapshot = snapshot
+    return snapshot
+
+
+def has_cached_perm(user: User, perm: str) -> bool:
+    """Same answer as `user.has_perm(perm)` for the ModelBackend, without querying the database."""
+    if not user.is_active:
+        return False
+    if user.is_superuser:
+        return True
+    return perm in get_permission_snapshot(user)
+
+
+async def ahas_cached_perm(user: User, perm: str) -> bool:
+    if not user.is_active:
+        return False
+    if user.is_superuser:
+        return True
+    return perm in await aget_permission_snapshot(user)
+
+
+def get_claims_version(user_id: int, create: bool = False) -> str | None:
+    """
+    Returns the stamp written into a user's tokens: it changes whenever the user or their permissions change, so a
+    token whose stamp differs carries stale claims. Returns None when unknown (e.g. evicted) unless `create` is set.
+    """
+    user_key = _claims_version_key(user_id)
+    values = cache.get_many([PERMISSION_GENERATION_KEY, user_key])
+    generation, user_version = values.get(PERMISSION_GENERATION_KEY), values.get(user_key)
+    if create:
+        generation = generation or _get_generation()
+        if user_version is None:
+            cache.add(user_key, uuid4().hex, timeout=None)
+            user_version = cache.get(user_key)
+    if generation is None or user_version is None:
+        return None
+    return f"{generation}:{user_version}"
+
+
+async def aget_claims_version(user_id: int) -> str | None:
+    """Async `get_claims_version()`, without `create` (tokens are only issued by sync views)."""
+    user_key = _claims_version_key(user_id)
+    values = await cache.aget_many([PERMISSION_GENERATION_KEY, user_key])
+    generation, user_version = values.get(PERMISSION_GENERATION_KEY), values.get(user_key)
+    if generation is None or user_version is None:
+        return None
+    return f"{generation}:{user_version}"
+
+
+def invalidate_permission_snapshots(user_ids=None) -> None:
+    """
+    Drops the snapshots and claims versions of the given users, or of everybody (e.g. after a group's permissions
+    changed), once the current transaction commits: dropping them right away would let a concurrent request cache
+    the old permissions again before the change is visible.
+    """
+    if user_ids is None:
+        transaction.on_commit(lambda: cache.set(PERMISSION_GENERATION_KEY, uuid4().hex, timeout=None))
+        return
+    user_ids = list(user_ids)
+
+    def drop_snapshots():
+        generation = _get_generation()
+        cache.delete_many(
+            [_snapshot_key(user_id, generation) for user_id in user_ids]
+            + [_claims_version_key(user_id) for user_id in user_ids]
+        )
+
+    transaction.on_commit(drop_snapshots)
+
+
+def get_permission_catalog_version() -> str:
+    """Returns the version of the list of all permissions, which changes whenever a permission is added or changed."""
+    version = cache.get(PERMISSION_CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(PERMISSION_CATALOG_VERSION_KEY, uuid4().hex, timeout=None)
+        version = cache.get(PERMISSION_CATALOG_VERSION_KEY)
+    return version
+
+
+def invalidate_permission_catalog() -> None:
+    """Moves the permission catalog to a new version once the current transaction commits, in every process."""
+    transaction.on_commit(lambda: cache.set(PERMISSION_CATALOG_VERSION_KEY, uuid4().hex, timeout=None))
+
+
+def get_administrator_permission_id() -> int | None:
+    """
+    Returns the id of the administrator permission, or None if there is none. It is read once per process and
+    catalog version rather than on every user creation.
+    """
+    version = get_permission_catalog_version()
+    try:
+        return _administrator_permission_ids[version]
+    except KeyError:
+        with primary_reads():
+            permission_id = Permission.objects.filter(codename=ADMINISTRATOR_PERMISSION_CODENAME).values_list(
+                "pk", flat=True
+            ).first()
+        _administrator_permission_ids.clear()
+        _administrator_permission_ids[version] = permission_id
+        return permission_id
@@ -0,0 +1,95 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Permission
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+from rest_framework.relations import PrimaryKeyRelatedField
+
+from UsersApp.models import User
+from UsersApp.permissions import get_administrator_permission_id
+from UsersApp.serializers import UserBulkCreateSerializer
+from utils import Errors
+
+
+def validate_users(items: list[dict], known_permissions: set[int] = None) -> tuple[list[dict], list[dict]]:
+    """
+    Validates user payloads like UserSerializer(many=True) would, but checks the usernames and permissions of all
+    items with one query each. Returns the validated rows of the valid items and a list of errors aligned with
+    `items` (empty for valid items). Permission ids in `known_permissions` are trusted without a query, and the
+    permissions found are added to it.
+    """
+    serializer = UserBulkCreateSerializer()
+    rows, errors = [], []
+    for item in items:
+        try:
+            rows.append(serializer.run_validation(item))
+            errors.append({})
+        except ValidationError as error:
+            rows.append(None)
+            errors.append(error.detail)
+
+    def reject(index: int, field: str, message) -> None:
+        rows[index] = None
+        errors[index] = {field: message}
+
+    usernames = Counter(row["username"] for row in rows if row is not None)
+    taken = set(User.objects.filter(username__in=usernames).values_list("username", flat=True))
+    taken |= {username for username, count in usernames.items() if count > 1}
+    for index, row in enumerate(rows):
+        if row is not None and row["username"] in taken:
+            reject(index, "username", [str(User._meta.get_field("username").error_messages["unique"])])
+
+    permission_ids = {pk for row in rows if row is not None for pk in row.get("user_permissions", [])}
+    if known_permissions is not None:
+        permission_ids -= known_permissions
+    found = set(Permission.objects.filter(pk__in=permission_ids).values_list("pk", flat=True))
+    if known_permissions is not None:
+        known_permissions |= found
+    missing = permission_ids - found
+    administrator_permission_id = get_administrator_permission_id()
+    for index, row in enumerate(rows):
+        if row is None:
+            continue
+        if administrator_permission_id in row.get("user_permissions", []):
+            # Administrators are only created through the admin site
+            reject(index, "user_permissions", Errors.CANNOT_CREATE_A_USER)
+        elif missing_ids := [pk for pk in row.get("user_permissions", []) if pk in missing]:
+            message = PrimaryKeyRelatedField.default_error_messages["does_not_exist"]
+            reject(index, "user_permissions", [message.format(pk_value=pk) for pk in missing_ids])
+    return [row for row in rows if row is not None], errors
+
+
+def hash_passwords(passwords: list[str | None]) -> list[str]:
+    """
+    Hashes passwords on USERS_BULK_HASH_WORKERS threads; hashlib releases the GIL while hashing, so they run in
+    parallel. None gives an unusable password.
+    """
+    with ThreadPoolExecutor(max_workers=settings.USERS_BULK_HASH_WORKERS) as executor:
+        return list(executor.map(make_password, passwords))
+
+
+def bulk_insert_users(rows: list[dict], batch_size: int = None) -> int:
+    """
+    Inserts validated user rows and their permissions in batches, all in one transaction. Returns the number of
+    users created.
+    """
+    batch_size = batch_size or settings.USERS_BULK_CREATE_BATCH_SIZE
+    passwords = hash_passwords([row.get("password") for row in rows])
+    users = [
+        User(username=row["username"], email=row.get("email", ""), password=password)
+        for row, password in zip(rows, passwords)
+    ]
+    with transaction.atomic():
+        User.objects.bulk_create(users, batch_size=batch_size)
+        through = User.user_permissions.through
+        through.objects.bulk_create(
+            [
+                through(user_id=user.pk, permission_id=permission_id)
+                for user, row in zip(users, rows) for permission_id in dict.fromkeys(row.get("user_permissions", []))
+            ],
+            batch_size=batch_size,
+        )
+    return len(users)
@@ -1,13 +1,18 @@
-from django.contrib.auth import authenticate
-from django.contrib.auth.models import Permission
+from django.contrib.auth.models import Permission, update_last_login
+from django.contrib.auth.validators import UnicodeUsernameValidator
 from drf_spectacular.utils import extend_schema_serializer, OpenApiExample
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
 
+from UsersApp.authentication import EncryptedRefreshToken, add_user_claims
+from UsersApp.blacklist import FilteredRefreshToken
 from UsersApp.examples import USER_CREATION_PAYLOAD, USER_LOGIN_PAYLOAD
+from UsersApp.login import verify_credentials
 from UsersApp.models import User
+from UsersApp.permissions import get_administrator_permission_id
 from UsersApp.type_hints import UserCreationDict
 from utils import Errors
 
@@ -28,21 +33,110 @@ class UserSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data: UserCreationDict) -> UserCreationDict:
         user_permissions = validated_data.get("user_permissions", [])
-        administrator_permission = Permission.objects.get(codename="administrator")
+        administrator_permission_id = get_administrator_permission_id()
 
-        if administrator_permission in user_permissions:
+        if any(permission.pk == administrator_permission_id for permission in user_permissions):
             raise ValidationError({"user_permissions": Errors.CANNOT_CREATE_A_USER})
 
         return super().create(validated_data)
 
 
+def serialize_user_rows(rows) -> list[dict]:
+    """
+    Serializes `.values()` rows like UserSerializer(many=True) would, with the permission ids of all the users read
+    in one query instead of one query per user. The rows need every field of UserSerializer but user_permissions.
+    """
+    rows = list(rows)
+    permission_ids = {row["id"]: [] for row in rows}
+    if permission_ids:
+        # In Permission's Meta ordering, which UserSerializer follows
+        user_permissions = User.user_permissions.through.objects.filter(user_id__in=permission_ids).order_by(
+            "permission__content_type__app_label", "permission__content_type__model", "permission__codename"
+        )
+        for user_id, permission_id in user_permissions.values_list("user_id", "permission_id"):
+            permission_ids[user_id].append(permission_id)
+    fields = UserSerializer.Meta.fields
+    return [
+        {field: permission_ids[row["id"]] if field == "user_permissions" else row[field] for field in fields}
+        for row in rows
+    ]
+
+
+class UserBulkCreateSerializer(serializers.ModelSerializer):
+    """
+    Validates one item of a bulk provisioning. Username uniqueness and permission ids are checked for all items
+    together (see `UsersApp.provisioning.validate_users`) instead of with queries per item. Without a password, the
+    user gets an unusable one.
+    """
+    username = serializers.CharField(max_length=150, validators=[UnicodeUsernameValidator()])
+    password = serializers.CharField(write_only=True, required=False, style={"input_type": "password"})
+    user_permissions = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False)
+
+    class Meta:
+        model = User
+        fields = ["username", "email", "password", "user_permissions"]
+
+
+class UserBulkCreateResultSerializer(serializers.Serializer):
+    created = serializers.IntegerField()
+
+
 class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
-    """Added custom MyTokenObtainPairSerializer for additional fields in token payload."""
+    """
+    Added custom MyTokenObtainPairSerializer for additional fields in token payload. The password is checked on the
+    bounded password verifier pool rather than by `authenticate()`.
+    """
+    def validate(self, attrs: dict) -> dict:
+        self.user = verify_credentials(attrs[self.username_field], attrs["password"], self.context.get("request"))
+        if not api_settings.USER_AUTHENTICATION_RULE(self.user):
+            raise AuthenticationFailed(self.error_messages["no_active_account"], "no_active_account")
+
+        refresh = self.get_token(self.user)
+        data = {"refresh": str(refresh), "access": str(refresh.access_token)}
+        if api_settings.UPDATE_LAST_LOGIN:
+            update_last_login(None, self.user)
+        return data
+
     @classmethod
     def get_token(cls, user: User) -> str:
         token_data = super().get_token(user)
-        token_data["username"] = user.username
-        return token_data
+        return add_user_claims(token_data, user)
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Same as TokenRefreshSerializer, but the user is read again so that the refreshed tokens carry current claims.
+    Without it, an access token copies the claims of the refresh token, which may be stale. The blacklist check
+    goes through the in-memory blacklist filter.
+    """
+    token_class = FilteredRefreshToken
+
+    def validate(self, attrs: dict) -> dict:
+        refresh = self.token_class(attrs["refresh"])
+        user = User.objects.filter(pk=refresh[api_settings.USER_ID_CLAIM], is_active=True).first()
+        if user is None:
+            raise AuthenticationFailed("User not found", code="user_not_found")
+        add_user_claims(refresh, user)
+
+        data = {"access": str(refresh.access_token)}
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            if api_settings.BLACKLIST_AFTER_ROTATION:
+                refresh.blacklist()
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            data["refresh"] = str(refresh)
+        return data
+
+
+class EncryptedTokenObtainPairSerializer(MyTokenObtainPairSerializer):
+    """Same as MyTokenObtainPairSerializer, with an encrypted access token."""
+    token_class = EncryptedRefreshToken
+
+
+class EncryptedTokenRefreshSerializer(ClaimsTokenRefreshSerializer):
+    """Same as ClaimsTokenRefreshSerializer, with an encrypted access token."""
+    token_class = EncryptedRefreshToken
 
 
 class PermissionSerializer(serializers.ModelSerializer):
@@ -64,14 +158,20 @@ class UserLoginSerializer(serializers.Serializer):
     username = serializers.CharField()
     password = serializers.CharField(write_only=True)
 
+    default_error_messages = {"invalid": "Invalid credentials"}
+
     def validate(self, attrs: dict) -> dict:
         username = attrs.get("username")
         password = attrs.get("password")
 
-        user = authenticate(username=username, password=password)
+        user = verify_credentials(username, password, self.context.get("request"))
         if user is None:
-            raise serializers.ValidationError("Invalid credentials")
+            raise serializers.ValidationError(self.error_messages["invalid"])
 
-        refresh = RefreshToken.for_user(user)
-        attrs["access_token"] = str(refresh.access_token)
+        attrs["access_token"] = self.get_access_token(user)
         return attrs
+
+    @staticmethod
+    def get_access_token(user: User) -> str:
+        refresh = MyTokenObtainPairSerializer.get_token(user)
+        return str(refresh.access_token)
@@ -0,0 +1,54 @@
+from django.contrib.auth.models import Group, Permission
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save
+from django.dispatch import receiver
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+from UsersApp.blacklist import blacklist_filter
+from UsersApp.models import User
+from UsersApp.permissions import invalidate_permission_catalog, invalidate_permission_snapshots
+
+
+@receiver(m2m_changed, sender=User.user_permissions.through)
+@receiver(m2m_changed, sender=User.groups.through)
+def user_permissions_changed(sender, instance, action: str, reverse: bool, pk_set: set | None, **kwargs) -> None:
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        invalidate_permission_snapshots([instance.pk])
+    elif pk_set is not None:
+        invalidate_permission_snapshots(pk_set)
+    else:
+        # A permission or group was cleared from all of its users, whose ids are no longer known
+        invalidate_permission_snapshots()
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def group_permissions_changed(sender, action: str, **kwargs) -> None:
+    if action in ("post_add", "post_remove", "post_clear"):
+        invalidate_permission_snapshots()
+
+
+@receiver(post_delete, sender=Group)
+@receiver(post_delete, sender=Permission)
+def permission_deleted(sender, **kwargs) -> None:
+    invalidate_permission_snapshots()
+
+
+@receiver(post_save, sender=Permission)
+@receiver(post_delete, sender=Permission)
+@receiver(post_migrate)
+def permission_catalog_changed(sender, **kwargs) -> None:
+    # post_migrate also covers the permissions created by migrate, which are bulk-created without post_save
+    invalidate_permission_catalog()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance: User, **kwargs) -> None:
+    invalidate_permission_snapshots([instance.pk])
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def token_blacklisted(sender, instance: BlacklistedToken, created: bool, **kwargs) -> None:
+    if created:
+        blacklist_filter.add(instance.token.jti, instance.token.expires_at)
@@ -1,11 +1,42 @@
+import gzip
+import hashlib
+import json
+import tempfile
+import threading
+from io import StringIO
+from pathlib import Path
+from unittest.mock import patch
+
 import jwt
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from django.contrib.auth.models import Permission
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import AnonymousUser, Group, Permission
+from django.contrib.auth.signals import user_login_failed
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import AsyncClient, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from jwcrypto import jwk
+from model_bakery.baker import make
 from rest_framework import status
 from rest_framework.reverse import reverse
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.exceptions import TokenError
 from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
 
+from BooksApp.models import Book
+from BooksProject.schema import PrecomputedSpectacularAPIView
+from UsersApp.authentication import ClaimsUser, StatelessJWTAuthentication
+from UsersApp.blacklist import BlacklistFilter, BloomFilter, FilteredRefreshToken
+from UsersApp.helpers import decrypt_jwt, encrypt_jwt
+from UsersApp.login import PasswordVerifier, averify_credentials, verify_credentials
+from UsersApp.models import ThrottleCounter, User
+from UsersApp.permissions import has_cached_perm
+from UsersApp.serializers import PermissionSerializer, UserSerializer
+from UsersApp.throttling import SharedScopedRateThrottle
 from utils import BaseTestCase, Errors
 
 
@@ -26,7 +57,7 @@ class UsersTestCase(BaseTestCase):
     def test_get_users(self):
         response = self.client.get(reverse("users-list"))
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 2)
+        self.assertEqual(len(response.data["results"]), 2)
 
     def test_cannot_create_user_with_administrator_permission_through_the_endpoint(self):
         self.user_data["user_permissions"] = [self.administrator_permission.id, ]
@@ -79,7 +110,7 @@ class JwtTestCase(BaseTestCase):
         auth_header = {"HTTP_AUTHORIZATION": f"Bearer {access_token}"}
         response = self.client.get(reverse("users-list"), **auth_header)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 2)
+        self.assertEqual(len(response.data["results"]), 2)
 
     def test_refresh_token(self):
         """
@@ -106,7 +137,7 @@ class JwtTestCase(BaseTestCase):
         auth_header = {"HTTP_AUTHORIZATION": f"Bearer {new_access_token}"}
         response = self.client.get(reverse("users-list"), **auth_header)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 2)
+        self.assertEqual(len(response.data["results"]), 2)
 
     def test_token_blacklisting_on_expiry(self):
         """
@@ -155,6 +186,173 @@ class JwtTestCase(BaseTestCase):
         self.assertEqual(decoded_refresh_token_payload["username"], self.user.username)
 
 
+class UserDirectoryTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.permissions = list(Permission.objects.filter(codename__in=["view_book", "add_book"]))
+        self.user2.user_permissions.add(self.permissions[0])
+
+    def create_users(self, count: int) -> None:
+        users = User.objects.bulk_create(
+            [User(username=f"reader{i}", email=f"reader{i}@example.com") for i in range(count)]
+        )
+        User.user_permissions.through.objects.bulk_create([
+            User.user_permissions.through(user_id=user.pk, permission_id=permission.pk)
+            for user in users for permission in self.permissions
+        ])
+
+    def test_list_matches_the_serializer(self):
+        self.create_users(3)
+        response = self.client.get(reverse("users-list"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["count"], 5)
+        self.assertEqual(response.data["results"], UserSerializer(User.objects.order_by("id"), many=True).data)
+
+    def test_list_costs_the_same_queries_at_any_size(self):
+        self.create_users(5)
+        # Throttle, count, users and their permission ids
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse("users-list"))
+        self.assertEqual(len(response.data["results"]), 7)
+        User.objects.filter(username__startswith="reader").delete()
+        self.create_users(150)
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse("users-list"), data={"items_per_page": 120})
+        self.assertEqual(len(response.data["results"]), 120)
+        self.assertEqual(response.data["count"], 152)
+
+    def test_list_is_paginated_by_default(self):
+        self.create_users(150)
+        response = self.client.get(reverse("users-list"))
+        self.assertEqual(len(response.data["results"]), 100)
+        self.assertIsNotNone(response.data["next"])
+
+    def test_filter_by_prefix(self):
+        self.create_users(12)
+        response = self.client.get(reverse("users-list"), data={"username": "Reader1"})
+        self.assertEqual([user["username"] for user in response.data["results"]], ["reader1", "reader10", "reader11"])
+        response = self.client.get(reverse("users-list"), data={"email": "user2@"})
+        self.assertEqual([user["id"] for user in response.data["results"]], [self.user2.pk])
+        self.assertEqual(response.data["results"][0]["user_permissions"], [self.permissions[0].pk])
+
+
+class PermissionCatalogTestCase(BaseTestCase):
+    def test_catalog_is_served_from_memory(self):
+        response = self.client.get(reverse("user-permissions"))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, PermissionSerializer(Permission.objects.all(), many=True).data)
+        # Only the throttle's counter update
+        with self.assertNumQueries(1):
+            cached_response = self.client.get(reverse("user-permissions"))
+        self.assertEqual(cached_response.content, response.content)
+        self.assertEqual(cached_response["ETag"], response["ETag"])
+
+    def test_revalidation(self):
+        etag = self.client.get(reverse("user-permissions"))["ETag"]
+        response = self.client.get(reverse("user-permissions"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response["ETag"], etag)
+        response = self.client.get(reverse("user-permissions"), HTTP_IF_NONE_MATCH='"stale"')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_permission_changes_invalidate_the_catalog(self):
+        etag = self.client.get(reverse("user-permissions"))["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            permission = Permission.objects.create(
+                codename="archive_book", name="Can archive book", content_type=Permission.objects.first().content_type
+            )
+        response = self.client.get(reverse("user-permissions"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn({"id": permission.pk, "name": "Can archive book"}, response.data)
+        with self.captureOnCommitCallbacks(execute=True):
+            permission.delete()
+        response = self.client.get(reverse("user-permissions"))
+        self.assertEqual(response["ETag"], etag)
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class UserBulkCreateTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse("users-bulk-create")
+        self.permissions = list(Permission.objects.filter(codename__in=["view_book", "add_book"]).order_by("pk"))
+
+    def _users(self, count: int, start: int = 0) -> list[dict]:
+        return [
+            {"username": f"reader{i}", "email": f"reader{i}@example.com", "password": f"secret{i}",
+             "user_permissions": [permission.pk for permission in self.permissions]}
+            for i in range(start, start + count)
+        ]
+
+    def test_bulk_create(self):
+        response = self.client.post(self.url, data=self._users(20), format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data, {"created": 20})
+        user = User.objects.get(username="reader7")
+        self.assertTrue(user.check_password("secret7"))
+        self.assertEqual(user.email, "reader7@example.com")
+        self.assertEqual(sorted(user.user_permissions.values_list("pk", flat=True)), [p.pk for p in self.permissions])
+        response = self.client.post(self.url, data=[{"username": "nopassword"}], format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertFalse(User.objects.get(username="nopassword").has_usable_password())
+
+    def test_bulk_create_costs_the_same_queries_at_any_size(self):
+        # The first request also looks up the administrator permission, which is then remembered
+        self.client.post(self.url, data=self._users(1), format="json")
+        with CaptureQueriesContext(connection) as small:
+            self.client.post(self.url, data=self._users(5, start=1), format="json")
+        with CaptureQueriesContext(connection) as large:
+            self.client.post(self.url, data=self._users(50, start=6), format="json")
+        self.assertEqual(User.objects.filter(username__startswith="reader").count(), 56)
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+    def test_bulk_create_reports_errors_per_item(self):
+        administrator = Permission.objects.create(
+            codename="administrator", name="Administrator", content_type=self.permissions[0].content_type
+        )
+        users = self._users(6)
+        users[1]["username"] = self.user2.username
+        users[2]["username"] = users[3]["username"] = "twin"
+        users[4]["user_permissions"] = [987654]
+        users[5]["user_permissions"] = [administrator.pk]
+        response = self.client.post(self.url, data=users, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertEqual(response.data[1]["username"], ["A user with that username already exists."])
+        self.assertIn("username", response.data[2])
+        self.assertIn("username", response.data[3])
+        self.assertEqual(response.data[4]["user_permissions"], ['Invalid pk "987654" - object does not exist.'])
+        self.assertEqual(response.data[5]["user_permissions"], Errors.CANNOT_CREATE_A_USER.value)
+        self.assertFalse(User.objects.filter(username__startswith="reader").exists())
+
+    def test_bulk_create_limits(self):
+        response = self.client.post(self.url, data={"username": "reader"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        with self.settings(USERS_BULK_MAX_ITEMS=2):
+            response = self.client.post(self.url, data=self._users(3), format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_provision_users_command(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = Path(directory.name) / "users.csv"
+        path.write_text(
+            "username,email,password,user_permissions\n"
+            f"reader1,reader1@example.com,secret1,{self.permissions[0].pk} {self.permissions[1].pk}\n"
+            f"{self.user2.username},,secret,\n"
+            "reader2,,,\n"
+        )
+        stdout, stderr = StringIO(), StringIO()
+        call_command("provision_users", str(path), "--batch-size", "2", stdout=stdout, stderr=stderr)
+        self.assertIn("Created 2 users", stdout.getvalue())
+        self.assertIn("skipped 1 invalid records", stdout.getvalue())
+        self.assertIn("Record 2:", stderr.getvalue())
+        self.assertTrue(User.objects.get(username="reader1").check_password("secret1"))
+        self.assertEqual(User.objects.get(username="reader1").user_permissions.count(), 2)
+        self.assertFalse(User.objects.get(username="reader2").has_usable_password())
+
+
 class ThrottlingTestCase(BaseTestCase):
     def test_reach_throttling_in_users_list_api(self):
         login_data = {
@@ -177,3 +375,436 @@ class ThrottlingTestCase(BaseTestCase):
                              f"Failed after {i} calls. {response.content}")
         response = self.client.get(reverse("users-list"), **auth_header)
         self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS, response.content)
+
+
+class SharedScopedRateThrottleTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.view = type("View", (), {"throttle_scope": "users_list"})()
+        self.request = APIRequestFactory().get("/")
+        self.request.user = self.user
+        self.now = 6000.0
+
+    def allow(self) -> bool:
+        throttle = SharedScopedRateThrottle()
+        throttle.timer = lambda: self.now
+        self.throttle = throttle
+        return throttle.allow_request(self.request, self.view)
+
+    def test_counts_in_one_row_and_one_query(self):
+        with self.assertNumQueries(1):
+            self.assertTrue(self.allow())
+        for _ in range(19):
+            self.assertTrue(self.allow())
+        self.assertFalse(self.allow())
+        counter = ThrottleCounter.objects.get()
+        self.assertEqual((counter.hits, counter.previous_hits), (20, 0))
+        self.assertEqual(self.throttle.wait(), 60)
+
+    def test_throttled_requests_are_not_counted(self):
+        for _ in range(25):
+            self.allow()
+        self.assertEqual(ThrottleCounter.objects.get().hits, 20)
+
+    def test_previous_window_is_weighted_by_its_overlap(self):
+        for _ in range(20):
+            self.assertTrue(self.allow())
+        # A quarter into the next window, 15 of the previous 20 requests still count
+        self.now += 75
+        for _ in range(5):
+            self.assertTrue(self.allow())
+        self.assertFalse(self.allow())
+        self.assertEqual(self.throttle.wait(), 3)
+        counter = ThrottleCounter.objects.get()
+        self.assertEqual((counter.hits, counter.previous_hits), (5, 20))
+        # Two windows later the old counts are gone
+        self.now += 120
+        self.assertTrue(self.allow())
+        counter.refresh_from_db()
+        self.assertEqual((counter.hits, counter.previous_hits), (1, 0))
+
+    def test_scopes_and_clients_are_counted_separately(self):
+        for _ in range(20):
+            self.allow()
+        self.assertFalse(self.allow())
+        self.request.user = self.user2
+        self.assertTrue(self.allow())
+        self.view.throttle_scope = "books"
+        self.request.user = self.user
+        self.assertTrue(self.allow())
+        self.assertEqual(ThrottleCounter.objects.count(), 3)
+
+    def test_keys_of_long_forwarded_for_headers(self):
+        forwarded_for = ", ".join(f"10.0.{number // 256}.{number % 256}" for number in range(100))
+        self.request = APIRequestFactory().get("/", HTTP_X_FORWARDED_FOR=forwarded_for)
+        self.request.user = AnonymousUser()
+        self.assertTrue(self.allow())
+        self.assertTrue(self.allow())
+        counter = ThrottleCounter.objects.get()
+        self.assertEqual(counter.hits, 2)
+        ident = hashlib.sha256(forwarded_for.replace(" ", "").encode()).hexdigest()
+        self.assertEqual(counter.key, f"throttle_users_list_{ident}")
+
+
+class PermissionSnapshotTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.view_book = Permission.objects.get(codename="view_book")
+
+    def _fresh_user(self) -> User:
+        return User.objects.get(pk=self.user.pk)
+
+    def test_cached_permission_check_does_not_query_the_database(self):
+        self.assertTrue(has_cached_perm(self._fresh_user(), "BooksApp.view_book"))
+        user = self._fresh_user()
+        with self.assertNumQueries(0):
+            self.assertTrue(has_cached_perm(user, "BooksApp.view_book"))
+            self.assertFalse(has_cached_perm(user, "auth.permissionus.administrator"))
+
+    def test_snapshot_is_invalidated_when_user_permissions_change(self):
+        self.assertTrue(has_cached_perm(self._fresh_user(), "BooksApp.view_book"))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.user_permissions.remove(self.view_book)
+        self.assertFalse(has_cached_perm(self._fresh_user(), "BooksApp.view_book"))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.view_book.user_set.add(self.user)
+        self.assertTrue(has_cached_perm(self._fresh_user(), "BooksApp.view_book"))
+
+    def test_snapshot_is_invalidated_when_the_change_commits(self):
+        self.assertTrue(has_cached_perm(self._fresh_user(), "BooksApp.view_book"))
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.user.user_permissions.remove(self.view_book)
+            # Until then, requests may still read the old permissions and cache them
+            self.assertTrue(has_cached_perm(self._fresh_user(), "BooksApp.view_book"))
+        self.assertEqual(len(callbacks), 1)
+        callbacks[0]()
+        self.assertFalse(has_cached_perm(self._fresh_user(), "BooksApp.view_book"))
+
+    def test_snapshot_is_invalidated_when_group_permissions_change(self):
+        group = Group.objects.create(name="readers")
+        self.user2.groups.add(group)
+        self.assertFalse(has_cached_perm(User.objects.get(pk=self.user2.pk), "BooksApp.view_book"))
+        with self.captureOnCommitCallbacks(execute=True):
+            group.permissions.add(self.view_book)
+        self.assertTrue(has_cached_perm(User.objects.get(pk=self.user2.pk), "BooksApp.view_book"))
+        with self.captureOnCommitCallbacks(execute=True):
+            group.permissions.clear()
+        self.assertFalse(has_cached_perm(User.objects.get(pk=self.user2.pk), "BooksApp.view_book"))
+
+    def test_inactive_and_superusers(self):
+        self.user.is_active = False
+        self.assertFalse(has_cached_perm(self.user, "BooksApp.view_book"))
+        self.user2.is_superuser = True
+        self.assertTrue(has_cached_perm(self.user2, "BooksApp.delete_book"))
+
+
+class StatelessJWTAuthenticationTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(None)
+        self.login_data = {"username": self.username, "password": self.password}
+        self.authentication = StatelessJWTAuthentication()
+
+    def _obtain_tokens(self) -> dict:
+        response = self.client.post(reverse("token_obtain_pair"), data=self.login_data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def _authenticate(self, access_token: str):
+        request = APIRequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {access_token}")
+        user, _ = self.authentication.authenticate(request)
+        return user
+
+    def test_authenticates_from_claims_without_queries(self):
+        access_token = self._obtain_tokens()["access"]
+        with self.assertNumQueries(0):
+            user = self._authenticate(access_token)
+            self.assertTrue(user.has_perm("BooksApp.view_book"))
+            self.assertTrue(has_cached_perm(user, "BooksApp.add_book"))
+            self.assertFalse(user.has_perm("auth.permissionus.administrator"))
+        self.assertIsInstance(user, ClaimsUser)
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertEqual(user.username, self.username)
+
+    def test_falls_back_to_database_when_user_changed(self):
+        access_token = self._obtain_tokens()["access"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.user_permissions.remove(Permission.objects.get(codename="view_book"))
+        user = self._authenticate(access_token)
+        self.assertIsInstance(user, User)
+        self.assertFalse(user.has_perm("BooksApp.view_book"))
+
+    def test_refresh_issues_current_claims(self):
+        refresh_token = self._obtain_tokens()["refresh"]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.user_permissions.remove(Permission.objects.get(codename="view_book"))
+        response = self.client.post(reverse("token_refresh"), data={"refresh": refresh_token})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        user = self._authenticate(response.data["access"])
+        self.assertIsInstance(user, ClaimsUser)
+        self.assertFalse(user.has_perm("BooksApp.view_book"))
+        self.assertTrue(user.has_perm("BooksApp.add_book"))
+
+    def test_owner_can_retrieve_book_with_claims_token(self):
+        book = make(Book, user=self.user)
+        access_token = self._obtain_tokens()["access"]
+        response = self.client.get(reverse("books-detail", args=[book.id]), HTTP_AUTHORIZATION=f"Bearer {access_token}")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class BlacklistFilterTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(None)
+        response = self.client.post(reverse("token_obtain_pair"),
+                                    data={"username": self.username, "password": self.password})
+        self.refresh_token = response.data["refresh"]
+
+    def test_bloom_filter(self):
+        bloom_filter = BloomFilter(capacity=1000)
+        items = [f"jti-{i}" for i in range(1000)]
+        for item in items:
+            bloom_filter.add(item)
+        self.assertTrue(all(item in bloom_filter for item in items))
+        false_positives = sum(f"other-{i}" in bloom_filter for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+    def test_check_of_token_that_is_not_blacklisted_skips_the_database(self):
+        FilteredRefreshToken(self.refresh_token)
+        with self.assertNumQueries(0):
+            FilteredRefreshToken(self.refresh_token)
+
+    def test_rotated_token_is_rejected(self):
+        response = self.client.post(reverse("token_refresh"), data={"refresh": self.refresh_token})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.post(reverse("token_refresh"), data={"refresh": self.refresh_token})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response.data["detail"], Errors.TOKEN_IS_BLACKLISTED.value)
+
+    def test_token_blacklisted_by_another_process_is_rejected(self):
+        FilteredRefreshToken(self.refresh_token)
+        # Written without signals, as another worker would; only the shared cache entry announces it
+        token = OutstandingToken.objects.get()
+        BlacklistedToken.objects.bulk_create([BlacklistedToken(token=token)])
+        cache.set(f"{BlacklistFilter.key_prefix}{token.jti}", True)
+        with self.assertRaises(TokenError):
+            FilteredRefreshToken(self.refresh_token)
+
+
+class PrecomputedSchemaTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        PrecomputedSpectacularAPIView.clear()
+        self.addCleanup(PrecomputedSpectacularAPIView.clear)
+        self.url = reverse("schema")
+
+    def test_schema_is_generated_once(self):
+        generator_class = PrecomputedSpectacularAPIView.generator_class
+        with patch.object(generator_class, "get_schema", autospec=True, side_effect=generator_class.get_schema) as mock:
+            first = self.client.get(self.url)
+            second = self.client.get(self.url)
+            json_response = self.client.get(self.url, {"format": "json"})
+        self.assertEqual(mock.call_count, 1)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(first["Content-Type"], "application/vnd.oai.openapi; charset=utf-8")
+        self.assertIn("/books/", json.loads(json_response.content)["paths"])
+
+    def test_etag_and_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response["ETag"]
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b"")
+        response = self.client.get(self.url, {"format": "json"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_gzip(self):
+        plain = self.client.get(self.url)
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        self.assertNotEqual(response["ETag"], plain["ETag"])
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+
+    def test_gzip_refused_or_not_named(self):
+        plain = self.client.get(self.url)
+        for accept_encoding in ("gzip;q=0", "gzip; q=0.0, deflate", "x-gzip-not", "br, *;q=0", "*;q=1, gzip;q=0"):
+            with self.subTest(accept_encoding=accept_encoding):
+                response = self.client.get(self.url, HTTP_ACCEPT_ENCODING=accept_encoding)
+                self.assertFalse(response.has_header("Content-Encoding"))
+                self.assertEqual(response.content, plain.content)
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="deflate;q=1, GZIP;q=0.5")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="*")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+
+    def test_schema_from_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "schema.json"
+            path.write_text(json.dumps({"openapi": "3.0.3", "info": {"title": "From file"}, "paths": {}}))
+            with self.settings(PRECOMPUTED_SCHEMA_FILE=str(path)):
+                response = self.client.get(self.url, {"format": "json"})
+        self.assertEqual(json.loads(response.content)["info"]["title"], "From file")
+
+
+class PasswordVerifierTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.verifier = PasswordVerifier()
+        patcher = patch("UsersApp.login.password_verifier", self.verifier)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.verifier.shutdown)
+        self.login_data = {"username": self.username, "password": self.password}
+
+    def test_login_checks_the_password_in_the_pool(self):
+        response = self.client.post(reverse("token_obtain_pair"), data=self.login_data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.post(reverse("login"), data={**self.login_data, "password": "wrong"})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        response = self.client.post(reverse("login"), data={**self.login_data, "username": "unknown"})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        metrics = self.verifier.metrics()
+        self.assertEqual(metrics["hash_seconds"]["count"], 3)
+        self.assertEqual(metrics["queue_wait_seconds"]["count"], 3)
+        self.assertGreater(metrics["hash_seconds"]["sum"], 0)
+        self.assertEqual((metrics["in_flight"], metrics["rejected"]), (0, 0))
+
+    @override_settings(LOGIN_HASH_WORKERS=1, LOGIN_HASH_QUEUE_SIZE=1)
+    def test_saturated_pool_fails_fast(self):
+        release = threading.Event()
+
+        def slow_check_password(*args, **kwargs):
+            release.wait(10)
+            return False
+
+        with patch("UsersApp.login.check_password", slow_check_password):
+            pending = [self.verifier.submit(self.password, self.user.password) for _ in range(2)]
+            response = self.client.post(reverse("token_obtain_pair"), data=self.login_data)
+            self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+            self.assertEqual(response["Retry-After"], "1")
+            response = self.client.post(reverse("login"), data=self.login_data)
+            self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+            release.set()
+            self.assertEqual([future.result() for future in pending], [(False, False), (False, False)])
+        self.assertEqual(self.verifier.metrics()["rejected"], 2)
+        response = self.client.post(reverse("token_obtain_pair"), data=self.login_data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_outdated_hash_is_upgraded(self):
+        self.user.password = make_password(self.password, hasher="pbkdf2_sha1")
+        self.user.save()
+        self.assertEqual(verify_credentials(self.username, self.password), self.user)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith("pbkdf2_sha256$"))
+
+    def test_inactive_user_cannot_log_in(self):
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertIsNone(verify_credentials(self.username, self.password))
+
+    async def test_async_verification(self):
+        self.assertEqual(await averify_credentials(self.username, self.password), self.user)
+        self.assertIsNone(await averify_credentials(self.username, "wrong"))
+
+    def test_failed_logins_send_user_login_failed(self):
+        failures = []
+
+        def receiver(sender, credentials, request=None, **kwargs):
+            failures.append((credentials, request))
+
+        user_login_failed.connect(receiver)
+        self.addCleanup(user_login_failed.disconnect, receiver)
+        self.client.post(reverse("login"), data={**self.login_data, "password": "wrong"})
+        self.client.post(reverse("token_obtain_pair"), data={**self.login_data, "username": "unknown"})
+        self.client.post(reverse("login"), data=self.login_data)
+        self.assertEqual([credentials for credentials, _ in failures], [{"username": self.username},
+                                                                        {"username": "unknown"}])
+        self.assertTrue(all(request is not None for _, request in failures))
+
+    async def test_async_login(self):
+        url = reverse("async-login")
+        client = AsyncClient(enforce_csrf_checks=True)
+        response = await client.post(url, self.login_data, content_type="application/json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        access_token = response.json()["access_token"]
+        response = await client.get(reverse("users-list"), headers={"authorization": f"Bearer {access_token}"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Rejected like the sync login
+        for data in ({**self.login_data, "password": "wrong"}, {"username": self.username}):
+            response = await client.post(url, data, content_type="application/json")
+            self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+            sync_response = await sync_to_async(self.client.post)(reverse("login"), data, format="json")
+            self.assertEqual(response.json(), sync_response.json())
+        self.assertEqual(self.verifier.metrics()["hash_seconds"]["count"], 3)
+
+
+class JWEAuthenticationTestCase(BaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(None)
+        self.keys = {kid: jwk.JWK.generate(kty="oct", size=256, kid=kid).export(as_dict=True) for kid in ("old", "new")}
+
+    def key_settings(self, key_id: str, *kids: str):
+        return override_settings(SIMPLE_JWT={
+            **settings.SIMPLE_JWT, "JWE_KEY_ID": key_id,
+            "JWE_KEYS": json.dumps({"keys": [self.keys[kid] for kid in kids]}),
+        })
+
+    def obtain(self) -> dict:
+        response = self.client.post(
+            reverse("encrypted_token_obtain_pair"), data={"username": self.username, "password": self.password}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def get_users(self, access_token: str):
+        return self.client.get(reverse("users-list"), HTTP_AUTHORIZATION=f"Bearer {access_token}")
+
+    def test_encrypted_access_token_authenticates(self):
+        access_token = self.obtain()["access"]
+        self.assertEqual(access_token.count("."), 4)
+        with self.assertRaises(jwt.DecodeError):
+            jwt.decode(access_token, options={"verify_signature": False})
+        response = self.get_users(access_token)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsInstance(response.wsgi_request.user, ClaimsUser)
+        self.assertEqual(response.wsgi_request.user.id, self.user.pk)
+
+    def test_signed_tokens_still_authenticate(self):
+        response = self.client.post(
+            reverse("token_obtain_pair"), data={"username": self.username, "password": self.password}
+        )
+        self.assertEqual(self.get_users(response.data["access"]).status_code, status.HTTP_200_OK)
+
+    def test_tampered_token_is_rejected(self):
+        header, key, iv, ciphertext, tag = self.obtain()["access"].split(".")
+        ciphertext = ("A" if ciphertext[0] != "A" else "B") + ciphertext[1:]
+        response = self.get_users(".".join([header, key, iv, ciphertext, tag]))
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_refresh_issues_encrypted_access_token(self):
+        refresh_token = self.obtain()["refresh"]
+        response = self.client.post(reverse("encrypted_token_refresh"), data={"refresh": refresh_token})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["access"].count("."), 4)
+        self.assertEqual(self.get_users(response.data["access"]).status_code, status.HTTP_200_OK)
+
+    def test_key_rotation(self):
+        with self.key_settings("old", "old"):
+            old_token = self.obtain()["access"]
+        with self.key_settings("new", "old", "new"):
+            new_token = self.obtain()["access"]
+            self.assertEqual(decrypt_jwt(new_token)["user_id"], self.user.pk)
+            self.assertEqual(self.get_users(old_token).status_code, status.HTTP_200_OK)
+            self.assertEqual(self.get_users(new_token).status_code, status.HTTP_200_OK)
+        with self.key_settings("new", "new"):
+            self.assertEqual(self.get_users(old_token).status_code, status.HTTP_401_UNAUTHORIZED)
+            self.assertEqual(self.get_users(new_token).status_code, status.HTTP_200_OK)
+
+    def test_keys_are_parsed_once(self):
+        with self.key_settings("new", "old", "new"), patch.object(
+                jwk.JWKSet, "from_json", wraps=jwk.JWKSet.from_json) as from_json:
+            for _ in range(3):
+                decrypt_jwt(encrypt_jwt({"user_id": self.user.pk}))
+        self.assertEqual(from_json.call_count, 1)
@@ -0,0 +1,94 @@
+import hashlib
+import math
+import random
+
+from django.db import connection
+from rest_framework.request import Request
+from rest_framework.throttling import ScopedRateThrottle
+
+from UsersApp.models import ThrottleCounter
+
+
+def _hit_sql() -> str:
+    """
+    Upserts the counter row and counts the hit only if the sliding-window estimate stays within the limit, in one
+    atomic statement. Returns the new counts, or no row when the request is throttled.
+    """
+    quote = connection.ops.quote_name
+    table = quote(ThrottleCounter._meta.db_table)
+    key, window_start, hits, previous_hits = (
+        quote(ThrottleCounter._meta.get_field(name).column) for name in ("key", "window_start", "hits", "previous_hits")
+    )
+    new_hits = f"CASE WHEN {table}.{window_start} = EXCLUDED.{window_start} THEN {table}.{hits} + 1 ELSE 1 END"
+    new_previous_hits = (
+        f"CASE WHEN {table}.{window_start} = EXCLUDED.{window_start} THEN {table}.{previous_hits} "
+        f"WHEN {table}.{window_start} = EXCLUDED.{window_start} - %(duration)s THEN {table}.{hits} ELSE 0 END"
+    )
+    return (
+        f"INSERT INTO {table} ({key}, {window_start}, {hits}, {previous_hits}) "
+        f"VALUES (%(key)s, %(window_start)s, 1, 0) "
+        f"ON CONFLICT ({key}) DO UPDATE SET {previous_hits} = {new_previous_hits}, {hits} = {new_hits}, "
+        f"{window_start} = EXCLUDED.{window_start} "
+        f"WHERE ({new_previous_hits}) * %(weight)s + ({new_hits}) <= %(limit)s "
+        f"RETURNING {hits}, {previous_hits}"
+    )
+
+
+class SharedScopedRateThrottle(ScopedRateThrottle):
+    """
+    ScopedRateThrottle with its counts kept in the database, so the limits hold across worker processes, and with a
+    fixed amount of state per client instead of a list of request timestamps.
+
+    The rate is enforced over a sliding window, approximated from the counts of the current and previous fixed
+    windows: the previous count is weighted by how much of it still overlaps the sliding window. Throttled requests
+    are not counted, like in SimpleRateThrottle.
+    """
+    # Share of requests that also delete the counters of clients that have been idle for two windows
+    prune_probability = 0.001
+
+    def allow_request(self, request: Request, view) -> bool:
+        self.scope = getattr(view, self.scope_attr, None)
+        if not self.scope:
+            return True
+        self.rate = self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.now = self.timer()
+        self.window_start = int(self.now // self.duration * self.duration)
+        self.weight = 1 - (self.now - self.window_start) / self.duration
+        with connection.cursor() as cursor:
+            cursor.execute(_hit_sql(), {
+                "key": self.key, "window_start": self.window_start, "duration": self.duration,
+                "weight": self.weight, "limit": self.num_requests,
+            })
+            allowed = cursor.fetchone() is not None
+        if random.random() < self.prune_probability:
+            ThrottleCounter.objects.filter(
+                key__startswith=self.cache_format % {"scope": self.scope, "ident": ""},
+                window_start__lt=self.window_start - self.duration,
+            ).delete()
+        return allowed
+
+    def get_cache_key(self, request: Request, view) -> str:
+        # The ident is hashed, as for anonymous clients it is the X-Forwarded-For header, of any length
+        ident = request.user.pk if request.user and request.user.is_authenticated else self.get_ident(request)
+        return self.cache_format % {"scope": self.scope, "ident": hashlib.sha256(str(ident).encode()).hexdigest()}
+
+    def wait(self) -> float | None:
+        """Returns the seconds until the sliding-window estimate leaves room for one more request."""
+        counter = ThrottleCounter.objects.filter(key=self.key).first()
+        if counter is None or counter.window_start != self.window_start:
+            return None
+        elapsed = self.now - self.window_start
+        available = self.num_requests - 1 - counter.hits
+        if available < 0 or counter.previous_hits == 0:
+            # Wait for the next window, when the current count starts to decay
+            return self.duration - elapsed
+        # previous_hits * (1 - t / duration) + hits <= num_requests - 1
+        overlap = self.duration * (counter.previous_hits - available) / counter.previous_hits
+        return max(0.0, math.ceil(overlap - elapsed))
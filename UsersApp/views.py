@@ -1,26 +1,57 @@
+import hashlib
+import threading
+
+from django.conf import settings
 from django.contrib.auth.models import Permission
+from django.utils.http import parse_etags
+from django_filters.rest_framework import DjangoFilterBackend
 from drf_spectacular.utils import extend_schema
 from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.mixins import ListModelMixin, CreateModelMixin
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.viewsets import GenericViewSet
-from rest_framework_simplejwt.views import TokenObtainPairView
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
 from BooksApp.models import Book
+from BooksProject.db_router import primary_reads
+from BooksProject.metrics import TimedPermissionsMixin, timed
+from UsersApp.filters import UserFilter, UserPagination
 from UsersApp.models import User
+from UsersApp.permissions import get_permission_catalog_version
+from UsersApp.provisioning import bulk_insert_users, validate_users
+from UsersApp.serializers import EncryptedTokenObtainPairSerializer, EncryptedTokenRefreshSerializer
 from UsersApp.serializers import PermissionSerializer, UserLoginSerializer
-from UsersApp.serializers import UserSerializer, MyTokenObtainPairSerializer
+from UsersApp.serializers import UserBulkCreateResultSerializer, UserBulkCreateSerializer
+from UsersApp.serializers import UserSerializer, MyTokenObtainPairSerializer, serialize_user_rows
 
 
-class UserViewSet(ListModelMixin, CreateModelMixin, GenericViewSet):
+class UserViewSet(TimedPermissionsMixin, ListModelMixin, CreateModelMixin, GenericViewSet):
+    """
+    The user directory, paginated and filterable by username or email prefix. A page costs the same three queries
+    (count, users, permission ids) whatever its size.
+    """
     permission_classes = [IsAuthenticated]
-    queryset = User.objects.all()
+    queryset = User.objects.order_by("id")
     serializer_class = UserSerializer
+    filterset_class = UserFilter
+    filter_backends = (DjangoFilterBackend,)
+    pagination_class = UserPagination
     throttle_scope = "users_list"
 
+    def list(self, request: Request, *args, **kwargs) -> Response:
+        fields = [field for field in UserSerializer.Meta.fields if field != "user_permissions"]
+        rows = self.filter_queryset(self.get_queryset()).values(*fields)
+        page = self.paginate_queryset(rows)
+        with timed("serializer"):
+            data = serialize_user_rows(rows if page is None else page)
+        return Response(data) if page is None else self.get_paginated_response(data)
+
     @extend_schema(
         description="Creates user. Creating a user with administrator permission is not allowed through this endpoint."
     )
@@ -33,26 +64,87 @@ class UserViewSet(ListModelMixin, CreateModelMixin, GenericViewSet):
         """
         return Response(data=[], status=status.HTTP_201_CREATED)
 
+    @extend_schema(
+        request=UserBulkCreateSerializer(many=True),
+        responses={status.HTTP_201_CREATED: UserBulkCreateResultSerializer},
+        description="Creates many users at once, with their permissions. Nothing is created unless every item is "
+                    "valid; errors are reported per item, in the order of the request. Creating users with "
+                    "administrator permission is not allowed through this endpoint.",
+    )
+    @action(detail=False, methods=["post"], url_path="bulk")
+    def bulk_create(self, request: Request) -> Response:
+        items = request.data
+        if not isinstance(items, list):
+            raise ValidationError({"non_field_errors": ["Expected a list of users."]})
+        if len(items) > settings.USERS_BULK_MAX_ITEMS:
+            raise ValidationError(
+                {"non_field_errors": [f"Ensure there are no more than {settings.USERS_BULK_MAX_ITEMS} users."]}
+            )
+        rows, errors = validate_users(items)
+        if any(errors):
+            raise ValidationError(errors)
+        return Response({"created": bulk_insert_users(rows)}, status=status.HTTP_201_CREATED)
+
 
 class MyTokenObtainPairView(TokenObtainPairView):
     serializer_class = MyTokenObtainPairSerializer
 
 
-class UserPermissionsView(ListModelMixin, CreateModelMixin, GenericViewSet):
+class EncryptedTokenObtainPairView(TokenObtainPairView):
+    """Issues a token pair whose access token is encrypted (JWE), so that clients cannot read its claims."""
+    serializer_class = EncryptedTokenObtainPairSerializer
+
+
+class EncryptedTokenRefreshView(TokenRefreshView):
+    """Refreshes a token pair issued by EncryptedTokenObtainPairView."""
+    serializer_class = EncryptedTokenRefreshSerializer
+
+
+class PermissionCatalog:
+    """The serialized list of all permissions at one catalog version, with the ETag of its content."""
+
+    def __init__(self, version: str, data: list[dict]):
+        self.version = version
+        self.data = data
+        self.etag = f'"{hashlib.sha256(JSONRenderer().render(data)).hexdigest()[:32]}"'
+
+
+class UserPermissionsView(TimedPermissionsMixin, ListModelMixin, CreateModelMixin, GenericViewSet):
     """
     This viewset provides an API endpoint to retrieve all available permissions.
     It can be used when creating a user to know the permission IDs before associating them with the user.
+
+    The list only changes when permissions do (mostly at migrate time), so each process serializes it once per
+    catalog version (see `invalidate_permission_catalog()`) and serves it with an ETag; clients revalidating with
+    If-None-Match get a 304.
     """
     permission_classes = [IsAuthenticated]
     queryset = Permission.objects.all()
     serializer_class = PermissionSerializer
     throttle_scope = "permissions_list"
+    _catalog: PermissionCatalog | None = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_catalog(cls) -> PermissionCatalog:
+        version = get_permission_catalog_version()
+        catalog = cls._catalog
+        if catalog is None or catalog.version != version:
+            with cls._lock:
+                catalog = cls._catalog
+                if catalog is None or catalog.version != version:
+                    with primary_reads(), timed("serializer"):
+                        data = list(cls.serializer_class(cls.queryset.all(), many=True).data)
+                    catalog = cls._catalog = PermissionCatalog(version, data)
+        return catalog
 
-    def get(self, request: Request) -> Response:
-        permissions = Permission.objects.all()
-        permission_names = permissions.values_list("name", flat=True)
-        serializer = PermissionSerializer(permission_names, many=True)
-        return Response(serializer.data)
+    def list(self, request: Request, *args, **kwargs) -> Response:
+        catalog = self.get_catalog()
+        headers = {"ETag": catalog.etag, "Cache-Control": "no-cache"}
+        if_none_match = [tag.removeprefix("W/") for tag in parse_etags(request.META.get("HTTP_IF_NONE_MATCH", ""))]
+        if catalog.etag in if_none_match or "*" in if_none_match:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(catalog.data, headers=headers)
 
 
 class UserLoginView(APIView):
@@ -61,7 +153,7 @@ class UserLoginView(APIView):
     throttle_scope = "login_list"
 
     def post(self, request: Request, *args, **kwargs) -> Response:
-        serializer = UserLoginSerializer(data=request.data)
+        serializer = UserLoginSerializer(data=request.data, context={"request": request})
         if serializer.is_valid():
             access_token = serializer.validated_data["access_token"]
             return Response({"access_token": access_token}, status=status.HTTP_200_OK)
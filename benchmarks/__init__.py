@@ -0,0 +1,9 @@
+"""
+Benchmarks for the hot paths of the API. Each module is a script that creates a throwaway test database, seeds it and
+prints a table of timings, e.g.
+
+    python -m benchmarks.list_serialization --sizes 50 500 2000
+
+They use the project settings (DJANGO_SETTINGS_MODULE, BooksProject.settings by default), so they measure the same
+database engine as the application.
+"""
@@ -0,0 +1,135 @@
+"""
+Serves many concurrent, slow clients from one worker process, and compares the sync book list on a threaded WSGI
+worker with the async list view on ASGI. Each client receives its response slowly (--client-delay per response),
+which holds a WSGI thread but only suspends an ASGI task. The applications are called in process, without a server.
+
+Django closes database connections when a response has been sent, so every in-flight ASGI request holds one: keep
+the number of clients below the database's max_connections, or put a connection pooler in front of it.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from benchmarks.utils import print_table, setup_django, test_database
+
+
+def seed(count: int) -> str:
+    """Creates the books and a user allowed to list them, and returns an access token of that user."""
+    from django.contrib.auth.models import Permission
+
+    from BooksApp.models import Book
+    from UsersApp.models import User
+    from UsersApp.serializers import MyTokenObtainPairSerializer
+
+    user = User.objects.create_user(email="benchmark@example.com", username="benchmark", password="benchmark")
+    user.user_permissions.add(Permission.objects.get(codename="view_book"))
+    Book.objects.bulk_create(
+        [Book(title=f"Title {i}", author=f"Author {i % 100}", user=user) for i in range(count)], batch_size=5000
+    )
+    return str(MyTokenObtainPairSerializer.get_token(user).access_token)
+
+
+def run_wsgi(path: str, query: str, token: str, requests: int, threads: int, delay: float) -> list[float]:
+    from django.core.wsgi import get_wsgi_application
+
+    application = get_wsgi_application()
+
+    def request() -> float:
+        started = time.perf_counter()
+        environ = {
+            "REQUEST_METHOD": "GET", "PATH_INFO": path, "QUERY_STRING": query, "SERVER_NAME": "benchmark",
+            "SERVER_PORT": "80", "wsgi.url_scheme": "http", "wsgi.input": BytesIO(), "wsgi.errors": BytesIO(),
+            "HTTP_AUTHORIZATION": f"Bearer {token}", "HTTP_ACCEPT": "application/json",
+        }
+        response = application(environ, lambda status, headers: None)
+        for _ in response:
+            # The worker thread writes to a slow client
+            time.sleep(delay)
+        response.close()
+        return time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        return list(executor.map(lambda _: request(), range(requests)))
+
+
+def run_asgi(path: str, query: str, token: str, requests: int, concurrency: int, delay: float) -> list[float]:
+    from django.core.asgi import get_asgi_application
+
+    application = get_asgi_application()
+
+    async def request() -> float:
+        started = time.perf_counter()
+        scope = {
+            "type": "http", "method": "GET", "path": path, "query_string": query.encode(), "scheme": "http",
+            "server": ("benchmark", 80), "headers": [(b"authorization", f"Bearer {token}".encode()),
+                                                    (b"accept", b"application/json")],
+        }
+
+        async def receive() -> dict:
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message: dict) -> None:
+            if message["type"] == "http.response.body":
+                # The event loop serves other clients while this one is slow
+                await asyncio.sleep(delay)
+
+        await application(scope, receive, send)
+        return time.perf_counter() - started
+
+    async def main() -> list[float]:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def limited() -> float:
+            async with semaphore:
+                return await request()
+
+        return await asyncio.gather(*[limited() for _ in range(requests)])
+
+    return asyncio.run(main())
+
+
+def run(token: str, concurrencies: list[int], requests: int, threads: int, delay: float) -> None:
+    query = "items_per_page=50"
+    results = []
+    for concurrency in concurrencies:
+        for name, function, path, workers in (
+            (f"wsgi, {threads} threads", run_wsgi, "/books/", threads),
+            ("asgi, sync view", run_asgi, "/books/", concurrency),
+            ("asgi, async view", run_asgi, "/async/books/", concurrency),
+        ):
+            started = time.perf_counter()
+            latencies = sorted(function(path, query, token, requests, workers, delay))
+            elapsed = time.perf_counter() - started
+            results.append([
+                concurrency, name, requests / elapsed, statistics.median(latencies) * 1000,
+                latencies[int(len(latencies) * 0.95) - 1] * 1000,
+            ])
+    print_table(["clients", "worker", "requests/s", "p50 ms", "p95 ms"], results)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[10, 50])
+    parser.add_argument("--requests", type=int, default=400, help="Requests per run.")
+    parser.add_argument("--threads", type=int, default=4, help="Threads of the WSGI worker.")
+    parser.add_argument("--client-delay", type=float, default=0.5, help="Seconds each client takes to receive.")
+    parser.add_argument("--books", type=int, default=2000, help="Number of books to seed.")
+    args = parser.parse_args()
+
+    setup_django()
+    from django.test.utils import override_settings
+
+    from BooksApp.views import BookViewSet
+
+    # Measure the views rather than the throttle and the list response cache
+    BookViewSet.throttle_classes = []
+    with test_database(), override_settings(BOOKS_LIST_CACHE_TIMEOUT=0, ALLOWED_HOSTS=["*"]):
+        token = seed(args.books)
+        run(token, args.concurrency, args.requests, args.threads, args.client_delay)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Measures encrypted (JWE) token operations per second: with the parsed key set cached per process, as in
+UsersApp.helpers, and with the key parsed from its JSON on every call, as before. Signed (JWS) access tokens are
+included for reference. No database is needed.
+"""
+import argparse
+import json
+
+from benchmarks.utils import measure, print_table, setup_django
+
+
+def run(number: int, repeat: int) -> None:
+    from django.conf import settings
+    from jwcrypto import jwe, jwk
+    from jwcrypto.common import json_encode
+    from rest_framework_simplejwt.state import token_backend
+
+    from UsersApp.helpers import decrypt_jwt, encrypt_jwt
+
+    payload = {
+        "token_type": "access", "exp": 4102444800, "iat": 1700000000, "jti": "0" * 32, "user_id": 1, "ver": "0" * 32,
+        "username": "benchmark", "is_staff": False, "is_superuser": False,
+        "perms": ["BooksApp.add_book", "BooksApp.change_book", "BooksApp.delete_book", "BooksApp.view_book"],
+    }
+    keys_json = json.dumps({"keys": [jwk.JWK.generate(kty="oct", size=256, kid="benchmark").export(as_dict=True)]})
+    settings.SIMPLE_JWT = {**settings.SIMPLE_JWT, "JWE_KEYS": keys_json, "JWE_KEY_ID": "benchmark"}
+    algorithm, encryption = settings.SIMPLE_JWT["JWE_ALGORITHM"], settings.SIMPLE_JWT["JWE_ENCRYPTION"]
+    header = json_encode({"alg": algorithm, "enc": encryption, "kid": "benchmark"})
+
+    def encrypt_parsing_key() -> str:
+        key = jwk.JWKSet.from_json(keys_json).get_key("benchmark")
+        token = jwe.JWE(json.dumps(payload), protected=header)
+        token.add_recipient(key)
+        return token.serialize(compact=True)
+
+    def decrypt_parsing_key() -> dict:
+        token = jwe.JWE(algs=[algorithm, encryption])
+        token.deserialize(encrypted, key=jwk.JWKSet.from_json(keys_json))
+        return json.loads(token.payload)
+
+    encrypted = encrypt_jwt(payload)
+    signed = token_backend.encode(payload)
+    results = []
+    for name, function in (
+        ("jwe encrypt, cached keys", lambda: encrypt_jwt(payload)),
+        ("jwe decrypt, cached keys", lambda: decrypt_jwt(encrypted)),
+        ("jwe encrypt, key parsed per call", encrypt_parsing_key),
+        ("jwe decrypt, key parsed per call", decrypt_parsing_key),
+        ("jws sign", lambda: token_backend.encode(payload)),
+        ("jws verify", lambda: token_backend.decode(signed)),
+    ):
+        milliseconds = measure(function, repeat=repeat, number=number)
+        results.append([name, milliseconds * 1000, 1000 / milliseconds])
+    print_table(["operation", "us/op", "ops/s"], results)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=2000, help="Operations per run.")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    run(args.number, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
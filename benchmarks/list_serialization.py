@@ -0,0 +1,62 @@
+"""
+Compares the book list serialization through BookListSerializer (model instances, field by field) with the
+`.values()` read path used by BookViewSet.list, at several page sizes. Both include the query and JSON rendering.
+"""
+import argparse
+from datetime import date, timedelta
+
+from benchmarks.utils import measure, print_table, setup_django, test_database
+
+
+def seed(count: int) -> None:
+    from BooksApp.models import Book
+    from UsersApp.models import User
+
+    user = User.objects.create_user(email="benchmark@example.com", username="benchmark", password="benchmark")
+    Book.objects.bulk_create(
+        [Book(title=f"Title {i}", author=f"Author {i % 100}", publication_date=date(2000, 1, 1) + timedelta(days=i),
+              user=user) for i in range(count)],
+        batch_size=5000,
+    )
+
+
+def run(sizes: list[int], repeat: int) -> None:
+    from rest_framework.renderers import JSONRenderer
+
+    from BooksApp.models import Book
+    from BooksApp.serializers import BookListSerializer, serialize_book_rows
+
+    renderer = JSONRenderer()
+    queryset = Book.objects.order_by("-publication_date", "-id")
+    fields = BookListSerializer.Meta.fields
+
+    results = []
+    for size in sizes:
+        def serializer_path():
+            return renderer.render(BookListSerializer(queryset[:size], many=True).data)
+
+        def values_path():
+            return renderer.render(serialize_book_rows(queryset.values(*fields)[:size]))
+
+        if serializer_path() != values_path():
+            raise AssertionError(f"Outputs differ for page size {size}")
+        serializer_time, values_time = measure(serializer_path, repeat), measure(values_path, repeat)
+        results.append([size, serializer_time, values_time, serializer_time / values_time])
+    print_table(["page size", "serializer ms", "values ms", "speedup"], results)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 500, 2000])
+    parser.add_argument("--books", type=int, default=10000, help="Number of books to seed.")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    with test_database():
+        seed(args.books)
+        run(args.sizes, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""
+Measures the query paths of books and users at several table sizes: the first page of the list, the BookFilter and
+UserFilter filters, ordering, retrieving one row and creating one. The tables are seeded with model_bakery up to each
+size in turn, in a fresh test database. Results are written as JSON; pass the file of an earlier commit to --compare
+to print the change of every timing.
+
+Lists are read like the list views do (`.values()` rows, one page of 100 by page number, serialized), without the
+HTTP layer, the list cache or throttling.
+
+Runs against the configured database: a local PostgreSQL (DATABASE_HOST=localhost DATABASE_PORT=5433 with
+docker-compose) or SQLite (DATABASE_ENGINE=sqlite). Seeding 10 million rows takes a while on either.
+"""
+import argparse
+import json
+import subprocess
+from datetime import date, datetime, timedelta, timezone
+from itertools import count, islice
+from pathlib import Path
+
+from benchmarks.utils import measure, print_table, setup_django, test_database
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+PAGE_SIZE = 100
+SEED_BATCH_SIZE = 10000
+# Book titles start with one of these words, so that a title filter matches a known share of the rows
+TITLE_WORDS = ["Winter", "Summer", "River", "Garden", "Shadow", "Letters", "Island", "Mountain", "Silence", "Harbor"]
+FIRST_DATE = date(1900, 1, 1)
+DATE_SPAN_DAYS = 125 * 365
+
+
+def seed(books: int, users: int) -> None:
+    """Adds books and users up to the given counts; titles, dates and usernames follow the row number."""
+    from django.db import connection
+    from model_bakery import baker
+
+    from BooksApp.models import Book
+    from UsersApp.models import User
+
+    existing = User.objects.count()
+    numbers = count(existing)
+    for batch_size in _batches(users - existing):
+        names = [f"user{next(numbers):08d}" for _ in range(batch_size)]
+        User.objects.bulk_create(baker.prepare(
+            User, _quantity=batch_size, username=iter(names), email=(f"{name}@example.com" for name in names),
+        ))
+
+    owners = list(User.objects.order_by("pk").values_list("pk", flat=True)[:1000])
+    existing = Book.objects.count()
+    numbers = count(existing)
+    for batch_size in _batches(books - existing):
+        rows = list(islice(numbers, batch_size))
+        Book.objects.bulk_create(baker.prepare(
+            Book, _quantity=batch_size, _save_related=False,
+            title=(f"{TITLE_WORDS[row % len(TITLE_WORDS)]} {row}" for row in rows),
+            publication_date=(FIRST_DATE + timedelta(days=row * 7919 % DATE_SPAN_DAYS) for row in rows),
+            user_id=(owners[row % len(owners)] for row in rows),
+        ))
+
+    # Fresh planner statistics, as autovacuum would gather after a bulk load
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
+
+
+def _batches(total: int):
+    while total > 0:
+        yield min(total, SEED_BATCH_SIZE)
+        total -= SEED_BATCH_SIZE
+
+
+def get_operations() -> dict:
+    """Returns the measured operations by name; each one runs its queries and serializes the result."""
+    from django.core.paginator import Paginator
+    from django.db.models import Max
+
+    from BooksApp.filters import BookFilter
+    from BooksApp.models import Book
+    from BooksApp.serializers import BookListSerializer, BookSerializer, serialize_book_rows
+    from UsersApp.filters import UserFilter
+    from UsersApp.models import User
+    from UsersApp.serializers import UserSerializer, serialize_user_rows
+
+    book_fields = BookListSerializer.Meta.fields
+    user_fields = [field for field in UserSerializer.Meta.fields if field != "user_permissions"]
+    # Rows spread over the table rather than neighbours, which would be served from the same pages
+    last_book, last_user = Book.objects.aggregate(Max("pk"))["pk__max"], User.objects.aggregate(Max("pk"))["pk__max"]
+    book_ids = (row * 7919 % last_book + 1 for row in count())
+    user_ids = (row * 7919 % last_user + 1 for row in count())
+    # Past every number used by earlier sizes, as the table grows by at least as many rows as were created
+    new_rows = count(User.objects.count())
+    owner = User.objects.order_by("pk").first()
+
+    def book_page(params: dict, ordering: list[str] = None) -> list[dict]:
+        queryset = BookFilter(params, queryset=Book.objects.all()).qs
+        if ordering:
+            queryset = queryset.order_by(*ordering)
+        return serialize_book_rows(Paginator(queryset.values(*book_fields), PAGE_SIZE).page(1))
+
+    def user_page(params: dict) -> list[dict]:
+        queryset = UserFilter(params, queryset=User.objects.order_by("id")).qs
+        return serialize_user_rows(Paginator(queryset.values(*user_fields), PAGE_SIZE).page(1))
+
+    def create_book() -> int:
+        number = next(new_rows)
+        serializer = BookSerializer(data={
+            "title": f"New book {number}", "author": "Benchmark", "publication_date": "2020-01-01", "user": owner.pk,
+        })
+        serializer.is_valid(raise_exception=True)
+        return serializer.save().pk
+
+    def create_user() -> int:
+        number = next(new_rows)
+        serializer = UserSerializer(data={"username": f"new{number}", "email": f"new{number}@example.com"})
+        serializer.is_valid(raise_exception=True)
+        return serializer.save().pk
+
+    return {
+        "books.list": lambda: book_page({}),
+        "books.filter_dates": lambda: book_page({"date_from": "1990-01-01", "date_to": "1990-12-31"}),
+        "books.filter_title": lambda: book_page({"title": "harbor"}),
+        "books.order_by_title": lambda: book_page({}, ["title", "id"]),
+        "books.order_by_date": lambda: book_page({}, ["publication_date", "id"]),
+        "books.retrieve": lambda: BookSerializer(Book.objects.get(pk=next(book_ids))).data,
+        "books.create": create_book,
+        "users.list": lambda: user_page({}),
+        "users.filter_username": lambda: user_page({"username": "USER0000"}),
+        "users.filter_email": lambda: user_page({"email": "user00001"}),
+        "users.retrieve": lambda: UserSerializer(User.objects.get(pk=next(user_ids))).data,
+        "users.create": create_user,
+    }
+
+
+def run(sizes: list[int], users_ratio: float, number: int, repeat: int) -> list[dict]:
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    results = []
+    for size in sorted(sizes):
+        seed(books=size, users=max(int(size * users_ratio), 1))
+        for name, function in get_operations().items():
+            with CaptureQueriesContext(connection) as context:
+                function()
+            results.append({
+                "size": size,
+                "operation": name,
+                "ms": measure(function, repeat=repeat, number=number),
+                "queries": len(context.captured_queries),
+            })
+    return results
+
+
+def get_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True, cwd=RESULTS_DIR.parent
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results: list[dict], baseline: list[dict] | None) -> None:
+    headers = ["rows", "operation", "ms", "queries"]
+    previous = {}
+    if baseline is not None:
+        headers += ["baseline ms", "change"]
+        previous = {(result["size"], result["operation"]): result["ms"] for result in baseline}
+    rows = []
+    for result in results:
+        row = [result["size"], result["operation"], result["ms"], result["queries"]]
+        if baseline is not None:
+            before = previous.get((result["size"], result["operation"]))
+            row += ["-", "-"] if before is None else [before, f"{(result['ms'] / before - 1) * 100:+.1f}%"]
+        rows.append(row)
+    print_table(headers, rows)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000],
+                        help="Numbers of books, e.g. 10000 1000000 10000000.")
+    parser.add_argument("--users-ratio", type=float, default=1.0, help="Users seeded per book.")
+    parser.add_argument("--number", type=int, default=20, help="Calls per run.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", type=Path, help="Defaults to benchmarks/results/orm-<commit>.json.")
+    parser.add_argument("--compare", type=Path, help="Results of an earlier run to compare with.")
+    args = parser.parse_args()
+
+    baseline = json.loads(args.compare.read_text())["results"] if args.compare else None
+    setup_django()
+    from django.db import connection
+
+    with test_database():
+        vendor = connection.vendor
+        results = run(args.sizes, args.users_ratio, args.number, args.repeat)
+
+    commit = get_commit()
+    output = args.output or RESULTS_DIR / f"orm-{(commit or 'unknown')[:12]}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps({
+        "commit": commit,
+        "database": vendor,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "number": args.number,
+        "repeat": args.repeat,
+        "results": results,
+    }, indent=2) + "\n")
+    print_results(results, baseline)
+    print(f"\nResults written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+import os
+import timeit
+from contextlib import contextmanager
+
+
+def setup_django() -> None:
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "BooksProject.settings")
+    import django
+
+    django.setup()
+
+
+@contextmanager
+def test_database():
+    """Runs the block against a freshly migrated test database, which is destroyed afterwards."""
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    old_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def measure(function, repeat: int = 5, number: int = 1) -> float:
+    """Returns the best time of `repeat` runs of `function`, in milliseconds per call."""
+    return min(timeit.repeat(function, repeat=repeat, number=number)) / number * 1000
+
+
+def print_table(headers: list[str], rows: list[list]) -> None:
+    rows = [[f"{value:.2f}" if isinstance(value, float) else str(value) for value in row] for row in rows]
+    widths = [max(len(str(cell)) for cell in column) for column in zip(headers, *rows)]
+    for row in [headers, ["-" * width for width in widths], *rows]:
+        print("  ".join(str(cell).rjust(width) for cell, width in zip(row, widths)))
@@ -1,4 +1,5 @@
 from django.contrib.auth.models import Permission
+from django.core.cache import cache
 from django.test import TestCase
 from rest_framework.test import APIClient
 
@@ -8,6 +9,8 @@ from UsersApp.models import User
 
 class BaseTestCase(TestCase):
     def setUp(self):
+        # Throttling history and cached lookups must not leak between tests
+        cache.clear()
         self.client = APIClient()
         self.email = "admin@admin.com"
         self.username = "testusername"